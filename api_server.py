@@ -0,0 +1,270 @@
+"""
+无界面的 JSON HTTP 接口。
+
+不加载 Gradio，启动快、单次调用开销小，适合由其他服务调用：
+    python api_server.py --port 8081
+
+接口（POST，返回 JSON）：
+    /nai_to_sd, /sd_to_nai               {"prompt": "..."} 或纯文本请求体 → {"result": "..."}
+    /nai_to_sd/batch, /sd_to_nai/batch   {"prompts": ["...", ...]} → {"results": ["...", ...]}
+    /metadata                            图片文件作为请求体，或 multipart/form-data 上传 → 元数据
+    /metadata/batch                      multipart/form-data 上传多张图片 → {"results": [{"filename": ..., "metadata": ...}]}
+GET /health 用于存活检查，启用耗时统计时 GET /metrics 返回 Prometheus 格式的统计。
+
+请求体支持 Content-Length 与 chunked 传输编码，连接默认保持（HTTP/1.1 keep-alive）。
+"""
+import argparse
+import json
+import sys
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+import metrics
+from config import Config
+from prompt_converter import PromptConverter
+from metadata_extractor import MetadataExtractor
+from image_processor import ImageProcessor
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+_READ_SIZE = 64 * 1024
+# multipart 中未带文件名时也视为上传文件的字段名
+_FILE_FIELDS = ('file', 'files', 'image', 'images')
+
+
+class ApiError(Exception):
+    """
+    以指定 HTTP 状态码返回给客户端的错误
+    """
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _multipart_files(content_type: str, body: bytes) -> list:
+    """
+    解析 multipart/form-data 请求体，返回上传的 [(文件名, 内容), ...]
+    """
+    # email 包导入较慢，只在收到 multipart 请求时导入
+    from email import policy
+    from email.parser import BytesParser
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode('latin1') + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise ApiError(HTTPStatus.BAD_REQUEST, "multipart 请求体格式无效")
+    files = []
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        filename = part.get_filename()
+        if filename is None and name not in _FILE_FIELDS:
+            continue
+        files.append((filename or name, part.get_payload(decode=True) or b''))
+    return files
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    处理单个连接上的请求；每个连接由 ThreadingHTTPServer 的独立线程处理
+    """
+    protocol_version = "HTTP/1.1"
+    server_version = "SDPromptTools"
+
+    def log_message(self, format: str, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+    def do_GET(self):
+        self._body_consumed = not self._has_body()
+        path = self.path.split('?', 1)[0]
+        if path == "/health":
+            self._send_json(HTTPStatus.OK, {"status": "ok"})
+        elif path == "/metrics" and Config.METRICS_ENABLED:
+            self._send(HTTPStatus.OK, metrics.render_prometheus().encode('utf-8'), "text/plain; version=0.0.4")
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "接口不存在"})
+
+    def do_POST(self):
+        self._body_consumed = not self._has_body()
+        route = _ROUTES.get(self.path.split('?', 1)[0])
+        try:
+            if route is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "接口不存在")
+            self._send_json(HTTPStatus.OK, route(self))
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            logger.exception("接口请求处理失败")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"处理失败: {str(e)}"})
+
+    def _has_body(self) -> bool:
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return True
+        return self.headers.get('Content-Length', '0').strip() not in ('', '0')
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str):
+        """
+        发送响应；请求体没有读完时（例如超过大小限制）关闭连接，避免残留数据被当作下一个请求
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if not self._body_consumed:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, "application/json; charset=utf-8")
+
+    def body_chunks(self, limit: int) -> Iterator[bytes]:
+        """
+        逐块读取请求体（Content-Length 或 chunked 传输编码），总大小超过 limit 时返回 413
+        """
+        total = 0
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            while True:
+                try:
+                    size = int(self.rfile.readline(1024).split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "chunked 请求体格式无效")
+                if size == 0:
+                    # 跳过可能存在的 trailer
+                    while self.rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                total += size
+                if total > limit:
+                    raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"请求体超过 {limit} 字节")
+                yield from self._read_exact(size)
+                self.rfile.readline(1024)
+        else:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length 无效")
+            if length > limit:
+                raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"请求体超过 {limit} 字节")
+            yield from self._read_exact(length)
+        self._body_consumed = True
+
+    def _read_exact(self, size: int) -> Iterator[bytes]:
+        while size > 0:
+            data = self.rfile.read(min(size, _READ_SIZE))
+            if not data:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "请求体不完整")
+            size -= len(data)
+            yield data
+
+    def read_body(self, limit: int) -> bytes:
+        return b''.join(self.body_chunks(limit))
+
+    def read_json(self, limit: int = Config.API_MAX_BODY_SIZE):
+        """
+        读取 JSON 请求体；Content-Type 不是 JSON 时返回 UTF-8 文本
+        """
+        body = self.read_body(limit)
+        if not self.headers.get('Content-Type', '').lower().startswith('application/json'):
+            return body.decode('utf-8', 'replace')
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"JSON 格式无效: {e}")
+
+    def content_type(self) -> str:
+        return self.headers.get('Content-Type', '')
+
+
+def _convert_route(direction: str):
+    convert = metrics.request_handler("api_" + direction)(getattr(PromptConverter, direction))
+
+    def handler(request: ApiRequestHandler) -> dict:
+        payload = request.read_json()
+        prompt = payload.get("prompt") if isinstance(payload, dict) else payload
+        if not isinstance(prompt, str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, '缺少字符串字段 "prompt"')
+        return {"result": convert(prompt)}
+    return handler
+
+
+def _convert_batch_route(direction: str):
+    def convert_batch(prompts: list) -> list:
+        return list(PromptConverter.convert_many(prompts, direction, workers=1))
+    convert_batch = metrics.request_handler(f"api_{direction}_batch")(convert_batch)
+
+    def handler(request: ApiRequestHandler) -> dict:
+        payload = request.read_json()
+        prompts = payload.get("prompts") if isinstance(payload, dict) else None
+        if not isinstance(prompts, list) or not all(isinstance(prompt, str) for prompt in prompts):
+            raise ApiError(HTTPStatus.BAD_REQUEST, '缺少字符串数组字段 "prompts"')
+        return {"results": convert_batch(prompts)}
+    return handler
+
+
+@metrics.request_handler("api_metadata")
+def _metadata_route(request: ApiRequestHandler) -> dict:
+    content_type = request.content_type()
+    if content_type.lower().startswith('multipart/'):
+        files = _multipart_files(content_type, request.read_body(Config.MAX_IMAGE_SIZE))
+        if not files:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "没有上传文件")
+        return MetadataExtractor.extract_metadata_dict(memoryview(files[0][1]))
+    # 直接上传的文件边读边写入缓冲区（较小时只在内存中）
+    with ImageProcessor.spool(request.body_chunks(Config.MAX_IMAGE_SIZE)) as f:
+        return MetadataExtractor.extract_metadata_dict(f)
+
+
+@metrics.request_handler("api_metadata_batch")
+def _metadata_batch_route(request: ApiRequestHandler) -> dict:
+    content_type = request.content_type()
+    if not content_type.lower().startswith('multipart/'):
+        raise ApiError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "请使用 multipart/form-data 上传图片")
+    files = _multipart_files(content_type, request.read_body(Config.API_MAX_BODY_SIZE))
+    results = []
+    for filename, data in files:
+        if len(data) > Config.MAX_IMAGE_SIZE:
+            metadata = {"error": f"文件超过 {Config.MAX_IMAGE_SIZE} 字节"}
+        else:
+            metadata = MetadataExtractor.extract_metadata_dict(memoryview(data))
+        results.append({"filename": filename, "metadata": metadata})
+    return {"results": results}
+
+
+_ROUTES = {
+    "/nai_to_sd": _convert_route("nai_to_sd"),
+    "/sd_to_nai": _convert_route("sd_to_nai"),
+    "/nai_to_sd/batch": _convert_batch_route("nai_to_sd"),
+    "/sd_to_nai/batch": _convert_batch_route("sd_to_nai"),
+    "/metadata": _metadata_route,
+    "/metadata/batch": _metadata_batch_route,
+}
+
+
+def create_server(host: str = Config.API_HOST, port: int = Config.API_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ApiRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="SD提示词工具集 HTTP 接口（不加载界面）")
+    parser.add_argument("--host", default=Config.API_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=Config.API_PORT, help="监听端口")
+    args = parser.parse_args(argv)
+
+    # 启动时加载艺术家索引，避免第一个请求承担加载耗时
+    PromptConverter._ensure_artist_index()
+    server = create_server(args.host, args.port)
+    logger.info("HTTP 接口已启动: http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
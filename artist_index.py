@@ -0,0 +1,558 @@
+"""
+艺术家 trigger 索引。
+
+trigger 与别名在构建索引时统一归一化（见 normalize_artist），查询时对 tag 做同样的处理，
+因此 "artist_name"、"Artist Name"、"name_\\(group\\)" 等写法都能匹配到同一个 trigger。
+可选的模糊匹配基于删除邻域：预先为每个 key 生成删除至多 D 个字符后的所有变体，
+查询时只需查找 tag 的删除变体，再用编辑距离确认候选，不必遍历整个列表。
+
+CSV（danbooru_art.csv）可以预先编译为二进制文件，加载时直接内存映射，无需解析 CSV：
+    python -m artist_index build danbooru_art.csv -o danbooru_art.bin
+    python -m artist_index build danbooru_art.csv -o danbooru_art.bin --fuzzy-distance 1
+
+二进制格式（小端序，版本 2）：
+    文件头     magic "SDAI"、格式版本、key 数量、槽位数量、trigger 数量、模糊匹配距离 D、
+               删除变体表条目数、保留字段、源 CSV 的大小与修改时间（纳秒）
+    变体表     fuzzy_count 个 uint64，高 32 位为删除变体的 crc32，低 32 位为 key 序号，按数值排序
+    槽位表     slot_count 个 uint32，开放寻址哈希表（crc32，线性探测），值为 key 序号 + 1，0 表示空
+    key 偏移   key_count + 1 个 uint32，第 i 个 key 位于 key 数据区的 [offsets[i], offsets[i+1])
+    key 指向   key_count 个 uint32，key 对应的 trigger 序号
+    trigger 偏移  trigger_count + 1 个 uint32
+    key 数据区     按字典序排列的归一化 key（trigger 与别名，UTF-8）
+    trigger 数据区 按字典序排列的 trigger 原文（UTF-8）
+"""
+import argparse
+import csv
+import itertools
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import Set
+from typing import Optional
+from config import Config
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+# 每次构建新索引时递增，用于标识索引版本（重新加载后版本号变化）
+_versions = itertools.count(1)
+
+# 已是归一化形式的常见 tag（ASCII 小写、单个空格分隔，"(" 只出现在词首），无需再做 Unicode 处理
+_SIMPLE_KEY = re.compile(r"\(?[a-z0-9:.'!?&+\-)]+(?: \(?[a-z0-9:.'!?&+\-)]+)*")
+_ESCAPED = re.compile(r"\\+([()\[\]{}])")
+_SPACE_RUN = re.compile(r"[\s_]+")
+_PAREN_GAP = re.compile(r"(?<=[^\s(])\(")
+# CSV 中别名列的列名与分隔符
+_ALIAS_COLUMNS = ('aliases', 'alias')
+_ALIAS_SEPARATOR = re.compile(r"[|,]")
+
+
+def normalize_artist(text: str) -> str:
+    """
+    艺术家名称的归一化形式，构建索引与查询时使用同一流程：
+    先转为小写，再做 NFKC 与 casefold，去掉括号前的反斜杠转义，下划线与连续空白视为一个空格，
+    紧贴名称的 "(" 前补一个空格（"name(group)" 与 "name_(group)" 相同）。
+    只有大小写不同的两个名称归一化后一定相同，原先按小写能匹配的 tag 仍然能匹配。
+    """
+    text = text.lower()
+    if _SIMPLE_KEY.fullmatch(text):
+        return text
+    # ASCII 文本经 NFKC 与 casefold 后不变
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', unicodedata.normalize('NFKC', text).casefold())
+    if '\\' in text:
+        text = _ESCAPED.sub(r"\1", text)
+    text = _SPACE_RUN.sub(' ', text).strip()
+    return _PAREN_GAP.sub(' (', text)
+
+
+def read_artist_table(path: str) -> dict:
+    """
+    从 CSV 文件中读取艺术家 trigger 与别名，返回 {trigger: (别名, ...)}。
+    文件要求有一列 "trigger"，可选的 "aliases" / "alias" 列中多个别名以 "|" 或 "," 分隔。
+
+    如果 CSV 文件只有一行数据（没有表头）或只有 header 一行，
+    则会尝试将这一行内容作为 trigger 进行加载。
+    """
+    table = {}
+    with open(path, "r", encoding="utf-8", newline="") as csvfile:
+        # 读取前 1024 个字节用于判断是否有表头
+        sample = csvfile.read(1024)
+        csvfile.seek(0)
+        sniffer = csv.Sniffer()
+        has_header = sniffer.has_header(sample)
+        if has_header:
+            reader = csv.reader(csvfile)
+            fieldnames = next(reader, None) or []
+            trigger_column = fieldnames.index("trigger") if "trigger" in fieldnames else -1
+            alias_column = next((i for i, name in enumerate(fieldnames) if name.lower() in _ALIAS_COLUMNS), -1)
+            # 正常情况：根据 "trigger" 列获取所有数据行的内容（按列号读取，比 DictReader 快）
+            if trigger_column >= 0:
+                for row in reader:
+                    if len(row) <= trigger_column:
+                        continue
+                    trigger = row[trigger_column].strip()
+                    if not trigger:
+                        continue
+                    aliases = table.setdefault(trigger, ())
+                    if 0 <= alias_column < len(row) and row[alias_column]:
+                        names = (name.strip() for name in _ALIAS_SEPARATOR.split(row[alias_column]))
+                        table[trigger] = aliases + tuple(name for name in names if name)
+            # 如果没有读取到数据，但 fieldnames 存在，可能 CSV 文件仅有一行，
+            # 如果唯一的 fieldnames 不是 "trigger"，则认为该字段名就是 trigger 数据
+            if not table and fieldnames:
+                if len(fieldnames) == 1 and fieldnames[0].lower() != "trigger":
+                    table = {fieldnames[0].strip(): ()}
+        else:
+            # CSV 没有表头，使用 csv.reader 直接读取第一列作为 trigger
+            reader = csv.reader(csvfile)
+            table = {row[0].strip(): () for row in reader if row and row[0].strip()}
+    return table
+
+
+def read_artist_csv(path: str) -> set:
+    """
+    从 CSV 文件中读取艺术家 trigger 集合（不含别名），格式见 read_artist_table
+    """
+    return set(read_artist_table(path))
+
+
+def _build_keys(table: dict) -> dict:
+    """
+    由 {trigger: 别名} 生成 {归一化 key: trigger}。trigger 自身的 key 优先于别名，
+    多个 trigger 归一化后相同时取字典序最小的一个
+    """
+    keys = {}
+    for trigger in sorted(table):
+        key = normalize_artist(trigger)
+        if key:
+            keys.setdefault(key, trigger)
+    for trigger in sorted(table):
+        for alias in table[trigger]:
+            key = normalize_artist(alias)
+            if key:
+                keys.setdefault(key, trigger)
+    return keys
+
+
+def _deletions(key: str, depth: int) -> set:
+    """
+    删除至多 depth 个字符得到的全部变体（包含 key 本身）
+    """
+    variants = {key}
+    frontier = {key}
+    for _ in range(depth):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    a 与 b 的编辑距离（插入、删除、替换、相邻字符交换各计 1），超过 limit 时返回 limit + 1
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        # 下一行的值不小于本行最小值，或上一行最小值加 1（相邻交换）
+        if min(current) > limit and min(previous) >= limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _best_matches(query: str, candidates, max_distance: int) -> list:
+    """
+    计算候选 (key, trigger) 与 query 的编辑距离，返回 [(trigger, 距离), ...]（按距离与名称排序，每个 trigger 一次）
+    """
+    best = {}
+    for key, trigger in candidates:
+        distance = edit_distance(query, key, max_distance)
+        if distance <= max_distance and distance < best.get(trigger, max_distance + 1):
+            best[trigger] = distance
+    return sorted(best.items(), key=lambda item: (item[1], item[0]))
+
+
+class _DeletionIndex:
+    """
+    内存中的删除邻域索引：删除变体 → key 列表。用于 CSV 加载的索引，
+    以及二进制文件中没有预先生成（或距离不够）的变体表时
+    """
+    def __init__(self, keys, depth: int):
+        self.depth = depth
+        self._variants = {}
+        for key in keys:
+            for variant in _deletions(key, depth):
+                self._variants.setdefault(variant, []).append(key)
+
+    def candidates(self, query: str) -> set:
+        found = set()
+        for variant in _deletions(query, self.depth):
+            found.update(self._variants.get(variant, ()))
+        return found
+
+
+class ArtistIndex:
+    """
+    艺术家 trigger 索引。
+
+    构建时一次性将所有 trigger 与别名归一化后存入字典（归一化 key → trigger），之后不可变，
+    查询为 O(1) 且不会为每个 tag 重建集合。重新加载时应构建新的索引对象并整体替换。
+    loaded 用于区分"尚未加载"与"已加载但为空"（例如 CSV 文件缺失），
+    后者不会在每个 tag 上重复尝试读取文件。
+    """
+    __slots__ = ('triggers', 'loaded', 'version', '_keys', '_fuzzy')
+
+    def __init__(self, triggers=(), loaded: bool = True, aliases: dict = None):
+        self.triggers = frozenset(triggers)
+        self.loaded = loaded
+        self.version = next(_versions) if loaded else 0
+        table = dict.fromkeys(self.triggers, ())
+        for trigger, names in (aliases or {}).items():
+            if trigger in table:
+                table[trigger] = tuple(names)
+        self._keys = _build_keys(table)
+        self._fuzzy = None
+
+    def __contains__(self, tag: str) -> bool:
+        """
+        判断 tag 是否为艺术家 trigger 或别名（按 normalize_artist 归一化后比较）
+        """
+        return normalize_artist(tag) in self._keys
+
+    def resolve(self, tag: str) -> Optional[str]:
+        """
+        返回 tag 对应的 trigger 原文，不是艺术家时返回 None
+        """
+        return self._keys.get(normalize_artist(tag))
+
+    def fuzzy(self, tag: str, max_distance: int = 1) -> list:
+        """
+        查找编辑距离不超过 max_distance 的 trigger，返回 [(trigger, 距离), ...]，距离小的在前。
+        第一次调用时在内存中生成删除变体索引
+        """
+        query = normalize_artist(tag)
+        fuzzy = self._fuzzy
+        if fuzzy is None or fuzzy.depth < max_distance:
+            fuzzy = self._fuzzy = _DeletionIndex(self._keys, max_distance)
+        keys = self._keys
+        return _best_matches(query, ((key, keys[key]) for key in fuzzy.candidates(query)), max_distance)
+
+    def __len__(self) -> int:
+        return len(self.triggers)
+
+    def __bool__(self) -> bool:
+        return bool(self._keys)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "unloaded"
+        return f"<ArtistIndex {state} v{self.version} size={len(self.triggers)}>"
+
+    @classmethod
+    def from_csv(cls, path: str) -> "ArtistIndex":
+        """
+        从 CSV 文件构建索引；文件缺失或解析失败时返回已加载的空索引
+        """
+        try:
+            table = read_artist_table(path)
+        except Exception:
+            table = {}
+        return cls(table, aliases=table)
+
+
+# 尚未加载的占位索引
+ArtistIndex.UNLOADED = ArtistIndex(loaded=False)
+
+
+_BIN_MAGIC = b'SDAI'
+_BIN_VERSION = 2
+_BIN_HEADER = struct.Struct('<4sIIIIIIIQQ')
+
+
+def _encode(key: str) -> bytes:
+    return key.encode('utf-8', 'surrogatepass')
+
+
+def _decode(data) -> str:
+    return bytes(data).decode('utf-8', 'surrogatepass')
+
+
+def build_artist_bin(csv_path: str, bin_path: str, fuzzy_distance: int = 0) -> int:
+    """
+    将 CSV 中的 trigger 与别名归一化、去重、排序后写入二进制文件，返回 trigger 数量。
+    fuzzy_distance 大于 0 时同时写入删除变体表（每个 key 约 len(key) ** D 条，每条 8 字节）。
+    先写入临时文件再替换，正在使用旧文件的进程不受影响。
+    """
+    table = read_artist_table(csv_path)
+    triggers = sorted(table)
+    trigger_ids = {trigger: i for i, trigger in enumerate(triggers)}
+    key_map = _build_keys(table)
+    keys = sorted(key_map)
+    encoded = [_encode(key) for key in keys]
+    # 槽位数为 2 的幂，装载因子不超过 0.5
+    slot_count = 1 << max(3, (2 * len(keys)).bit_length())
+    mask = slot_count - 1
+    slots = array('I', bytes(4 * slot_count))
+    key_offsets = array('I', [0])
+    position = 0
+    for i, key in enumerate(encoded):
+        position += len(key)
+        key_offsets.append(position)
+        slot = zlib.crc32(key) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = i + 1
+    key_targets = array('I', (trigger_ids[key_map[key]] for key in keys))
+    encoded_triggers = [_encode(trigger) for trigger in triggers]
+    trigger_offsets = array('I', itertools.accumulate((len(trigger) for trigger in encoded_triggers), initial=0))
+    variants = array('Q')
+    if fuzzy_distance > 0:
+        variants = array('Q', sorted(
+            zlib.crc32(_encode(variant)) << 32 | i
+            for i, key in enumerate(keys) for variant in _deletions(key, fuzzy_distance)
+        ))
+    tables = (variants, slots, key_offsets, key_targets, trigger_offsets)
+    if sys.byteorder != 'little':
+        for values in tables:
+            values.byteswap()
+
+    stat = os.stat(csv_path)
+    tmp_path = bin_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, len(keys), slot_count, len(triggers),
+                                 fuzzy_distance, len(variants), 0, stat.st_size, stat.st_mtime_ns))
+        for values in tables:
+            f.write(values.tobytes())
+        for key in encoded:
+            f.write(key)
+        for trigger in encoded_triggers:
+            f.write(trigger)
+    os.replace(tmp_path, bin_path)
+    return len(triggers)
+
+
+def _uint_view(buffer: memoryview, code: str = 'I'):
+    """
+    将小端序无符号整数数组映射为可按下标读取的序列；大端序平台上复制一份并转换字节序
+    """
+    if sys.byteorder == 'little':
+        return buffer.cast(code)
+    values = array(code, bytes(buffer))
+    values.byteswap()
+    return values
+
+
+class MappedArtistIndex:
+    """
+    由 build_artist_bin 生成的二进制文件构建的只读索引，接口与 ArtistIndex 相同。
+
+    文件通过 mmap 映射，加载时只读取文件头；查询时直接在映射的内存上计算哈希并比较，
+    不构建 Python 集合。多个进程映射同一文件时共享操作系统的页缓存。
+    """
+    __slots__ = ('path', 'loaded', 'version', 'source_size', 'source_mtime_ns', 'fuzzy_distance',
+                 '_mm', '_variants', '_slots', '_key_offsets', '_key_targets', '_trigger_offsets',
+                 '_base', '_trigger_base', '_mask', '_key_count', '_count', '_fuzzy')
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        if len(view) < _BIN_HEADER.size:
+            raise ValueError(f"艺术家索引文件格式无效: {path}")
+        (magic, version, key_count, slot_count, count, self.fuzzy_distance, variant_count, _,
+         self.source_size, self.source_mtime_ns) = _BIN_HEADER.unpack_from(view)
+        if magic != _BIN_MAGIC or version != _BIN_VERSION or slot_count & (slot_count - 1):
+            raise ValueError(f"艺术家索引文件格式无效: {path}")
+        bounds = list(itertools.accumulate(
+            (8 * variant_count, 4 * slot_count, 4 * (key_count + 1), 4 * key_count, 4 * (count + 1)),
+            initial=_BIN_HEADER.size))
+        if len(view) < bounds[-1]:
+            raise ValueError(f"艺术家索引文件格式无效: {path}")
+        self.path = path
+        self.loaded = True
+        self.version = next(_versions)
+        self._variants = _uint_view(view[bounds[0]:bounds[1]], 'Q')
+        self._slots = _uint_view(view[bounds[1]:bounds[2]])
+        self._key_offsets = _uint_view(view[bounds[2]:bounds[3]])
+        self._key_targets = _uint_view(view[bounds[3]:bounds[4]])
+        self._trigger_offsets = _uint_view(view[bounds[4]:bounds[5]])
+        self._base = bounds[5]
+        self._trigger_base = bounds[5] + self._key_offsets[key_count]
+        if len(view) < self._trigger_base + self._trigger_offsets[count]:
+            raise ValueError(f"艺术家索引文件格式无效: {path}")
+        self._mask = slot_count - 1
+        self._key_count = key_count
+        self._count = count
+        self._fuzzy = None
+
+    def _find(self, key: str) -> int:
+        """
+        返回归一化 key 的序号，不存在时返回 -1
+        """
+        data = _encode(key)
+        slots = self._slots
+        offsets = self._key_offsets
+        mm = self._mm
+        base = self._base
+        mask = self._mask
+        slot = zlib.crc32(data) & mask
+        while True:
+            i = slots[slot]
+            if not i:
+                return -1
+            if mm[base + offsets[i - 1]:base + offsets[i]] == data:
+                return i - 1
+            slot = (slot + 1) & mask
+
+    def _key(self, i: int) -> str:
+        return _decode(self._mm[self._base + self._key_offsets[i]:self._base + self._key_offsets[i + 1]])
+
+    def _trigger(self, i: int) -> str:
+        base = self._trigger_base
+        return _decode(self._mm[base + self._trigger_offsets[i]:base + self._trigger_offsets[i + 1]])
+
+    def __contains__(self, tag: str) -> bool:
+        """
+        判断 tag 是否为艺术家 trigger 或别名（按 normalize_artist 归一化后比较）
+        """
+        return self._find(normalize_artist(tag)) >= 0
+
+    def resolve(self, tag: str) -> Optional[str]:
+        """
+        返回 tag 对应的 trigger 原文，不是艺术家时返回 None
+        """
+        i = self._find(normalize_artist(tag))
+        return self._trigger(self._key_targets[i]) if i >= 0 else None
+
+    def fuzzy(self, tag: str, max_distance: int = 1) -> list:
+        """
+        查找编辑距离不超过 max_distance 的 trigger，返回 [(trigger, 距离), ...]，距离小的在前。
+        文件中的变体表距离足够时在映射的内存上二分查找，否则第一次调用时在内存中生成删除变体索引
+        """
+        query = normalize_artist(tag)
+        if max_distance <= self.fuzzy_distance:
+            variants = self._variants
+            ids = set()
+            for variant in _deletions(query, max_distance):
+                low = zlib.crc32(_encode(variant)) << 32
+                i = bisect_left(variants, low)
+                end = low | 0xFFFFFFFF
+                while i < len(variants) and variants[i] <= end:
+                    ids.add(variants[i] & 0xFFFFFFFF)
+                    i += 1
+            candidates = ((self._key(i), self._trigger(self._key_targets[i])) for i in ids)
+        else:
+            fuzzy = self._fuzzy
+            if fuzzy is None or fuzzy.depth < max_distance:
+                fuzzy = self._fuzzy = _DeletionIndex((self._key(i) for i in range(self._key_count)), max_distance)
+            candidates = ((key, self._trigger(self._key_targets[self._find(key)])) for key in fuzzy.candidates(query))
+        return _best_matches(query, candidates, max_distance)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._key_count > 0
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._trigger(i)
+
+    def __repr__(self) -> str:
+        return f"<MappedArtistIndex {self.path} v{self.version} size={self._count}>"
+
+    @property
+    def triggers(self) -> "ArtistKeys":
+        """
+        trigger 集合的只读视图（CSV 中的原文），按需从映射的文件中读取
+        """
+        return ArtistKeys(self)
+
+    def matches_source(self, csv_path: str) -> bool:
+        """
+        判断二进制文件是否由当前的 CSV 文件生成；CSV 不存在时视为匹配（可以只分发二进制文件）
+        """
+        try:
+            stat = os.stat(csv_path)
+        except OSError:
+            return True
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime_ns
+
+
+class ArtistKeys(Set):
+    """
+    MappedArtistIndex 中 trigger 的只读集合视图（trigger 按字典序存储，成员判断为二分查找）
+    """
+    __slots__ = ('_index',)
+
+    def __init__(self, index: MappedArtistIndex):
+        self._index = index
+
+    def __contains__(self, key) -> bool:
+        if not isinstance(key, str):
+            return False
+        index = self._index
+        low, high = 0, len(index)
+        while low < high:
+            middle = (low + high) // 2
+            if index._trigger(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < len(index) and index._trigger(low) == key
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def load_artist_index(csv_path: str, bin_path: str = None):
+    """
+    加载艺术家索引：二进制文件存在且与 CSV 一致时内存映射该文件，否则解析 CSV
+    """
+    if bin_path and os.path.exists(bin_path):
+        try:
+            index = MappedArtistIndex(bin_path)
+            if index.matches_source(csv_path):
+                return index
+            logger.warning("艺术家索引 %s 与 %s 不一致，改为读取 CSV；可运行 python -m artist_index build 重新生成",
+                           bin_path, csv_path)
+        except (OSError, ValueError) as e:
+            logger.warning("无法加载艺术家索引 %s: %s", bin_path, e)
+    return ArtistIndex.from_csv(csv_path)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="艺术家 trigger 索引工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="将 CSV 编译为可内存映射的二进制索引")
+    build.add_argument("csv", nargs="?", default=Config.ARTIST_CSV_PATH, help="艺术家 CSV 文件")
+    build.add_argument("-o", "--output", default=Config.ARTIST_BIN_PATH, help="输出的二进制文件")
+    build.add_argument("--fuzzy-distance", type=int, default=Config.ARTIST_FUZZY_DISTANCE,
+                       help="预先生成删除变体表的编辑距离，0 表示不生成（默认与 Config.ARTIST_FUZZY_DISTANCE 相同）")
+    args = parser.parse_args(argv)
+
+    count = build_artist_bin(args.csv, args.output, args.fuzzy_distance)
+    logger.info("已生成 %s：%d 个 trigger", args.output, count)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+批量提示词格式转换命令行工具。
+
+用法示例：
+    python -m batch_convert nai_to_sd prompts.txt -o converted.txt
+    python -m batch_convert sd_to_nai library.jsonl -o library_nai.jsonl --field prompt --workers 8
+    python -m batch_convert nai_to_sd library.csv -o out.csv --field prompt
+
+支持 TXT（每行一条提示词）、JSONL（每行一个对象，转换 --field 指定的字段）
+和 CSV（转换 --field 指定的列）三种格式，输入输出均以流的方式处理并保持原有顺序。
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import Iterator, TextIO
+from config import Config
+from prompt_converter import PromptConverter
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+FORMATS = ('txt', 'jsonl', 'csv')
+
+
+def detect_format(path: str, default: str = 'txt') -> str:
+    """
+    根据文件扩展名判断格式，无法判断时返回 default
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext in FORMATS:
+        return ext
+    if ext in ('json', 'ndjson'):
+        return 'jsonl'
+    return default
+
+
+def read_records(src: TextIO, fmt: str, field: str = 'prompt', fieldnames: list = None) -> Iterator[tuple]:
+    """
+    按格式逐条读取 (记录, 提示词)：TXT 每行一条，JSONL 取对象的 field 字段，CSV 取 field 列。
+    读取 CSV 时表头的列名会追加到 fieldnames（如果提供），用于按原有列写回
+    """
+    if fmt == 'txt':
+        for line in src:
+            line = line.rstrip('\r\n')
+            yield line, line
+    elif fmt == 'jsonl':
+        for line in src:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                yield record, record.get(field) or ""
+            else:
+                yield record, record if isinstance(record, str) else ""
+    else:
+        reader = csv.DictReader(src)
+        if reader.fieldnames is None or field not in reader.fieldnames:
+            raise ValueError(f"CSV 中没有找到列: {field}")
+        if fieldnames is not None:
+            fieldnames.extend(reader.fieldnames)
+        for row in reader:
+            yield row, row[field] or ""
+
+
+class BatchConverter:
+    """
+    按格式读取记录、批量转换提示词并写回，输出顺序与输入一致
+    """
+    def __init__(self, direction: str, fmt: str, field: str = 'prompt', workers: int = None,
+                 chunk_size: int = Config.BATCH_CHUNK_SIZE, progress_interval: float = 5.0):
+        self.direction = direction
+        self.fmt = fmt
+        self.field = field
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.fieldnames = None
+        self.count = 0
+        self.elapsed = 0.0
+
+    def _write_record(self, dst: TextIO, writer, record, result: str):
+        """
+        将转换结果写回记录并输出
+        """
+        if self.fmt == 'txt':
+            dst.write(result)
+            dst.write('\n')
+        elif self.fmt == 'jsonl':
+            if isinstance(record, dict):
+                record = dict(record)
+                record[self.field] = result
+            else:
+                record = result
+            dst.write(json.dumps(record, ensure_ascii=False))
+            dst.write('\n')
+        else:
+            row = dict(record)
+            row[self.field] = result
+            writer.writerow(row)
+
+    def run(self, src: TextIO, dst: TextIO) -> int:
+        """
+        执行转换，返回处理的记录数
+        """
+        records = deque()
+        self.fieldnames = []
+
+        def prompts():
+            for record, prompt in read_records(src, self.fmt, self.field, self.fieldnames):
+                records.append(record)
+                yield prompt
+
+        results = PromptConverter.convert_many(
+            prompts(), self.direction, workers=self.workers, chunk_size=self.chunk_size
+        )
+        writer = None
+        start = time.perf_counter()
+        last_report = start
+        for result in results:
+            record = records.popleft()
+            if self.fmt == 'csv' and writer is None:
+                writer = csv.DictWriter(dst, fieldnames=self.fieldnames)
+                writer.writeheader()
+            self._write_record(dst, writer, record, result)
+            self.count += 1
+            now = time.perf_counter()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                logger.info("已转换 %d 条，%.0f 条/秒", self.count, self.count / (now - start))
+        if self.fmt == 'csv' and writer is None and self.fieldnames:
+            csv.DictWriter(dst, fieldnames=self.fieldnames).writeheader()
+        self.elapsed = time.perf_counter() - start
+        return self.count
+
+    @property
+    def throughput(self) -> float:
+        """
+        每秒转换的条数
+        """
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="批量转换 NAI / SD 提示词格式")
+    parser.add_argument("direction", choices=PromptConverter.DIRECTIONS, help="转换方向")
+    parser.add_argument("input", help="输入文件，'-' 表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出文件，默认输出到标准输出")
+    parser.add_argument("-f", "--format", choices=FORMATS, help="文件格式，默认根据扩展名判断")
+    parser.add_argument("--field", default="prompt", help="JSONL/CSV 中需要转换的字段名")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--chunk-size", type=int, default=Config.BATCH_CHUNK_SIZE, help="每个分块的提示词数量")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.input if args.input != '-' else args.output)
+    converter = BatchConverter(args.direction, fmt, field=args.field,
+                               workers=args.workers, chunk_size=args.chunk_size)
+
+    newline = '' if fmt == 'csv' else None
+    src = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8', newline=newline)
+    dst = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline=newline)
+    try:
+        converter.run(src, dst)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+    logger.info("转换完成：共 %d 条，用时 %.2f 秒，%.0f 条/秒",
+                converter.count, converter.elapsed, converter.throughput)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+提示词转换与元数据提取的基准测试。
+
+在临时目录中按固定随机种子生成测试数据（深层嵌套的 NAI 提示词、带大量权重的 SD 提示词、
+1 万到 100 万行的艺术家 CSV、带 tEXt / iTXt / zTXt 文本块的 PNG，以及带 EXIF 的 JPEG / WebP），
+统计每个测试项的 ops/s、p50 / p99 延迟与峰值内存（tracemalloc），结果可保存为 JSON 并与基线比较。
+
+用法示例：
+    python benchmark.py -o bench.json
+    python benchmark.py --compare bench.json --threshold 0.15
+    python benchmark.py --only converter,metadata --quick
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from typing import Callable, Sequence
+from config import Config
+from artist_index import ArtistIndex, build_artist_bin
+from prompt_converter import PromptConverter, clean_output
+from metadata_extractor import MetadataExtractor
+
+GROUPS = ('converter', 'artist', 'metadata')
+
+_WORDS = ("girl", "hair", "eyes", "dress", "smile", "sky", "cloud", "flower", "school", "uniform",
+          "long", "short", "blue", "red", "white", "black", "looking", "at", "viewer", "outdoors",
+          "night", "city", "lights", "rain", "cat", "ears", "holding", "umbrella", "masterpiece", "detailed")
+
+
+def _tag(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 3)))
+
+
+def _artist_name(i: int) -> str:
+    # 不能以 "artist_" 开头：nai_to_sd 会先把它还原为 "artist:" 前缀，不再查艺术家表
+    return f"painter{i:07d}"
+
+
+def make_nai_prompt(rnd: random.Random, tags: int, depth: int, artists: int = 0) -> str:
+    """
+    生成 NAI 提示词：tag 随机包在最多 depth 层的大括号 / 方括号中，并混入艺术家 tag
+    """
+    parts = []
+    for _ in range(tags):
+        tag = _tag(rnd)
+        if artists and rnd.random() < 0.1:
+            tag = _artist_name(rnd.randrange(artists))
+        open_bracket, close_bracket = rnd.choice((('{', '}'), ('[', ']')))
+        level = rnd.randint(0, depth)
+        parts.append(open_bracket * level + tag + close_bracket * level)
+    return ", ".join(parts)
+
+
+def make_sd_prompt(rnd: random.Random, tags: int, artists: int = 0) -> str:
+    """
+    生成 SD 提示词：大约一半的 tag 带 (tag:权重)，部分 tag 含转义括号
+    """
+    parts = []
+    for _ in range(tags):
+        tag = _tag(rnd)
+        if artists and rnd.random() < 0.1:
+            tag = _artist_name(rnd.randrange(artists))
+        elif rnd.random() < 0.05:
+            tag += r" \(cosplay\)"
+        if rnd.random() < 0.5:
+            tag = f"({tag}:{rnd.uniform(0.5, 1.6):.2f})"
+        parts.append(tag)
+    return ", ".join(parts)
+
+
+def write_artist_csv(path: str, rows: int, rnd: random.Random):
+    """
+    生成 danbooru_art.csv 格式的艺术家表（trigger,count）
+    """
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("trigger,count\n")
+        for i in range(rows):
+            f.write(f"{_artist_name(i)},{rnd.randint(1, 10000)}\n")
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def make_png(rnd: random.Random, texts: Sequence[tuple], idat_size: int) -> bytes:
+    """
+    生成 PNG：texts 为 (块类型, 关键字, 文本) 列表，块类型为 tEXt / zTXt / iTXt，
+    IDAT 为 idat_size 字节的填充数据（元数据提取不会解码像素）
+    """
+    out = [b'\x89PNG\r\n\x1a\n', _png_chunk(b'IHDR', struct.pack('>IIBBBBB', 512, 512, 8, 2, 0, 0, 0))]
+    for chunk_type, keyword, text in texts:
+        keyword = keyword.encode('latin1')
+        if chunk_type == 'tEXt':
+            data = keyword + b'\x00' + text.encode('latin1', 'replace')
+        elif chunk_type == 'zTXt':
+            data = keyword + b'\x00\x00' + zlib.compress(text.encode('latin1', 'replace'))
+        else:
+            data = keyword + b'\x00\x01\x00\x00\x00' + zlib.compress(text.encode('utf-8'))
+        out.append(_png_chunk(chunk_type.encode('ascii'), data))
+    out.append(_png_chunk(b'IDAT', rnd.randbytes(idat_size)))
+    out.append(_png_chunk(b'IEND', b''))
+    return b''.join(out)
+
+
+def make_exif(comment: str) -> bytes:
+    """
+    生成只包含 Exif 子 IFD 中 UserComment（UNICODE 编码）的 TIFF 结构
+    """
+    raw = b'UNICODE\x00' + comment.encode('utf-16-be')
+    ifd0 = struct.pack('>H', 1) + struct.pack('>HHII', 0x8769, 4, 1, 26) + struct.pack('>I', 0)
+    exif_ifd = struct.pack('>H', 1) + struct.pack('>HHII', 0x9286, 7, len(raw), 44) + struct.pack('>I', 0)
+    return b'MM' + struct.pack('>HI', 42, 8) + ifd0 + exif_ifd + raw
+
+
+def make_jpeg(rnd: random.Random, exif: bytes, scan_size: int) -> bytes:
+    """
+    生成带 EXIF APP1 段的 JPEG，扫描数据为 scan_size 字节的填充数据
+    """
+    payload = b'Exif\x00\x00' + exif
+    return b''.join((
+        b'\xff\xd8',
+        b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00',
+        b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload,
+        b'\xff\xdb' + struct.pack('>H', 67) + b'\x00' * 65,
+        b'\xff\xda' + struct.pack('>H', 8) + b'\x01\x01\x00\x00\x3f\x00',
+        rnd.randbytes(scan_size).replace(b'\xff', b'\x00'),
+        b'\xff\xd9',
+    ))
+
+
+def make_webp(rnd: random.Random, exif: bytes, image_size: int) -> bytes:
+    """
+    生成 VP8X 扩展格式的 WebP，EXIF 块位于图像数据之后
+    """
+    image_size += image_size & 1
+    chunks = b''.join((
+        b'VP8X' + struct.pack('<I', 10) + b'\x08' + b'\x00' * 9,
+        b'VP8 ' + struct.pack('<I', image_size) + rnd.randbytes(image_size),
+        b'EXIF' + struct.pack('<I', len(exif)) + exif + b'\x00' * (len(exif) & 1),
+    ))
+    return b'RIFF' + struct.pack('<I', len(chunks) + 4) + b'WEBP' + chunks
+
+
+def _a1111_parameters(rnd: random.Random, tags: int) -> str:
+    return (make_sd_prompt(rnd, tags) + "\nNegative prompt: " + make_sd_prompt(rnd, tags // 4) +
+            f"\nSteps: 28, Sampler: DPM++ 2M, Schedule type: Karras, CFG scale: 7, Seed: {rnd.randrange(2**32)}, "
+            "Size: 832x1216, Model hash: 0123456789, Model: model, Version: v1.10.0")
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Benchmark:
+    """
+    依次运行测试项并收集结果
+    """
+    def __init__(self, min_time: float = 1.0, max_ops: int = 100000):
+        self.min_time = min_time
+        self.max_ops = max_ops
+        self.results = {}
+
+    def measure(self, name: str, fn: Callable, inputs: Sequence, setup: Callable = None):
+        """
+        循环对 inputs 调用 fn，至少运行 min_time 秒（且每个输入至少一次），记录每次调用的耗时；
+        之后在 tracemalloc 下对每个输入再运行一次，得到峰值内存。
+        """
+        if setup:
+            setup()
+        fn(inputs[0])  # 预热（加载索引、编译正则等）
+        timings = []
+        perf_counter_ns = time.perf_counter_ns
+        deadline = time.perf_counter() + self.min_time
+        i = 0
+        while i < len(inputs) or (time.perf_counter() < deadline and i < self.max_ops):
+            item = inputs[i % len(inputs)]
+            start = perf_counter_ns()
+            fn(item)
+            timings.append(perf_counter_ns() - start)
+            i += 1
+
+        tracemalloc.start()
+        try:
+            for item in inputs:
+                fn(item)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        total = sum(timings)
+        result = {
+            "ops": len(timings),
+            "ops_per_sec": len(timings) / (total / 1e9) if total else 0.0,
+            "mean_us": total / len(timings) / 1000,
+            "p50_us": _percentile(timings, 0.50) / 1000,
+            "p99_us": _percentile(timings, 0.99) / 1000,
+            "peak_kib": peak / 1024,
+        }
+        self.results[name] = result
+        print(f"{name:<44} {result['ops_per_sec']:>12.1f} ops/s  p50 {result['p50_us']:>10.1f} us  "
+              f"p99 {result['p99_us']:>10.1f} us  peak {result['peak_kib']:>10.1f} KiB", flush=True)
+        return result
+
+
+def run_converter(bench: Benchmark, workdir: str, rnd: random.Random, quick: bool):
+    """
+    转换器：深层嵌套 NAI、长 SD 提示词，以及单独的括号解析与输出清理
+    """
+    csv_path = os.path.join(workdir, "artists_converter.csv")
+    write_artist_csv(csv_path, 10000, rnd)
+    Config.ARTIST_CSV_PATH = csv_path
+    Config.ARTIST_BIN_PATH = ""
+    PromptConverter.load_artist_triggers()
+
+    count = 50 if quick else 200
+    nai_short = [make_nai_prompt(rnd, 20, 2, 10000) for _ in range(count)]
+    nai_nested = [make_nai_prompt(rnd, 80, 8, 10000) for _ in range(count)]
+    sd_long = [make_sd_prompt(rnd, 150, 10000) for _ in range(count)]
+    sd_outputs = [PromptConverter.nai_to_sd(prompt) for prompt in nai_nested]
+    assert any("artist:painter" in prompt for prompt in sd_outputs), "艺术家 tag 没有命中艺术家表"
+
+    bench.measure("nai_to_sd/short", PromptConverter.nai_to_sd, nai_short)
+    bench.measure("nai_to_sd/nested_depth8", PromptConverter.nai_to_sd, nai_nested)
+    bench.measure("sd_to_nai/long_150_tags", PromptConverter.sd_to_nai, sd_long)
+    bench.measure("parse_and_count_brackets/nested", PromptConverter.parse_and_count_brackets, nai_nested)
+    bench.measure("clean_output/sd", clean_output, sd_outputs)
+
+    # 使用内存映射的二进制艺术家索引
+    Config.ARTIST_BIN_PATH = os.path.join(workdir, "artists_converter.bin")
+    build_artist_bin(csv_path, Config.ARTIST_BIN_PATH)
+    PromptConverter.load_artist_triggers()
+    assert "artist:painter" in PromptConverter.nai_to_sd(_artist_name(0)), "艺术家 tag 没有命中二进制艺术家索引"
+    bench.measure("nai_to_sd/nested_depth8_mapped", PromptConverter.nai_to_sd, nai_nested)
+
+
+def run_artist(bench: Benchmark, workdir: str, rnd: random.Random, quick: bool):
+    """
+    艺术家表加载：每次调用重新读取 CSV 并构建索引，或映射预先生成的二进制索引
+    """
+    sizes = (10000, 100000) if quick else (10000, 100000, 1000000)
+    for rows in sizes:
+        path = os.path.join(workdir, f"artists_{rows}.csv")
+        write_artist_csv(path, rows, rnd)
+
+        bin_path = os.path.join(workdir, f"artists_{rows}.bin")
+        build_artist_bin(path, bin_path)
+
+        def load(paths):
+            Config.ARTIST_CSV_PATH, Config.ARTIST_BIN_PATH = paths
+            return PromptConverter.load_artist_triggers()
+
+        bench.measure(f"load_artist_triggers/{rows}", load, [(path, "")])
+        bench.measure(f"load_artist_triggers/{rows}_mapped", load, [(path, bin_path)])
+
+
+def run_metadata(bench: Benchmark, workdir: str, rnd: random.Random, quick: bool):
+    """
+    元数据提取：不同大小与文本块类型的 PNG，以及带 EXIF 的 JPEG / WebP（不使用结果缓存）
+    """
+    parameters = _a1111_parameters(rnd, 120)
+    workflow = json.dumps({"nodes": [{"id": i, "type": "KSampler", "widgets_values": [rnd.random()] * 8}
+                                     for i in range(2000)]})
+    comfy_prompt = json.dumps({str(i): {"inputs": {"text": make_sd_prompt(rnd, 20)}} for i in range(20)})
+    large = 1024 * 1024 if quick else 8 * 1024 * 1024
+    cases = {
+        "png_tEXt_64k": make_png(rnd, [('tEXt', 'parameters', parameters)], 64 * 1024),
+        f"png_tEXt_{large // 1024}k": make_png(rnd, [('tEXt', 'parameters', parameters)], large),
+        "png_iTXt_64k": make_png(rnd, [('iTXt', 'parameters', parameters)], 64 * 1024),
+        "png_zTXt_comfyui_64k": make_png(rnd, [('zTXt', 'prompt', comfy_prompt), ('zTXt', 'workflow', workflow)],
+                                              64 * 1024),
+        "jpeg_exif_1m": make_jpeg(rnd, make_exif(parameters), 1024 * 1024),
+        "webp_exif_1m": make_webp(rnd, make_exif(parameters), 1024 * 1024),
+    }
+    for name, data in cases.items():
+        path = os.path.join(workdir, name + {"j": ".jpg", "w": ".webp"}.get(name[0], ".png"))
+        with open(path, "wb") as f:
+            f.write(data)
+        bench.measure(f"extract_metadata/{name}",
+                      lambda file_path: MetadataExtractor.extract_metadata(file_path, use_cache=False), [path])
+        # 直接解析内存中的数据（例如接口收到的上传）
+        bench.measure(f"extract_metadata/{name}_buffer",
+                      lambda buffer: MetadataExtractor.extract_metadata(buffer, use_cache=False), [memoryview(data)])
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    与基线比较，返回吞吐量下降或 p99 延迟上升超过 threshold 的测试项
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        ops_change = current["ops_per_sec"] / previous["ops_per_sec"] - 1 if previous["ops_per_sec"] else 0.0
+        p99_change = current["p99_us"] / previous["p99_us"] - 1 if previous["p99_us"] else 0.0
+        print(f"{name:<44} ops/s {ops_change:+8.1%}  p99 {p99_change:+8.1%}")
+        if ops_change < -threshold or p99_change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="提示词转换与元数据提取的基准测试")
+    parser.add_argument("-o", "--output", help="将结果保存为 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="判定为性能退化的相对变化，默认 0.10（10%%）")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"只运行部分测试组：{','.join(GROUPS)}")
+    parser.add_argument("--quick", action="store_true", help="使用较小的数据集与较短的运行时间")
+    parser.add_argument("--min-time", type=float, default=None, help="每个测试项的最短运行时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="生成测试数据的随机种子")
+    args = parser.parse_args(argv)
+
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"未知的测试组: {', '.join(sorted(unknown))}")
+
+    # 基准测试测量的是实际转换，关闭转换结果缓存
+    PromptConverter.configure_cache(0)
+    artist_paths = (Config.ARTIST_CSV_PATH, Config.ARTIST_BIN_PATH)
+    bench = Benchmark(min_time=args.min_time if args.min_time is not None else (0.2 if args.quick else 1.0))
+    runners = {"converter": run_converter, "artist": run_artist, "metadata": run_metadata}
+    try:
+        with tempfile.TemporaryDirectory(prefix="sd_prompt_bench_") as workdir:
+            for group in groups:
+                runners[group](bench, workdir, random.Random(args.seed), args.quick)
+    finally:
+        Config.ARTIST_CSV_PATH, Config.ARTIST_BIN_PATH = artist_paths
+        PromptConverter.artist_index = ArtistIndex.UNLOADED
+        PromptConverter.artist_triggers = frozenset()
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "quick": args.quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": bench.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(bench.results, baseline, args.threshold)
+        if regressions:
+            print(f"性能退化（超过 {args.threshold:.0%}）: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存。
+
+    同时按条目数（max_entries）与字节预算（max_bytes，0 表示不限制）淘汰最久未使用的条目，
+    每个条目的大小由 sizeof 估算。记录命中、未命中与淘汰次数，可通过 stats() 查看。
+    """
+    def __init__(self, max_entries: int, max_bytes: int = 0, sizeof: Optional[Callable] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """
+        查询缓存，命中时将条目移到最近使用的位置
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        """
+        写入缓存；单个条目超过字节预算时不缓存
+        """
+        size = self._sizeof(value)
+        if self.max_entries <= 0 or (self.max_bytes and size > self.max_bytes):
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        清空缓存（保留统计计数）
+        """
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        返回缓存统计信息
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,3 +1,4 @@
+import os
 import re
 
 class Config:
@@ -13,6 +14,33 @@ class Config:
     
     # 特殊标签配置
     SPECIAL_TAGS = ['artist:', 'camera:', 'quality:', 'style:', 'subject:']
+
+    # 日志：级别与文件路径，可通过环境变量 SD_PROMPT_LOG_LEVEL / SD_PROMPT_LOG_FILE 覆盖，文件路径为空时只输出到控制台
+    LOG_LEVEL = os.environ.get("SD_PROMPT_LOG_LEVEL", "DEBUG")
+    LOG_FILE = os.environ.get("SD_PROMPT_LOG_FILE", "app.log")
+
+    # 耗时统计（/metrics）与按请求的性能分析，默认关闭
+    METRICS_ENABLED = os.environ.get("SD_PROMPT_METRICS", "0") == "1"
+    PROFILE_ENABLED = os.environ.get("SD_PROMPT_PROFILE", "0") == "1"
+    PROFILE_DIR = os.environ.get("SD_PROMPT_PROFILE_DIR", "profiles")
+
+    # 艺术家 trigger 表（CSV，需包含 "trigger" 列）
+    ARTIST_CSV_PATH = "danbooru_art.csv"
+    # 由 python -m artist_index build 生成的二进制索引，存在且与 CSV 一致时优先使用
+    ARTIST_BIN_PATH = "danbooru_art.bin"
+    # 模糊匹配：最大编辑距离（0 表示只做归一化后的精确匹配）与参与模糊匹配的最短 tag 长度；
+    # 大表建议用 python -m artist_index build --fuzzy-distance 1 预先生成删除变体表
+    ARTIST_FUZZY_DISTANCE = 0
+    ARTIST_FUZZY_MIN_LENGTH = 6
+    # 通过别名或模糊匹配识别出艺术家时，是否替换为 CSV 中的 trigger 原文（否则保留原来的写法）
+    ARTIST_CANONICAL_NAMES = False
+
+    # 批量转换：每个分块包含的提示词数量
+    BATCH_CHUNK_SIZE = 1000
+
+    # 转换结果缓存：最多缓存的条目数，0 表示不启用（可通过 PromptConverter.configure_cache 在运行时开启）
+    CONVERSION_CACHE_SIZE = 0
+    CONVERSION_CACHE_BYTES = 64 * 1024 * 1024
     
     # 表情符号模式
     EMOJI_PATTERNS = [
@@ -31,9 +59,44 @@ class Config:
     # 图片解析相关
     PNG_HEADER_LENGTH = 8
     CHUNK_LENGTH_SIZE = 4
+    MAX_TEXT_CHUNK_SIZE = 16 * 1024 * 1024  # 单个文本块读取与解压的上限
+
+    # 批量元数据扫描
+    SCAN_WORKERS = 0  # 0 表示按 CPU 核数自动选择
+    SCAN_CACHE_PATH = "metadata_cache.sqlite"
+    SCAN_COMMIT_INTERVAL = 500
+
+    # 元数据提取结果的内存缓存（按文件头尾内容哈希与文件大小索引），条目数为 0 时不缓存
+    METADATA_CACHE_ENTRIES = 256
+    METADATA_CACHE_BYTES = 32 * 1024 * 1024
+    METADATA_CACHE_SAMPLE_BYTES = 64 * 1024  # 参与哈希的文件头部与尾部字节数
     SUPPORTED_FORMATS = {'PNG', 'JPEG', 'JPG', 'WEBP'}
     
     # 界面相关
     MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+    SPOOL_MEMORY_SIZE = 16 * 1024 * 1024  # 上传数据在内存中缓冲的上限，超过后才写入临时文件
+    TEMP_IMAGE_BYTES = 256 * 1024 * 1024  # ImageProcessor.create_temp_image 保留的临时文件总大小
     DEFAULT_PORT = 8080
-    MAX_THREADS = 4 
\ No newline at end of file
+    MAX_THREADS = 4
+    # 请求队列与并发限制：转换 / 检索等轻量请求与元数据提取 / 加载索引等耗时请求使用独立的并发组与线程池
+    QUEUE_MAX_SIZE = int(os.environ.get("SD_PROMPT_QUEUE_MAX_SIZE", "100"))  # 排队请求数上限，超出时拒绝新请求
+    CONVERT_CONCURRENCY = int(os.environ.get("SD_PROMPT_CONVERT_CONCURRENCY", "16"))
+    EXTRACT_CONCURRENCY = int(os.environ.get("SD_PROMPT_EXTRACT_CONCURRENCY", "2"))
+
+    # 无界面 HTTP 接口（api_server.py）
+    API_HOST = os.environ.get("SD_PROMPT_API_HOST", "127.0.0.1")
+    API_PORT = int(os.environ.get("SD_PROMPT_API_PORT", "8081"))
+    API_MAX_BODY_SIZE = 64 * 1024 * 1024  # 批量接口请求体的上限，单张图片的上限见 MAX_IMAGE_SIZE
+    SEARCH_RESULT_LIMIT = 200  # 检索标签页最多显示的结果数
+
+    # 启动：是否在后台线程预先加载艺术家索引，以及 main.py --startup-report 的导入耗时预算（毫秒，0 表示不检查）
+    PREWARM_ARTIST_INDEX = os.environ.get("SD_PROMPT_PREWARM", "0") == "1"
+    STARTUP_BUDGET_MS = float(os.environ.get("SD_PROMPT_STARTUP_BUDGET_MS", "0"))
+
+    # 提示词语料统计（tag_analytics.py）
+    ANALYTICS_TOP_K = 50
+    ANALYTICS_WORKERS = 0  # 0 表示按 CPU 核数自动选择
+    ANALYTICS_MAX_EXACT_PAIRS = 2000000  # 精确统计的共现对数量上限，超过后改为近似统计
+    ANALYTICS_PAIR_CAPACITY = 20000  # 近似统计时 Space-Saving 保留的共现对数量
+    ANALYTICS_SKETCH_WIDTH = 1 << 18  # Count-Min Sketch 每行的计数器数量
+    ANALYTICS_SKETCH_DEPTH = 4
\ No newline at end of file
@@ -0,0 +1,484 @@
+"""
+提示词转换的差分测试与模糊测试。
+
+按固定随机种子生成带嵌套括号的 NAI / SD 提示词（包含转义括号、Config.EMOJI_PATTERNS 中的表情、
+Config.SPECIAL_TAGS 前缀、中文标点以及不配对的括号），逐项比较 reference_converter 中冻结的参考实现
+与当前 PromptConverter 的输出，检查 nai→sd→nai 往返转换是否稳定，并记录每个用例的耗时以发现病态输入。
+发现的问题会自动缩减为最小输入并保存到 fuzz_fixtures/ 目录，之后每次运行先回放这些用例。
+
+两边都按空的艺术家索引运行，转换结果缓存关闭。
+
+用法示例：
+    python fuzz_converter.py --cases 20000 --seed 1
+    python fuzz_converter.py --max-seconds 60 --slow-ms 20
+    python fuzz_converter.py --replay
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+from typing import Callable
+from config import Config
+from artist_index import ArtistIndex
+from prompt_converter import PromptConverter, clean_output, escape_inner_parentheses, parse_sd
+import reference_converter as reference
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuzz_fixtures")
+
+# sd_to_nai 按权重生成括号，(tag:100000) 这样的输入会输出几百万个括号；
+# 超过该层数的输入不做转换，只计入跳过的用例
+MAX_BRACKETS = 2000
+
+_WORDS = ("girl", "hair", "eyes", "smile", "sky", "flower", "school uniform", "long hair", "blue",
+          "looking at viewer", "outdoors", "night", "cat ears", "holding umbrella", "masterpiece",
+          "1girl", "solo", "mamimi", "foo bar", "o_o", "^_^", "ribbon", "白发", "猫耳")
+_NOISE = list("abcxyz ,{}[]()\\:.0123456789。、_\t") + [
+    "artist:", "artist_", "__ESC_(]__", "\\(", "\\)", "\\[", "\\{", ":3", ":D", ":)", "1.1"]
+_SEPARATORS = (",", ", ", " , ", ",,", "。", "、", ",\n")
+
+
+def _sample_pattern(pattern: str, rnd: random.Random) -> str:
+    """
+    生成一个匹配 pattern 的字符串，只支持 EMOJI_PATTERNS 用到的语法：
+    普通字符、反斜杠转义、字符类 [...]、量词 ? 与 \\b
+    """
+    atoms = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if pattern[i + 1] != 'b':
+                atoms.append([pattern[i + 1]])
+            i += 2
+        elif char == '[':
+            choices = []
+            i += 1
+            while pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                choices.append(pattern[i])
+                i += 1
+            atoms.append(choices)
+            i += 1
+        elif char == '?':
+            if rnd.random() < 0.5:
+                atoms[-1] = ['']
+            i += 1
+        else:
+            atoms.append([char])
+            i += 1
+    return ''.join(rnd.choice(choices) for choices in atoms)
+
+
+class PromptGenerator:
+    """
+    按随机种子生成测试用的提示词：结构化的 NAI / SD 提示词（可能被随机破坏）与随机字符串
+    """
+
+    def __init__(self, rnd: random.Random, max_depth: int = 8):
+        self.rnd = rnd
+        self.max_depth = max_depth
+
+    def tag(self) -> str:
+        rnd = self.rnd
+        roll = rnd.random()
+        if roll < 0.15:
+            return _sample_pattern(rnd.choice(Config.EMOJI_PATTERNS), rnd)
+        tag = rnd.choice(_WORDS)
+        if roll < 0.3:
+            tag = rnd.choice(Config.SPECIAL_TAGS) + tag
+        elif roll < 0.4:
+            # 带括号的艺术家名或作品名，例如 mamimi (mamamimi)
+            tag = f"{tag}{rnd.choice(('', ' ', '_'))}({rnd.choice(_WORDS)})"
+        elif roll < 0.5:
+            tag = f"{tag} \\({rnd.choice(_WORDS)}\\)"
+        return tag
+
+    def separator(self) -> str:
+        return self.rnd.choice(_SEPARATORS)
+
+    def nai(self, depth: int = 0) -> str:
+        """
+        生成 NAI 格式：标签之间用逗号或中文标点分隔，每组随机包在若干层 {} 或 [] 中
+        """
+        rnd = self.rnd
+        parts = []
+        for _ in range(rnd.randint(1, 5)):
+            if depth < self.max_depth and rnd.random() < 0.3:
+                part = self.nai(depth + 1)
+            else:
+                part = self.tag()
+                # ":{" 这类表情在 NAI 中本身就是括号，不属于格式正确的提示词
+                while any(char in part for char in "{}[]"):
+                    part = self.tag()
+            if rnd.random() < 0.5:
+                layers = rnd.randint(1, 3)
+                opening, closing = rnd.choice((('{', '}'), ('[', ']')))
+                part = opening * layers + part + closing * layers
+            parts.append(part)
+        return self.separator().join(parts)
+
+    def sd(self) -> str:
+        """
+        生成 SD 格式：(tag:weight) 加权标签、带转义括号的标签与普通标签
+        """
+        rnd = self.rnd
+        parts = []
+        for _ in range(rnd.randint(1, 8)):
+            tag = self.tag()
+            roll = rnd.random()
+            if roll < 0.5:
+                weight = rnd.choice((0.0, 0.5, 0.95, 1.0, 1.05, 1.1, 1.15, 1.2, 1.5, 2.0, rnd.uniform(0, 3)))
+                tag = f"({escape_inner_parentheses(tag)}:{weight:.{rnd.randint(0, 3)}f})"
+            elif roll < 0.6:
+                tag = "(" * rnd.randint(1, 3) + tag + ")" * rnd.randint(0, 3)
+            parts.append(tag)
+        return self.separator().join(parts)
+
+    def noise(self) -> str:
+        return ''.join(self.rnd.choice(_NOISE) for _ in range(self.rnd.randint(0, 40)))
+
+    def mutate(self, text: str) -> str:
+        """
+        随机插入、删除或替换少量字符，通常会产生不配对的括号
+        """
+        rnd = self.rnd
+        chars = list(text)
+        for _ in range(rnd.randint(1, 3)):
+            position = rnd.randint(0, len(chars))
+            action = rnd.random()
+            if action < 0.4 or not chars:
+                chars.insert(position, rnd.choice("{}[]()\\,:"))
+            elif action < 0.7:
+                del chars[min(position, len(chars) - 1)]
+            else:
+                chars[min(position, len(chars) - 1)] = rnd.choice(_NOISE)
+        return ''.join(chars)
+
+    def case(self) -> tuple[str, str]:
+        """
+        返回 (生成方式, 提示词)；只有未经破坏的 NAI 提示词参与往返稳定性检查
+        """
+        roll = self.rnd.random()
+        if roll < 0.35:
+            return "nai", self.nai()
+        if roll < 0.55:
+            return "sd", self.sd()
+        if roll < 0.85:
+            return "mutated", self.mutate(self.nai() if self.rnd.random() < 0.5 else self.sd())
+        return "noise", self.noise()
+
+
+def bracket_count(text: str) -> int:
+    """
+    sd_to_nai(text) 最多会为单个标签生成的括号层数
+    """
+    step = Config.WEIGHT_STEP
+    try:
+        nodes = parse_sd(text)
+    except ValueError:
+        return 0  # 权重无法解析（例如 "1.1.4"），转换会直接返回错误信息
+    count = 0
+    for _, weight in nodes:
+        count = max(count, round(abs(weight - 1.0) / step))
+    return count
+
+
+def _timed(function: Callable, argument) -> tuple:
+    start = time.perf_counter()
+    result = function(argument)
+    return result, time.perf_counter() - start
+
+
+def _reference_call(function: Callable, argument):
+    try:
+        return function(argument)
+    except Exception as e:
+        return f"Error: {type(e).__name__}: {e}"
+
+
+# 差分检查项：名称 → (参考实现, 当前实现)
+DIFFERENTIAL = {
+    "nai_to_sd": (reference.nai_to_sd, PromptConverter.nai_to_sd),
+    "sd_to_nai": (reference.sd_to_nai, PromptConverter.sd_to_nai),
+    "parse_and_count_brackets": (reference.parse_and_count_brackets, PromptConverter.parse_and_count_brackets),
+    "escape_inner_parentheses": (reference.escape_inner_parentheses, escape_inner_parentheses),
+    "clean_output": (reference.clean_output, clean_output),
+}
+CHECKS = tuple(DIFFERENTIAL) + ("round_trip",)
+
+
+def round_trip(prompt: str, nai_to_sd: Callable = PromptConverter.nai_to_sd,
+               sd_to_nai: Callable = PromptConverter.sd_to_nai):
+    """
+    nai→sd→nai 往返两次，返回 (第一次往返的结果, 第二次往返的结果)；
+    第一次往返会把权重换算为最接近的括号层数，之后的往返应当不再改变结果。
+    中间结果的括号层数超过 MAX_BRACKETS 时返回 None
+    """
+    results = []
+    current = prompt
+    for _ in range(2):
+        sd = nai_to_sd(current)
+        if bracket_count(sd) > MAX_BRACKETS:
+            return None
+        current = sd_to_nai(sd)
+        results.append(current)
+    return tuple(results)
+
+
+def check(prompt: str, checks=CHECKS, slow_seconds: float = 0.05) -> list:
+    """
+    对一个提示词运行指定的检查项，返回失败列表：
+    [{"check": 检查项, "reason": "mismatch" / "unstable" / "slow", ...}, ...]
+
+    往返检查先与参考实现的往返结果比较，不一致时报告 "mismatch"；一致但两次往返的结果不同时报告 "unstable"，
+    这说明参考实现同样不稳定，属于原有行为而不是改动引入的问题
+    """
+    failures = []
+    blowup = bracket_count(prompt) > MAX_BRACKETS
+    for name in checks:
+        if name == "round_trip":
+            if blowup:
+                continue
+            start = time.perf_counter()
+            results = round_trip(prompt)
+            elapsed = time.perf_counter() - start
+            expected = _reference_call(lambda text: round_trip(text, reference.nai_to_sd, reference.sd_to_nai), prompt)
+            if results != expected:
+                failures.append({"check": name, "reason": "mismatch", "input": prompt,
+                                 "expected": expected, "actual": results})
+            elif results is not None and results[0] != results[1]:
+                failures.append({"check": name, "reason": "unstable", "input": prompt,
+                                 "expected": results[0], "actual": results[1]})
+        else:
+            if name == "sd_to_nai" and blowup:
+                continue
+            reference_function, current_function = DIFFERENTIAL[name]
+            expected = _reference_call(reference_function, prompt)
+            actual, elapsed = _timed(current_function, prompt)
+            if expected != actual:
+                failures.append({"check": name, "reason": "mismatch", "input": prompt,
+                                 "expected": expected, "actual": actual})
+        if elapsed > slow_seconds:
+            failures.append({"check": name, "reason": "slow", "input": prompt, "seconds": elapsed})
+    return failures
+
+
+def _still_fails(failure: dict, slow_seconds: float) -> Callable[[str], bool]:
+    """
+    缩减输入时使用的判定：同一检查项仍以同样的原因失败。耗时问题取三次中最快的一次，减少抖动
+    """
+    name, reason = failure["check"], failure["reason"]
+
+    def predicate(text: str) -> bool:
+        attempts = 3 if reason == "slow" else 1
+        for _ in range(attempts):
+            if not any(item["check"] == name and item["reason"] == reason
+                       for item in check(text, (name,), slow_seconds)):
+                return False
+        return True
+    return predicate
+
+
+def minimize(text: str, predicate: Callable[[str], bool], deadline: float = None) -> str:
+    """
+    用 delta debugging（ddmin）按字符缩减 text，返回仍满足 predicate 的最短输入；
+    超过 deadline（time.monotonic 时间）时返回当前结果
+    """
+    chars = list(text)
+    granularity = 2
+    while len(chars) >= 2:
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        size = max(1, len(chars) // granularity)
+        chunks = [chars[i:i + size] for i in range(0, len(chars), size)]
+        reduced = False
+        for i in range(len(chunks)):
+            # 先尝试只保留一块，再尝试去掉一块
+            for candidate in (chunks[i], [char for j, chunk in enumerate(chunks) if j != i for char in chunk]):
+                if candidate and len(candidate) < len(chars) and predicate(''.join(candidate)):
+                    chars = candidate
+                    granularity = max(granularity - 1, 2) if candidate is not chunks[i] else 2
+                    reduced = True
+                    break
+            if reduced:
+                break
+        if not reduced:
+            if granularity >= len(chars):
+                break
+            granularity = min(granularity * 2, len(chars))
+    return ''.join(chars)
+
+
+def save_fixture(directory: str, failure: dict) -> str:
+    """
+    将（已缩减的）失败用例保存为 JSON，文件名由检查项与输入的 CRC32 组成，相同的输入只保存一次
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = zlib.crc32(failure["input"].encode("utf-8"))
+    path = os.path.join(directory, f"{failure['check']}-{failure['reason']}-{digest:08x}.json")
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(failure, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return path
+
+
+def load_fixtures(directory: str) -> list:
+    """
+    读取目录下保存的全部失败用例，按文件名排序
+    """
+    if not os.path.isdir(directory):
+        return []
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                fixture = json.load(f)
+            fixture["path"] = name
+            fixtures.append(fixture)
+    return fixtures
+
+
+def replay(directory: str, slow_seconds: float) -> list:
+    """
+    回放保存的用例，返回仍然失败的 (用例文件, 失败列表)
+    """
+    failing = []
+    for fixture in load_fixtures(directory):
+        failures = [failure for failure in check(fixture["input"], (fixture["check"],), slow_seconds)
+                    if failure["reason"] == fixture["reason"]]
+        if failures:
+            failing.append((fixture["path"], failures))
+    return failing
+
+
+class FuzzSession:
+    """
+    一次模糊测试：生成用例、检查、缩减并保存失败用例，同时统计各检查项的耗时
+    """
+
+    def __init__(self, seed: int, slow_seconds: float, fixtures_dir: str = None, minimize_seconds: float = 10.0,
+                 strict_round_trip: bool = False):
+        self.generator = PromptGenerator(random.Random(seed))
+        self.slow_seconds = slow_seconds
+        self.strict_round_trip = strict_round_trip
+        self.fixtures_dir = fixtures_dir
+        self.minimize_seconds = minimize_seconds
+        self.cases = 0
+        self.skipped = 0
+        self.kinds = {}
+        self.failures = []
+        # 参考实现同样存在的往返不稳定，只报告不计为失败（strict_round_trip 时计为失败）
+        self.known = []
+        self.seen = set()
+        self.minimized = {}
+        self.slowest = []
+
+    def run_case(self, kind: str, prompt: str):
+        self.cases += 1
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        if bracket_count(prompt) > MAX_BRACKETS:
+            self.skipped += 1
+        checks = CHECKS if kind == "nai" else DIFFERENTIAL
+        start = time.perf_counter()
+        failures = check(prompt, checks, self.slow_seconds)
+        self.slowest.append((time.perf_counter() - start, prompt))
+        if len(self.slowest) > 100:
+            self.slowest = sorted(self.slowest, reverse=True)[:10]
+        for failure in failures:
+            key = (failure["check"], failure["reason"])
+            # 同一类问题只缩减并保存前几个，避免一个缺陷产生大量重复的用例
+            if self.minimized.get(key, 0) >= 3:
+                continue
+            self.minimized[key] = self.minimized.get(key, 0) + 1
+            failure["original_length"] = len(prompt)
+            failure["input"] = minimize(prompt, _still_fails(failure, self.slow_seconds),
+                                        time.monotonic() + self.minimize_seconds)
+            minimized = next((item for item in check(failure["input"], (failure["check"],), self.slow_seconds)
+                              if item["reason"] == failure["reason"]), None)
+            if minimized is not None:
+                failure.update(minimized)
+            if key + (failure["input"],) in self.seen:
+                continue
+            self.seen.add(key + (failure["input"],))
+            if failure["reason"] == "unstable" and not self.strict_round_trip:
+                self.known.append(failure)
+                continue
+            self.failures.append(failure)
+            if self.fixtures_dir:
+                failure["fixture"] = save_fixture(self.fixtures_dir, {k: v for k, v in failure.items() if k != "fixture"})
+
+    def run(self, cases: int, max_seconds: float = None):
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        for _ in range(cases):
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            self.run_case(*self.generator.case())
+
+    def report(self) -> str:
+        lines = [f"用例 {self.cases} 个（{', '.join(f'{kind} {count}' for kind, count in sorted(self.kinds.items()))}），"
+                 f"括号层数超过 {MAX_BRACKETS} 跳过 sd_to_nai {self.skipped} 个，发现问题 {len(self.failures)} 个"]
+        lines.extend(self._format(self.failures))
+        if self.known:
+            lines.append(f"参考实现同样存在的往返不稳定 {len(self.known)} 个（--strict-round-trip 时计为失败）：")
+            lines.extend(self._format(self.known))
+        lines.append("全部检查（含参考实现）耗时最长的用例：")
+        for seconds, prompt in sorted(self.slowest, reverse=True)[:5]:
+            lines.append(f"  {seconds * 1000:8.2f} ms  {prompt[:60]!r}{'...' if len(prompt) > 60 else ''}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format(failures: list) -> list:
+        lines = []
+        for failure in failures:
+            lines.append(f"  [{failure['check']} / {failure['reason']}] {failure['input']!r}")
+            if failure["reason"] == "slow":
+                lines.append(f"      用时 {failure['seconds'] * 1000:.1f} ms")
+            else:
+                lines.append(f"      期望 {failure['expected']!r}")
+                lines.append(f"      实际 {failure['actual']!r}")
+            if failure.get("fixture"):
+                lines.append(f"      已保存到 {failure['fixture']}")
+        return lines
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="提示词转换的差分测试与模糊测试")
+    parser.add_argument("--cases", type=int, default=10000, help="生成的用例数量，默认 10000")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--max-seconds", type=float, default=None, help="最长运行时间（秒）")
+    parser.add_argument("--slow-ms", type=float, default=50.0, help="单次检查超过该耗时（毫秒）视为病态输入，默认 50")
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR, help="保存与回放失败用例的目录")
+    parser.add_argument("--no-save", action="store_true", help="不保存发现的失败用例")
+    parser.add_argument("--strict-round-trip", action="store_true",
+                        help="参考实现同样存在的往返不稳定也计为失败并保存")
+    parser.add_argument("--replay", action="store_true", help="只回放已保存的用例")
+    args = parser.parse_args(argv)
+
+    slow_seconds = args.slow_ms / 1000
+    # 两边都按空的艺术家索引运行，并关闭转换结果缓存，保证每次检查都执行实际转换
+    saved = (PromptConverter.artist_index, PromptConverter.conversion_cache)
+    PromptConverter.artist_index = ArtistIndex(())
+    PromptConverter.configure_cache(0)
+    try:
+        failing = replay(args.fixtures_dir, slow_seconds)
+        for path, failures in failing:
+            for failure in failures:
+                print(f"回放失败 {path}: [{failure['check']} / {failure['reason']}] {failure['input']!r}")
+        if args.replay:
+            print(f"回放 {len(load_fixtures(args.fixtures_dir))} 个用例，失败 {len(failing)} 个")
+            return 1 if failing else 0
+        session = FuzzSession(args.seed, slow_seconds, None if args.no_save else args.fixtures_dir,
+                              strict_round_trip=args.strict_round_trip)
+        session.run(args.cases, args.max_seconds)
+        print(session.report())
+    finally:
+        PromptConverter.artist_index, PromptConverter.conversion_cache = saved
+    return 1 if failing or session.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
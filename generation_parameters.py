@@ -0,0 +1,186 @@
+import json
+import re
+from typing import Optional
+
+# A1111 参数行中的 "键: 值"，值可以是带引号的字符串（例如 Lora hashes）
+_PARAM = re.compile(r'\s*(\w[\w \-/]+):\s*("(?:\\.|[^\\"])+"|[^,]*)(?:,|$)')
+_SIZE = re.compile(r'^\s*(\d+)\s*x\s*(\d+)\s*$')
+_NEGATIVE_PROMPT = "Negative prompt:"
+
+
+class GenerationParameters:
+    """
+    A1111 格式的生成参数（PNG "parameters" 文本块 / JPEG UserComment）：
+
+        正向提示词
+        Negative prompt: 负向提示词
+        Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: 1, Size: 512x768, Model hash: ..., Lora hashes: "a: 1, b: 2"
+
+    parse() 只做一次切分得到正向 / 负向提示词与参数行，参数行中的各字段在首次访问时才解析。
+    """
+    __slots__ = ('raw', 'prompt', 'negative_prompt', '_settings_line', '_settings', '_lora_hashes')
+
+    def __init__(self, raw: str, prompt: str, negative_prompt: str, settings_line: str):
+        self.raw = raw
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self._settings_line = settings_line
+        self._settings = None
+        self._lora_hashes = None
+
+    @classmethod
+    def parse(cls, raw: str) -> "GenerationParameters":
+        """
+        切分参数文本：最后一行包含至少 3 个 "键: 值" 时视为参数行
+        """
+        text = raw.strip()
+        body, _, last_line = text.rpartition("\n")
+        if _is_settings_line(last_line):
+            settings_line = last_line
+        elif not body and _is_settings_line(text):
+            settings_line, body = text, ""
+        else:
+            settings_line, body = "", text
+
+        if body.startswith(_NEGATIVE_PROMPT):
+            prompt, negative_prompt = "", body[len(_NEGATIVE_PROMPT):]
+        else:
+            prompt, marker, negative_prompt = body.partition("\n" + _NEGATIVE_PROMPT)
+            if not marker:
+                negative_prompt = ""
+        return cls(raw, prompt.strip(), negative_prompt.strip(), settings_line)
+
+    @property
+    def settings(self) -> dict:
+        """
+        参数行中的全部字段 {键: 原始字符串值}，首次访问时解析
+        """
+        if self._settings is None:
+            settings = {}
+            for key, value in _PARAM.findall(self._settings_line):
+                if value[:1] == '"' and value[-1:] == '"':
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        value = value[1:-1]
+                settings[key.strip()] = value.strip()
+            self._settings = settings
+        return self._settings
+
+    def get(self, key: str, default=None):
+        return self.settings.get(key, default)
+
+    @property
+    def steps(self) -> Optional[int]:
+        return _to_int(self.get("Steps"))
+
+    @property
+    def sampler(self) -> Optional[str]:
+        return self.get("Sampler")
+
+    @property
+    def schedule_type(self) -> Optional[str]:
+        return self.get("Schedule type")
+
+    @property
+    def cfg_scale(self) -> Optional[float]:
+        return _to_float(self.get("CFG scale"))
+
+    @property
+    def seed(self) -> Optional[int]:
+        return _to_int(self.get("Seed"))
+
+    @property
+    def size(self) -> Optional[tuple]:
+        """
+        (宽, 高)
+        """
+        match = _SIZE.match(self.get("Size") or "")
+        return (int(match.group(1)), int(match.group(2))) if match else None
+
+    @property
+    def width(self) -> Optional[int]:
+        size = self.size
+        return size[0] if size else None
+
+    @property
+    def height(self) -> Optional[int]:
+        size = self.size
+        return size[1] if size else None
+
+    @property
+    def model_hash(self) -> Optional[str]:
+        return self.get("Model hash")
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.get("Model")
+
+    @property
+    def denoising_strength(self) -> Optional[float]:
+        return _to_float(self.get("Denoising strength"))
+
+    @property
+    def clip_skip(self) -> Optional[int]:
+        return _to_int(self.get("Clip skip"))
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.get("Version")
+
+    @property
+    def lora_hashes(self) -> dict:
+        """
+        {LoRA 名称: 哈希}，由 "Lora hashes" 字段解析
+        """
+        if self._lora_hashes is None:
+            hashes = {}
+            for item in (self.get("Lora hashes") or "").split(","):
+                name, sep, value = item.rpartition(":")
+                if sep and name.strip():
+                    hashes[name.strip()] = value.strip()
+            self._lora_hashes = hashes
+        return self._lora_hashes
+
+    def to_dict(self) -> dict:
+        """
+        转换为可序列化为 JSON 的字典，数值字段转换为对应类型
+        """
+        result = {"Prompt": self.prompt, "Negative prompt": self.negative_prompt}
+        for key, value in self.settings.items():
+            result[key] = value
+        for key, value in (("Steps", self.steps), ("CFG scale", self.cfg_scale), ("Seed", self.seed),
+                           ("Denoising strength", self.denoising_strength), ("Clip skip", self.clip_skip)):
+            if value is not None:
+                result[key] = value
+        if self.size:
+            result["Size"] = {"width": self.width, "height": self.height}
+        if self.lora_hashes:
+            result["Lora hashes"] = self.lora_hashes
+        return result
+
+    def __repr__(self) -> str:
+        return f"<GenerationParameters prompt={self.prompt[:40]!r}>"
+
+
+def _is_settings_line(line: str) -> bool:
+    """
+    与 A1111 的判断方式一致：至少包含 3 个 "键: 值"
+    """
+    if line.startswith("Steps: "):
+        return True
+    return len(_PARAM.findall(line)) >= 3
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -1,11 +1,66 @@
+import asyncio
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
+import metrics
 from config import Config
 from prompt_converter import PromptConverter
 from metadata_extractor import MetadataExtractor
+from prompt_index import PromptIndex
+import tag_analytics
 
 class GradioInterface:
     def __init__(self):
-        self.demo = self._create_interface()
+        self.search_index = None
+        # 轻量请求与耗时请求分别在独立的线程池中运行，大图提取不会占用转换的线程
+        self.convert_executor = ThreadPoolExecutor(max_workers=Config.CONVERT_CONCURRENCY,
+                                                   thread_name_prefix="convert")
+        self.extract_executor = ThreadPoolExecutor(max_workers=Config.EXTRACT_CONCURRENCY,
+                                                   thread_name_prefix="extract")
+        self._demo = None
+
+    @property
+    def demo(self) -> gr.Blocks:
+        """
+        界面在首次访问时才构建，只使用处理函数时不必创建整个组件树
+        """
+        return self.build()
+
+    def build(self) -> gr.Blocks:
+        """
+        构建界面（只构建一次），可在 launch 之前调用以提前完成构建
+        """
+        if self._demo is None:
+            self._demo = self._create_interface()
+        return self._demo
+
+    @staticmethod
+    def _offload(executor: ThreadPoolExecutor, fn):
+        """
+        将同步的处理函数包装为异步函数，在指定线程池中运行，不阻塞事件循环
+        """
+        async def handler(*args):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, fn, *args)
+        handler.__name__ = getattr(fn, "__name__", "handler")
+        handler.__signature__ = inspect.signature(fn)
+        return handler
+
+    def _convert_event(self, fn) -> dict:
+        """
+        转换 / 检索等轻量请求的事件参数
+        """
+        return dict(fn=self._offload(self.convert_executor, fn),
+                    concurrency_id="convert", concurrency_limit=Config.CONVERT_CONCURRENCY)
+
+    def _extract_event(self, fn) -> dict:
+        """
+        元数据提取 / 加载索引等耗时请求的事件参数
+        """
+        return dict(fn=self._offload(self.extract_executor, fn),
+                    concurrency_id="extract", concurrency_limit=Config.EXTRACT_CONCURRENCY)
 
     def _create_converter_tab(self):
         """
@@ -39,12 +94,12 @@ class GradioInterface:
                 
                 # 绑定转换按钮事件
                 nai_to_sd_btn.click(
-                    fn=PromptConverter.nai_to_sd,
+                    **self._convert_event(metrics.request_handler("nai_to_sd")(PromptConverter.nai_to_sd)),
                     inputs=[nai_input],
                     outputs=[sd_input]
                 )
                 sd_to_nai_btn.click(
-                    fn=PromptConverter.sd_to_nai,
+                    **self._convert_event(metrics.request_handler("sd_to_nai")(PromptConverter.sd_to_nai)),
                     inputs=[sd_input],
                     outputs=[nai_input]
                 )
@@ -69,6 +124,24 @@ class GradioInterface:
                 nai_reset_btn.click(fn=lambda: "", outputs=[nai_input])
                 sd_reset_btn.click(fn=lambda: "", outputs=[sd_input])
 
+            # 转换结果缓存统计（缓存未启用时各项为 0）
+            with gr.Accordion("缓存统计", open=False):
+                cache_stats = gr.JSON(label="转换结果缓存")
+                cache_stats_btn = gr.Button("刷新")
+                cache_stats_btn.click(
+                    **self._convert_event(PromptConverter.cache_stats),
+                    outputs=[cache_stats],
+                    api_name="cache_stats"
+                )
+
+    @staticmethod
+    @metrics.request_handler("extract_metadata")
+    def _extract_metadata(file_path: str) -> dict:
+        """
+        提取元数据并将生成参数展开为各个字段，便于在 JSON 视图中查看
+        """
+        return MetadataExtractor.extract_metadata_dict(file_path)
+
     def _create_metadata_tab(self):
         """
         创建图片元数据探测器标签页
@@ -88,11 +161,133 @@ class GradioInterface:
                         height=500
                     )
                     img_input.change(
-                        fn=MetadataExtractor.extract_metadata,
+                        **self._extract_event(self._extract_metadata),
                         inputs=[img_input],
                         outputs=[meta_output]
                     )
 
+    @metrics.request_handler("load_search_index")
+    def _load_search_index(self, source: str) -> str:
+        """
+        加载检索索引：支持 metadata_scanner 的输出（.jsonl / .sqlite）或保存的索引文件（.idx）
+        """
+        source = (source or "").strip()
+        if not source or not os.path.exists(source):
+            return "文件不存在或无效"
+        try:
+            start = time.perf_counter()
+            if source.lower().endswith('.idx'):
+                index = PromptIndex.load(source)
+            else:
+                index = PromptIndex.from_scan_results(source)
+            self.search_index = index
+            return f"已加载 {len(index)} 张图片、{len(index.tags)} 个 tag，用时 {time.perf_counter() - start:.2f} 秒"
+        except Exception as e:
+            return f"加载失败: {str(e)}"
+
+    @metrics.request_handler("search")
+    def _search(self, query: str) -> tuple:
+        """
+        在已加载的索引中检索
+        """
+        if self.search_index is None:
+            return [], "请先加载索引"
+        start = time.perf_counter()
+        paths = self.search_index.search(query or "")
+        elapsed = (time.perf_counter() - start) * 1000
+        return paths[:Config.SEARCH_RESULT_LIMIT], f"共 {len(paths)} 条结果，用时 {elapsed:.1f} ms"
+
+    def _create_search_tab(self):
+        """
+        创建提示词检索标签页
+        """
+        with gr.Tab("提示词检索"):
+            gr.Markdown("## 🔍 按 tag 检索已扫描的图片")
+            with gr.Row():
+                source_input = gr.Textbox(
+                    label="扫描结果 / 索引文件",
+                    placeholder="metadata_scanner 输出的 .jsonl / .sqlite，或保存的 .idx 索引文件",
+                    scale=4
+                )
+                load_btn = gr.Button("📂 加载索引", scale=1)
+            index_status = gr.Markdown()
+            with gr.Row():
+                query_input = gr.Textbox(
+                    label="查询",
+                    placeholder="例如：1girl, artist:foo>1.1, cat | dog, -monochrome",
+                    scale=4
+                )
+                search_btn = gr.Button("检索", scale=1)
+            search_status = gr.Markdown()
+            search_output = gr.JSON(label="匹配的图片")
+
+            load_btn.click(
+                **self._extract_event(self._load_search_index),
+                inputs=[source_input],
+                outputs=[index_status]
+            )
+            search_btn.click(
+                **self._convert_event(self._search),
+                inputs=[query_input],
+                outputs=[search_output, search_status]
+            )
+            query_input.submit(
+                **self._convert_event(self._search),
+                inputs=[query_input],
+                outputs=[search_output, search_status]
+            )
+
+    @staticmethod
+    @metrics.request_handler("analyze_tags")
+    def _analyze_tags(source: str, syntax: str, scan: bool, top: int) -> tuple:
+        """
+        统计提示词文件或 metadata_scanner 扫描结果中的 tag
+        """
+        source = (source or "").strip()
+        if not source or not os.path.exists(source):
+            return "文件不存在或无效", None
+        try:
+            start = time.perf_counter()
+            if scan or source.lower().endswith(('.sqlite', '.db')):
+                prompts = tag_analytics.iter_scan_prompts(source)
+            else:
+                prompts = tag_analytics.iter_prompt_file(source, syntax)
+            stats = tag_analytics.analyze(prompts)
+            status = (f"共 {stats.prompts} 条提示词、{len(stats.tags)} 个 tag，"
+                      f"用时 {time.perf_counter() - start:.2f} 秒")
+            if stats.approximate:
+                status += "（共现对为近似统计）"
+            return status, stats.report(int(top))
+        except Exception as e:
+            return f"统计失败: {str(e)}", None
+
+    def _create_stats_tab(self):
+        """
+        创建标签统计标签页
+        """
+        with gr.Tab("标签统计"):
+            gr.Markdown("## 📊 tag 频率、平均权重与共现")
+            with gr.Row():
+                stats_source = gr.Textbox(
+                    label="提示词文件 / 扫描结果",
+                    placeholder="TXT / JSONL / CSV 提示词文件，或 metadata_scanner 输出的 .jsonl / .sqlite",
+                    scale=4
+                )
+                stats_btn = gr.Button("📊 开始统计", scale=1)
+            with gr.Row():
+                stats_syntax = gr.Radio(choices=list(tag_analytics.SYNTAXES), value="sd", label="提示词语法")
+                stats_scan = gr.Checkbox(label="metadata_scanner 扫描结果", value=False)
+                stats_top = gr.Slider(minimum=10, maximum=500, step=10, value=Config.ANALYTICS_TOP_K,
+                                      label="每类显示条目数")
+            stats_status = gr.Markdown()
+            stats_output = gr.JSON(label="统计报告")
+
+            stats_btn.click(
+                **self._extract_event(self._analyze_tags),
+                inputs=[stats_source, stats_syntax, stats_scan, stats_top],
+                outputs=[stats_status, stats_output]
+            )
+
     def _create_interface(self) -> gr.Blocks:
         """
         创建Gradio整体界面
@@ -102,6 +297,8 @@ class GradioInterface:
             with gr.Tabs():
                 self._create_converter_tab()
                 self._create_metadata_tab()
+                self._create_search_tab()
+                self._create_stats_tab()
             gr.Markdown(
                 f"<div style='text-align: center; margin-top: 20px;'>"
                 f"Powered by <a href='https://github.com/StarAsh042' target='_blank'>StarAsh042</a> | "
@@ -111,13 +308,42 @@ class GradioInterface:
 
     def launch(self):
         """
-        启动Gradio界面
+        启动Gradio界面（启用耗时统计时同时提供 /metrics）
         """
-        self.demo.launch(
+        options = dict(
             server_port=Config.DEFAULT_PORT,
             server_name="127.0.0.1",
             show_error=True,
             share=False,
             inbrowser=True,
             max_threads=Config.MAX_THREADS
-        ) 
\ No newline at end of file
+        )
+        # 请求队列：超过 QUEUE_MAX_SIZE 时拒绝新请求，各事件的并发数由其所在的并发组限制
+        self.demo.queue(max_size=Config.QUEUE_MAX_SIZE, default_concurrency_limit=Config.CONVERT_CONCURRENCY)
+        if not Config.METRICS_ENABLED:
+            self.demo.launch(**options)
+            return
+        # Gradio 的 FastAPI 应用在 launch 时才创建，先以非阻塞方式启动，挂载路由后再阻塞主线程
+        self.demo.launch(prevent_thread_lock=True, **options)
+        self._mount_metrics(self.demo.app)
+        self.demo.block_thread()
+
+    @staticmethod
+    def _mount_metrics(app):
+        """
+        在 Gradio 的 FastAPI 应用上挂载 /metrics（Prometheus 文本格式）与 /metrics/profile（开关性能分析）
+        """
+        from fastapi.responses import PlainTextResponse
+
+        def metrics_endpoint():
+            return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+        def profile_endpoint(enable: bool):
+            metrics.set_profiling(enable)
+            return {"profiling": metrics.profiling_enabled(), "directory": Config.PROFILE_DIR}
+
+        app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+        app.add_api_route("/metrics/profile", profile_endpoint, methods=["POST"])
+        # 放到路由表最前面，避免被 Gradio 已注册的通配路由截获
+        routes = app.router.routes
+        routes[:0] = [routes.pop(), routes.pop()] 
\ No newline at end of file
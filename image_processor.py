@@ -1,11 +1,40 @@
 from pathlib import Path
-from PIL import Image
-import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator
+import atexit
+import io
 import os
+import tempfile
+import threading
+from config import Config
 from logging_config import setup_logging
 
 logger = setup_logging()
 
+# create_temp_image 创建的临时文件：路径 → 大小（按创建顺序）
+_temp_files = OrderedDict()
+_temp_lock = threading.Lock()
+
+
+def _remove_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+@atexit.register
+def _cleanup_temp_files():
+    """
+    程序退出时删除所有临时图片
+    """
+    with _temp_lock:
+        for path in _temp_files:
+            _remove_file(path)
+        _temp_files.clear()
+
+
 class ImageProcessor:
     @staticmethod
     def validate_image(image: any) -> bool:
@@ -16,20 +45,101 @@ class ImageProcessor:
             return False
         if isinstance(image, (str, Path)):
             return Path(image).exists()
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return len(image) > 0
         return True
 
+    @staticmethod
+    def as_source(image_data: any):
+        """
+        转换为 MetadataExtractor.extract_metadata 可以直接读取的输入，不写入磁盘：
+        路径、bytes / memoryview 与文件对象原样返回，numpy 数组在内存中编码为 PNG。
+        """
+        if isinstance(image_data, Path):
+            return str(image_data)
+        if isinstance(image_data, (str, bytes, bytearray, memoryview)) or hasattr(image_data, 'read'):
+            return image_data
+        return ImageProcessor._encode_png(image_data)
+
+    @staticmethod
+    def _encode_png(image_array) -> io.BytesIO:
+        """
+        将 numpy 数组编码为内存中的 PNG（数组本身不包含元数据）
+        """
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.fromarray(image_array).save(buffer, format='PNG')
+        buffer.seek(0)
+        return buffer
+
+    @staticmethod
+    @contextmanager
+    def spool(chunks: Iterable[bytes], limit: int = Config.MAX_IMAGE_SIZE) -> Iterator[BinaryIO]:
+        """
+        将上传的数据流写入 SpooledTemporaryFile：不超过 Config.SPOOL_MEMORY_SIZE 时只保存在内存中，
+        超过后才写入临时文件。总大小超过 limit 时抛出 ValueError；退出时关闭，临时文件随之删除。
+        """
+        spooled = tempfile.SpooledTemporaryFile(max_size=Config.SPOOL_MEMORY_SIZE)
+        try:
+            total = 0
+            for chunk in chunks:
+                total += len(chunk)
+                if total > limit:
+                    raise ValueError(f"上传的数据超过 {limit} 字节")
+                spooled.write(chunk)
+            spooled.seek(0)
+            yield spooled
+        finally:
+            spooled.close()
+
     @staticmethod
     def create_temp_image(image_data: any) -> str:
         """
-        创建临时图片文件，保存为 PNG 格式
+        返回图片文件的路径：传入路径时直接返回，不创建临时文件；
+        bytes / 文件对象原样写入临时文件，numpy 数组编码为 PNG 后写入。
+        临时文件总大小超过 Config.TEMP_IMAGE_BYTES 时删除最早创建的文件，程序退出时全部删除。
+        只需读取元数据时应使用 as_source，不必写入磁盘。
         """
+        if isinstance(image_data, (str, Path)):
+            return str(image_data)
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-                if isinstance(image_data, (str, Path)):
-                    return str(image_data)
-                img = Image.fromarray(image_data)
-                img.save(tmp.name)
-                return tmp.name
+            if isinstance(image_data, (bytes, bytearray, memoryview)):
+                data = bytes(image_data)
+            elif hasattr(image_data, 'read'):
+                data = image_data.read()
+            else:
+                data = ImageProcessor._encode_png(image_data).getvalue()
+            fd, path = tempfile.mkstemp(prefix='sd_prompt_', suffix='.png')
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            ImageProcessor._track_temp_file(path, len(data))
+            return path
         except Exception as e:
-            logger.error(f"创建临时图片失败: {e}")
-            return None 
\ No newline at end of file
+            logger.error("创建临时图片失败: %s", e)
+            return None
+
+    @staticmethod
+    def release_temp_image(path: str):
+        """
+        删除 create_temp_image 创建的临时文件（传入其他路径时不做任何操作）
+        """
+        with _temp_lock:
+            if _temp_files.pop(path, None) is None:
+                return
+        _remove_file(path)
+
+    @staticmethod
+    def _track_temp_file(path: str, size: int):
+        """
+        记录临时文件，总大小超过上限时删除最早创建的文件
+        """
+        expired = []
+        with _temp_lock:
+            _temp_files[path] = size
+            total = sum(_temp_files.values())
+            while total > Config.TEMP_IMAGE_BYTES and len(_temp_files) > 1:
+                old_path, old_size = _temp_files.popitem(last=False)
+                total -= old_size
+                expired.append(old_path)
+        for old_path in expired:
+            _remove_file(old_path)
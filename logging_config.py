@@ -1,25 +1,105 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import Config
 
-def setup_logging() -> logging.Logger:
+_setup_lock = threading.Lock()
+_configured = False
+_listener = None
+_queue_handler = None
+
+
+class _DeferredQueueHandler(QueueHandler):
     """
-    配置日志记录，使用 RotatingFileHandler 防止日志文件过大。
+    同进程内的队列处理器：记录原样放入队列，消息格式化推迟到后台线程中进行
     """
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 
+def _stop_listener():
+    """
+    程序退出时停止后台线程，写完队列中剩余的日志
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _create_handlers(level: int) -> list:
+    """
+    创建控制台与文件处理器
+    """
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
     # 控制台处理器
     ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
+    ch.setLevel(max(level, logging.INFO))
     ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    handlers = [ch]
 
     # 文件处理器，单个日志文件最大 1MB，最多保留 5 个备份
-    fh = RotatingFileHandler('app.log', maxBytes=1*1024*1024, backupCount=5, encoding='utf-8')
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    if Config.LOG_FILE:
+        fh = RotatingFileHandler(Config.LOG_FILE, maxBytes=1*1024*1024, backupCount=5, encoding='utf-8')
+        fh.setLevel(level)
+        fh.setFormatter(formatter)
+        handlers.append(fh)
+    return handlers
+
+
+def _after_fork_in_child():
+    """
+    fork 出的子进程（例如 ProcessPoolExecutor 的工作进程）只继承了队列，没有继承后台线程，
+    写入队列的日志不会被输出。子进程中改为直接由处理器同步写入，
+    进程池的工作进程通过 os._exit 退出、不会执行 atexit，同步写入也不会丢失最后的日志
+    """
+    global _setup_lock, _listener, _queue_handler
+    _setup_lock = threading.Lock()
+    _listener = None
+    if _queue_handler is None:
+        return
+    logger = logging.getLogger(__name__)
+    logger.removeHandler(_queue_handler)
+    _queue_handler = None
+    for handler in _create_handlers(logger.level):
+        logger.addHandler(handler)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def setup_logging() -> logging.Logger:
+    """
+    配置日志记录，使用 RotatingFileHandler 防止日志文件过大。
+
+    可以重复调用：只在首次调用时添加处理器，之后直接返回同一个 logger。
+    日志记录通过 QueueHandler 放入队列，由 QueueListener 在后台线程中写入控制台与日志文件，
+    调用方线程不做格式化和文件 I/O；fork 出的子进程改为同步写入，见 _after_fork_in_child。
+    日志级别与文件路径见 Config.LOG_LEVEL / Config.LOG_FILE，LOG_FILE 为空时不写文件。
+    """
+    global _configured, _listener, _queue_handler
+    logger = logging.getLogger(__name__)
+    with _setup_lock:
+        if _configured:
+            return logger
+
+        level = logging.getLevelName(str(Config.LOG_LEVEL).upper())
+        if not isinstance(level, int):
+            level = logging.DEBUG
+        logger.setLevel(level)
+
+        log_queue = queue.SimpleQueue()
+        _queue_handler = _DeferredQueueHandler(log_queue)
+        logger.addHandler(_queue_handler)
+        _listener = QueueListener(log_queue, *_create_handlers(level), respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+        _configured = True
 
-    return logger 
\ No newline at end of file
+    return logger
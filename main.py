@@ -1,15 +1,44 @@
-from gradio_interface import GradioInterface
+import argparse
+import sys
+import time
+from config import Config
 from logging_config import setup_logging
 
 logger = setup_logging()
 
-def main():
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="SD提示词工具集")
+    parser.add_argument("--prewarm", action="store_true", default=Config.PREWARM_ARTIST_INDEX,
+                        help="启动时在后台线程加载艺术家索引")
+    parser.add_argument("--startup-report", nargs="*", metavar="MODULE",
+                        help="统计入口模块（默认全部）的导入耗时后退出，类似 python -X importtime")
+    parser.add_argument("--startup-budget", type=float, default=Config.STARTUP_BUDGET_MS,
+                        help="导入耗时预算（毫秒），配合 --startup-report 使用，超出时返回非零退出码")
+    args = parser.parse_args(argv)
+
+    if args.startup_report is not None:
+        import startup
+        modules = args.startup_report or startup.ENTRY_MODULES
+        reports = [startup.import_time_report(module) for module in modules]
+        print(startup.format_report(reports, args.startup_budget))
+        return 1 if startup.over_budget(reports, args.startup_budget) else 0
+
     try:
+        start = time.perf_counter()
+        if args.prewarm:
+            import startup
+            startup.prewarm_artist_index()
+        # Gradio 只在启动界面时导入；只需要 HTTP 接口时可直接运行 api_server.py
+        from gradio_interface import GradioInterface
         interface = GradioInterface()
+        # 在启动前构建界面，统计导入与构建的总耗时
+        interface.build()
+        logger.info("界面初始化完成，用时 %.2f 秒", time.perf_counter() - start)
         interface.launch()
     except Exception as e:
         logger.exception("程序启动失败")
         raise
+    return 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -1,83 +1,597 @@
 import struct
 import re
 import os
-from PIL import Image
+import json
+import zlib
+import hashlib
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+from config import Config
+from cache import LRUCache
+from metrics import span
+from generation_parameters import GenerationParameters
 from logging_config import setup_logging
 
 logger = setup_logging()
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_TEXT_CHUNKS = (b'tEXt', b'zTXt', b'iTXt')
+# 提示词相关的文本块关键字（小写）
+PROMPT_KEYS = ('prompt', 'description', 'parameters')
+# PNG 规定关键字最长 79 字节，加上分隔用的 NUL
+_PNG_KEYWORD_MAX = 80
+_UNPARSED = object()
+
+class PngText:
+    """
+    PNG 文本块（tEXt / zTXt / iTXt）。
+
+    压缩内容在首次访问 text 时才增量解压，解压结果不超过 Config.MAX_TEXT_CHUNK_SIZE；
+    JSON 内容（例如 ComfyUI 的 workflow / prompt）在首次调用 json() 时才解析。
+    """
+    __slots__ = ('keyword', 'chunk_type', 'language', 'translated_keyword',
+                 '_data', '_compressed', '_utf8', '_text', '_json')
+
+    def __init__(self, chunk_type: bytes, content: bytes):
+        self.chunk_type = chunk_type.decode('ascii')
+        self.language = ''
+        self.translated_keyword = ''
+        self._text = None
+        self._json = _UNPARSED
+        keyword, _, rest = content.partition(b'\x00')
+        self.keyword = keyword.decode('latin1')
+        if chunk_type == b'tEXt':
+            self._compressed = False
+            self._utf8 = False
+            self._data = rest
+        elif chunk_type == b'zTXt':
+            # 1 字节压缩方式（0 = deflate），随后为压缩数据
+            self._compressed = True
+            self._utf8 = False
+            self._data = rest[1:]
+        else:
+            # iTXt：压缩标志、压缩方式、语言标签 NUL、翻译后的关键字 NUL、UTF-8 文本
+            self._compressed = rest[:1] == b'\x01'
+            self._utf8 = True
+            language, _, rest = rest[2:].partition(b'\x00')
+            translated, _, rest = rest.partition(b'\x00')
+            self.language = language.decode('ascii', 'ignore')
+            self.translated_keyword = translated.decode('utf-8', 'ignore')
+            self._data = rest
+
+    @property
+    def text(self) -> str:
+        """
+        解码后的文本内容
+        """
+        if self._text is None:
+            data = self._data
+            if self._compressed:
+                data = _inflate(data, Config.MAX_TEXT_CHUNK_SIZE)
+            if self._utf8:
+                self._text = data.decode('utf-8', 'ignore')
+            else:
+                # 规范要求 Latin-1，但很多生成工具直接写入 UTF-8
+                try:
+                    self._text = data.decode('utf-8')
+                except UnicodeDecodeError:
+                    self._text = data.decode('latin1')
+            self._data = None
+        return self._text
+
+    def json(self):
+        """
+        将文本内容解析为 JSON，结果会被缓存；内容不是合法 JSON 时返回 None
+        """
+        if self._json is _UNPARSED:
+            try:
+                self._json = json.loads(self.text)
+            except ValueError:
+                self._json = None
+        return self._json
+
+    def __repr__(self) -> str:
+        return f"<PngText {self.chunk_type} {self.keyword!r}>"
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+EXIF_IFD_POINTER = 0x8769
+EXIF_USER_COMMENT = 0x9286
+# TIFF 数据类型对应的字节数
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+# A1111 风格参数文本的特征
+_A1111_MARKERS = re.compile(r'(?:^|\n)(?:Negative prompt:|Steps: )')
+_LABELLED_FIELD = re.compile(r'^[ \t]*(prompt|description):[ \t]*', re.IGNORECASE | re.MULTILINE)
+_XMP_DESCRIPTION = re.compile(r'<dc:description\b.*?<rdf:li\b[^>]*>(.*?)</rdf:li>', re.DOTALL)
+_XMP_USER_COMMENT = re.compile(r'<exif:UserComment\b.*?<rdf:li\b[^>]*>(.*?)</rdf:li>', re.DOTALL)
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> dict:
+    """
+    读取 TIFF IFD，返回 {标签: 原始字节值}
+    """
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    pos = offset + 2
+    for _ in range(count):
+        entry = tiff[pos:pos + 12]
+        if len(entry) < 12:
+            break
+        tag, value_type, value_count = struct.unpack(endian + 'HHI', entry[:8])
+        size = _TIFF_TYPE_SIZES.get(value_type, 1) * value_count
+        if size <= 4:
+            entries[tag] = entry[8:8 + size]
+        else:
+            value_offset = struct.unpack(endian + 'I', entry[8:12])[0]
+            entries[tag] = tiff[value_offset:value_offset + size]
+        pos += 12
+    return entries
+
+def _decode_user_comment(raw: bytes) -> str:
+    """
+    按 EXIF UserComment 前 8 字节的字符集标识解码
+    """
+    prefix, body = raw[:8], raw[8:]
+    if prefix == b'UNICODE\x00':
+        if body[:2] == b'\xfe\xff':
+            encoding, body = 'utf-16-be', body[2:]
+        elif body[:2] == b'\xff\xfe':
+            encoding, body = 'utf-16-le', body[2:]
+        # 没有 BOM 时根据高位零字节的位置判断字节序（提示词以 ASCII 字符为主）
+        elif body[0::2].count(0) >= body[1::2].count(0):
+            encoding = 'utf-16-be'
+        else:
+            encoding = 'utf-16-le'
+        text = body.decode(encoding, 'ignore')
+    elif prefix == b'ASCII\x00\x00\x00':
+        text = _decode_text(body)
+    elif prefix == b'JIS\x00\x00\x00\x00\x00':
+        text = body.decode('shift_jis', 'ignore')
+    elif prefix == b'\x00' * 8:
+        text = _decode_text(body)
+    else:
+        text = _decode_text(raw)
+    return text.strip('\x00').strip()
+
+def _decode_text(data: bytes) -> str:
+    """
+    按 UTF-8 解码，失败时退回 Latin-1
+    """
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin1')
+
+def _classify_comment(text: str, metadata: dict):
+    """
+    将注释文本归类为提示词字段，已有的字段不会被覆盖：
+      - JSON 对象：读取其中的 prompt / description / parameters；
+      - A1111 格式（含 "Negative prompt:" 或 "Steps:" 行）：整体作为 Parameters；
+      - 以 "prompt:" / "description:" 开头的行：各自读取到下一个标签为止；
+      - 其他文本整体作为 Parameters。
+    """
+    text = text.strip('\x00').strip()
+    if not text:
+        return
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if key.lower() in PROMPT_KEYS and isinstance(value, str):
+                    metadata.setdefault(key.lower().capitalize(), value)
+            return
+    if _A1111_MARKERS.search(text):
+        metadata.setdefault('Parameters', text)
+        return
+    fields = list(_LABELLED_FIELD.finditer(text))
+    if fields:
+        for field, following in zip(fields, fields[1:] + [None]):
+            end = following.start() if following else len(text)
+            metadata.setdefault(field.group(1).capitalize(), text[field.end():end].strip())
+        return
+    metadata.setdefault('Parameters', text)
+
+def _unescape_xml(text: str) -> str:
+    """
+    还原 XML 实体（与 xml.sax.saxutils.unescape 加上 &quot; / &apos; 的结果相同，不导入 xml / urllib 模块）
+    """
+    text = text.replace("&lt;", "<").replace("&gt;", ">")
+    text = text.replace("&quot;", '"').replace("&apos;", "'")
+    return text.replace("&amp;", "&")
+
+def _parse_xmp(xmp: str, metadata: dict):
+    """
+    从 XMP 数据包中读取 exif:UserComment 与 dc:description
+    """
+    match = _XMP_USER_COMMENT.search(xmp)
+    if match:
+        _classify_comment(_unescape_xml(match.group(1)), metadata)
+    match = _XMP_DESCRIPTION.search(xmp)
+    if match:
+        metadata.setdefault('Description', _unescape_xml(match.group(1)).strip())
+
+def _inflate(data: bytes, limit: int) -> bytes:
+    """
+    增量解压 zlib 数据，输出超过 limit 字节时截断
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        out = decompressor.decompress(data, limit)
+    except zlib.error:
+        logger.warning("PNG文本块解压失败")
+        return b''
+    if decompressor.unconsumed_tail:
+        logger.warning("PNG文本块解压后超过 %d 字节，已截断", limit)
+    return out
+
+_BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+class _BufferReader:
+    """
+    bytes / bytearray / memoryview 上的只读文件对象。
+    read 只复制请求的字节，seek 跳过的部分（例如 IDAT 图像数据）不会被复制。
+    """
+    __slots__ = ('_view', '_pos')
+
+    def __init__(self, data):
+        view = memoryview(data)
+        self._view = view if view.format == 'B' and view.ndim == 1 else view.cast('B')
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        start = self._pos
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), start + size)
+        if end <= start:
+            return b''
+        self._pos = end
+        return self._view[start:end].tobytes()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+
 class MetadataExtractor:
     @staticmethod
-    def _parse_png_metadata(file_path: str) -> dict:
+    def _sniff_format(f: BinaryIO) -> Optional[str]:
         """
-        解析PNG图片中的元数据
+        根据文件头的魔数判断图片格式，无法识别时返回 None
+        """
+        head = f.read(12)
+        f.seek(0)
+        if head.startswith(PNG_SIGNATURE):
+            return 'PNG'
+        if head.startswith(b'\xff\xd8\xff'):
+            return 'JPEG'
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'WEBP'
+        return None
+
+    @staticmethod
+    def _read_png_text_chunks(f: BinaryIO, keys: tuple = None) -> dict:
+        """
+        流式读取PNG文本块，返回 {关键字: PngText}。
+
+        只读取 8 字节的块头和文本块内容，其余块（包括 IDAT 图像数据）直接跳过；
+        keys 为需要的关键字（小写），不在其中的文本块只读取关键字部分，其余内容直接跳过。
+        在已找到 PROMPT_KEYS 中的文本块后遇到第一个 IDAT 即停止。
+        """
+        chunks = {}
+        found_prompt = False
+        f.seek(Config.PNG_HEADER_LENGTH)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type in PNG_TEXT_CHUNKS:
+                # 单个文本块最多读取 Config.MAX_TEXT_CHUNK_SIZE 字节
+                size = min(length, Config.MAX_TEXT_CHUNK_SIZE)
+                content = f.read(min(size, _PNG_KEYWORD_MAX))
+                key = content.split(b'\x00', 1)[0].decode('latin1').lower()
+                if keys is None or key in keys:
+                    content += f.read(size - len(content))
+                    chunks[key] = PngText(chunk_type, content)
+                    found_prompt = found_prompt or key in PROMPT_KEYS
+                # 跳过未读取的部分和 CRC
+                f.seek(length - len(content) + Config.CHUNK_LENGTH_SIZE, os.SEEK_CUR)
+            elif chunk_type == b'IEND' or (chunk_type == b'IDAT' and found_prompt):
+                break
+            else:
+                f.seek(length + Config.CHUNK_LENGTH_SIZE, os.SEEK_CUR)
+        return chunks
+
+    @staticmethod
+    @span("parse_png_metadata")
+    def _parse_png_stream(f: BinaryIO) -> dict:
+        """
+        从PNG文件流中解析提示词相关的文本块
         """
         metadata = {}
         try:
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            offset = 8  # PNG header长度
-            while offset < len(data) - 4:
-                length = struct.unpack('>I', data[offset:offset+4])[0]
-                chunk_type = data[offset+4:offset+8].decode('ascii', 'ignore')
-                chunk_end = offset + 8 + length + 4
-                if chunk_type in ['tEXt', 'iTXt']:
-                    content = data[offset+8:chunk_end-4]
-                    parts = content.split(b'\x00', 1)
-                    if len(parts) == 2:
-                        key = parts[0].decode('latin1', 'ignore').lower()
-                        value = parts[1].decode('utf-8', 'ignore').strip('\x00')
-                        if key in ['prompt', 'description', 'parameters']:
-                            metadata[key.capitalize()] = value
-                offset = chunk_end
+            chunks = MetadataExtractor._read_png_text_chunks(f, PROMPT_KEYS)
+            for key, chunk in chunks.items():
+                metadata[key.capitalize()] = chunk.text.strip('\x00')
         except Exception as e:
             logger.exception("PNG元数据解析错误")
         return metadata
 
     @staticmethod
-    def _parse_jpeg_metadata(img: Image.Image) -> dict:
+    def read_png_text(file_path: str) -> dict:
+        """
+        读取PNG图片中的全部文本块，返回 {关键字（小写）: PngText}。
+        文本内容在访问 PngText.text / PngText.json() 时才会解压和解析，
+        适合读取 ComfyUI 的 workflow 等体积较大的数据。
+        """
+        with open(file_path, 'rb') as f:
+            if MetadataExtractor._sniff_format(f) != 'PNG':
+                return {}
+            return MetadataExtractor._read_png_text_chunks(f)
+
+    @staticmethod
+    def _parse_png_metadata(file_path: str) -> dict:
+        """
+        解析PNG图片中的元数据
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                return MetadataExtractor._parse_png_stream(f)
+        except OSError:
+            logger.exception("PNG元数据解析错误")
+            return {}
+
+    @staticmethod
+    def _read_jpeg_segments(f: BinaryIO) -> dict:
+        """
+        按标记逐段扫描JPEG文件头，只读取 APP1（EXIF / XMP）与 COM 段的内容，
+        其他段直接跳过，遇到 SOS（图像数据开始）即停止
+        """
+        segments = {}
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                break
+            code = marker[1]
+            # 跳过填充字节 0xFF
+            while code == 0xFF:
+                byte = f.read(1)
+                if not byte:
+                    return segments
+                code = byte[0]
+            if code in (0xDA, 0xD9):
+                break
+            if 0xD0 <= code <= 0xD7 or code == 0x01:
+                continue
+            size = f.read(2)
+            if len(size) < 2:
+                break
+            length = struct.unpack('>H', size)[0] - 2
+            if code == 0xE1 or code == 0xFE:
+                payload = f.read(length)
+                if code == 0xFE:
+                    segments.setdefault('comment', payload)
+                elif payload.startswith(EXIF_HEADER):
+                    segments.setdefault('exif', payload[len(EXIF_HEADER):])
+                elif payload.startswith(XMP_HEADER):
+                    segments.setdefault('xmp', payload[len(XMP_HEADER):])
+            else:
+                f.seek(length, os.SEEK_CUR)
+        return segments
+
+    @staticmethod
+    def _read_webp_chunks(f: BinaryIO) -> dict:
+        """
+        逐块扫描WebP的 RIFF 结构，只读取 EXIF 与 XMP 块，图像数据块直接跳过
+        """
+        segments = {}
+        f.seek(12)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            fourcc, length = struct.unpack('<4sI', header)
+            padded = length + (length & 1)
+            if fourcc == b'EXIF':
+                payload = f.read(length)
+                f.seek(padded - length, os.SEEK_CUR)
+                if payload.startswith(EXIF_HEADER):
+                    payload = payload[len(EXIF_HEADER):]
+                segments['exif'] = payload
+            elif fourcc == b'XMP ':
+                segments['xmp'] = f.read(length)
+                f.seek(padded - length, os.SEEK_CUR)
+            else:
+                f.seek(padded, os.SEEK_CUR)
+        return segments
+
+    @staticmethod
+    def _exif_user_comment(tiff: bytes) -> Optional[str]:
+        """
+        从 EXIF（TIFF 结构）中读取 UserComment，依次查找 IFD0 与 Exif 子 IFD
+        """
+        if tiff[:2] == b'II':
+            endian = '<'
+        elif tiff[:2] == b'MM':
+            endian = '>'
+        else:
+            return None
+        ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        entries = _read_ifd(tiff, ifd_offset, endian)
+        if EXIF_USER_COMMENT not in entries and EXIF_IFD_POINTER in entries:
+            exif_offset = struct.unpack(endian + 'I', entries[EXIF_IFD_POINTER][:4])[0]
+            entries = _read_ifd(tiff, exif_offset, endian)
+        raw = entries.get(EXIF_USER_COMMENT)
+        if not raw:
+            return None
+        return _decode_user_comment(raw)
+
+    @staticmethod
+    @span("parse_jpeg_metadata")
+    def _parse_jpeg_metadata(f: BinaryIO, image_format: str = 'JPEG') -> dict:
         """
-        解析JPEG图片中的元数据
+        解析JPEG / WebP图片中的元数据：EXIF UserComment、COM 注释与 XMP，全程不解码像素数据
         """
         metadata = {}
         try:
-            exif_data = img.getexif()
-            if exif_data and 37510 in exif_data:
-                user_comment = exif_data[37510].decode('utf-8', 'ignore')
-                prompt_match = re.search(r"prompt:\s*(.*?)(?=\s|$)", user_comment, re.IGNORECASE | re.DOTALL)
-                desc_match = re.search(r"description:\s*(.*?)(?=\s|$)", user_comment, re.IGNORECASE | re.DOTALL)
-                if prompt_match:
-                    metadata['Prompt'] = prompt_match.group(1).strip()
-                if desc_match:
-                    metadata['Description'] = desc_match.group(1).strip()
+            if image_format == 'WEBP':
+                segments = MetadataExtractor._read_webp_chunks(f)
+            else:
+                segments = MetadataExtractor._read_jpeg_segments(f)
+            if 'exif' in segments:
+                user_comment = MetadataExtractor._exif_user_comment(segments['exif'])
+                if user_comment:
+                    _classify_comment(user_comment, metadata)
+            if 'comment' in segments:
+                _classify_comment(_decode_text(segments['comment']), metadata)
+            if 'xmp' in segments:
+                _parse_xmp(_decode_text(segments['xmp']), metadata)
         except Exception as e:
-            logger.error(f"JPEG解析异常: {e}")
+            logger.exception("JPEG/WebP元数据解析错误")
         return metadata
 
     @staticmethod
-    def extract_metadata(file_path: str) -> dict:
+    def extract_metadata(source, structured: bool = False, use_cache: bool = True) -> dict:
         """
-        提取图片元数据，支持PNG和JPEG格式
+        提取图片元数据，支持PNG、JPEG和WebP格式。
+        source 可以是文件路径、bytes / bytearray / memoryview，或支持 read / seek 的二进制文件对象（从头读取）；
+        内存中的数据直接解析，跳过的图像数据不会被复制，也不会写入磁盘。
+        structured 为 True 时，Parameters 返回 GenerationParameters 对象（各字段按需解析），
+        可通过其 to_dict() 得到可序列化的字典。
+        解析结果按文件内容缓存（见 MetadataExtractor.cache），同一图片重复上传到不同临时路径时也能命中；
+        use_cache 为 False 时跳过缓存。
         """
-        if not file_path or not os.path.exists(file_path):
+        if isinstance(source, (str, os.PathLike)):
+            if not source or not os.path.exists(source):
+                return {"error": "文件不存在或无效"}
+        elif source is None or (isinstance(source, _BUFFER_TYPES) and not len(source)):
             return {"error": "文件不存在或无效"}
         try:
-            with Image.open(file_path) as img:
-                metadata = {}
-                if img.format == 'PNG':
-                    metadata.update(MetadataExtractor._parse_png_metadata(file_path))
-                elif img.format in ['JPEG', 'WEBP']:
-                    metadata.update(MetadataExtractor._parse_jpeg_metadata(img))
-                result = {}
-                if "Parameters" in metadata:
-                    result["Parameters"] = metadata["Parameters"].strip().replace('\x00', '')
-                elif "Prompt" in metadata:
-                    result["Prompt"] = metadata["Prompt"]
-                elif "Description" in metadata:
-                    result["Description"] = metadata["Description"]
-                if not result:
-                    return {"message": "未找到提示词相关元数据"}
-                return result
+            with MetadataExtractor._open_source(source) as f:
+                return MetadataExtractor._extract_from(f, structured, use_cache)
+        except Exception as e:
+            logger.exception("元数据解析错误")
+            return {"error": f"处理失败: {str(e)}"}
+
+    @staticmethod
+    def extract_metadata_dict(source) -> dict:
+        """
+        与 extract_metadata(structured=True) 相同，但生成参数展开为各个字段的字典，可直接序列化为 JSON
+        """
+        result = MetadataExtractor.extract_metadata(source, structured=True)
+        if "Parameters" in result:
+            result["Parameters"] = result["Parameters"].to_dict()
+        return result
+
+    @staticmethod
+    @contextmanager
+    def _open_source(source) -> Iterator[BinaryIO]:
+        """
+        将 extract_metadata 支持的各种输入统一为可 read / seek 的二进制文件对象
+        """
+        if isinstance(source, _BUFFER_TYPES):
+            yield _BufferReader(source)
+        elif hasattr(source, 'read') and hasattr(source, 'seek'):
+            source.seek(0)
+            yield source
+        else:
+            with open(source, 'rb') as f:
+                yield f
+
+    @staticmethod
+    def _extract_from(f: BinaryIO, structured: bool, use_cache: bool) -> dict:
+        """
+        查询缓存，未命中时解析并写入缓存
+        """
+        cache = MetadataExtractor.cache if use_cache and MetadataExtractor.cache.max_entries > 0 else None
+        key = None
+        result = None
+        if cache is not None:
+            key = MetadataExtractor._content_key(f)
+            result = cache.get(key)
+        if result is None:
+            result = MetadataExtractor._extract_uncached(f)
+            # 出错的结果不缓存，以便文件恢复可读后重新解析
+            if key is not None and "error" not in result:
+                cache.put(key, result)
+        result = dict(result)
+        if structured and "Parameters" in result:
+            result["Parameters"] = GenerationParameters.parse(result["Parameters"])
+        return result
+
+    @staticmethod
+    def _content_key(f: BinaryIO) -> tuple:
+        """
+        缓存键：文件头部与尾部各 Config.METADATA_CACHE_SAMPLE_BYTES 字节的 BLAKE2b 哈希，加上文件大小。
+        PNG 文本块位于 IDAT 之前或之后，JPEG 的 APP 段位于文件开头，WebP 的 EXIF / XMP 位于文件末尾，
+        因此头尾两段足以覆盖元数据，同时只需读取很少的字节。
+        """
+        sample = Config.METADATA_CACHE_SAMPLE_BYTES
+        digest = hashlib.blake2b(digest_size=16)
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        digest.update(f.read(sample))
+        if size > sample:
+            f.seek(max(sample, size - sample))
+            digest.update(f.read(sample))
+        f.seek(0)
+        return digest.digest(), size
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """
+        返回元数据缓存的命中 / 未命中统计
+        """
+        return MetadataExtractor.cache.stats()
+
+    @staticmethod
+    def _extract_uncached(f: BinaryIO) -> dict:
+        """
+        解析文件对象，返回只包含字符串值的结果
+        """
+        try:
+            metadata = {}
+            image_format = MetadataExtractor._sniff_format(f)
+            if image_format == 'PNG':
+                metadata.update(MetadataExtractor._parse_png_stream(f))
+            elif image_format in ('JPEG', 'WEBP'):
+                metadata.update(MetadataExtractor._parse_jpeg_metadata(f, image_format))
+            else:
+                return {"error": "不支持的图片格式"}
+            result = {}
+            if "Parameters" in metadata:
+                result["Parameters"] = metadata["Parameters"].strip().replace('\x00', '')
+            elif "Prompt" in metadata:
+                result["Prompt"] = metadata["Prompt"]
+            elif "Description" in metadata:
+                result["Description"] = metadata["Description"]
+            if not result:
+                return {"message": "未找到提示词相关元数据"}
+            return result
         except Exception as e:
             logger.exception("元数据解析错误")
-            return {"error": f"处理失败: {str(e)}"} 
\ No newline at end of file
+            return {"error": f"处理失败: {str(e)}"}
+
+
+def _result_size(result: dict) -> int:
+    """
+    估算缓存结果占用的字节数（按字符数计）
+    """
+    return sum(len(key) + len(value) for key, value in result.items()) + 64
+
+
+MetadataExtractor.cache = LRUCache(Config.METADATA_CACHE_ENTRIES, Config.METADATA_CACHE_BYTES, _result_size)
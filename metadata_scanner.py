@@ -0,0 +1,184 @@
+"""
+批量图片元数据扫描工具。
+
+递归遍历目录，使用线程池并行提取图片元数据，结果写入 JSONL 或 SQLite。
+扫描结果以 (路径, 文件大小, 修改时间) 为键缓存在 SQLite 中，重复扫描时只处理新增或修改过的文件。
+
+用法示例：
+    python metadata_scanner.py outputs/ -o metadata.jsonl
+    python metadata_scanner.py outputs/ -o metadata.sqlite --workers 32
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+from config import Config
+from metadata_extractor import MetadataExtractor
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
+
+
+class ScanCache:
+    """
+    基于 SQLite 的扫描结果缓存，以 (路径, 文件大小, 修改时间) 判断文件是否变化。
+    只应在创建它的线程中使用。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, result TEXT NOT NULL)"
+        )
+        self._pending = 0
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[dict]:
+        """
+        返回未变化文件的缓存结果，文件已变化或没有缓存时返回 None
+        """
+        row = self._conn.execute(
+            "SELECT result FROM metadata WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, size, mtime_ns)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, path: str, size: int, mtime_ns: int, result: dict):
+        """
+        写入扫描结果，每 Config.SCAN_COMMIT_INTERVAL 条提交一次
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO metadata (path, size, mtime_ns, result) VALUES (?, ?, ?, ?)",
+            (path, size, mtime_ns, json.dumps(result, ensure_ascii=False))
+        )
+        self._pending += 1
+        if self._pending >= Config.SCAN_COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+
+class MetadataScanner:
+    """
+    遍历目录并行提取图片元数据。元数据提取以文件 I/O 为主，使用线程池即可充分利用磁盘带宽。
+    """
+    def __init__(self, workers: int = None, cache: ScanCache = None, recursive: bool = True):
+        self.workers = workers or Config.SCAN_WORKERS or min(32, (os.cpu_count() or 1) * 4)
+        self.cache = cache
+        self.recursive = recursive
+        self.stats = {"files": 0, "cached": 0, "extracted": 0}
+
+    def iter_files(self, root: str) -> Iterator[tuple]:
+        """
+        遍历目录下的图片文件，返回 (路径, 文件大小, 修改时间纳秒)
+        """
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError:
+                logger.warning("无法读取目录: %s", directory)
+                continue
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+                except OSError:
+                    logger.warning("无法读取文件信息: %s", entry.path)
+            # 逆序入栈，保证按名称顺序遍历子目录
+            stack.extend(reversed(subdirs))
+
+    def scan(self, root: str) -> Iterator[tuple]:
+        """
+        扫描目录，按遍历顺序返回 (路径, 文件大小, 修改时间纳秒, 元数据)
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for path, size, mtime_ns in self.iter_files(root):
+                self.stats["files"] += 1
+                cached = self.cache.get(path, size, mtime_ns) if self.cache else None
+                if cached is not None:
+                    self.stats["cached"] += 1
+                    pending.append((path, size, mtime_ns, cached))
+                else:
+                    pending.append((path, size, mtime_ns,
+                                    executor.submit(MetadataExtractor.extract_metadata, path, use_cache=False)))
+                # 限制在途任务数量
+                while len(pending) > self.workers * 4:
+                    yield self._resolve(*pending.popleft())
+            while pending:
+                yield self._resolve(*pending.popleft())
+
+    def _resolve(self, path: str, size: int, mtime_ns: int, result) -> tuple:
+        """
+        等待提取结果并写入缓存
+        """
+        if not isinstance(result, dict):
+            result = result.result()
+            self.stats["extracted"] += 1
+            if self.cache:
+                self.cache.put(path, size, mtime_ns, result)
+        return path, size, mtime_ns, result
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="批量扫描目录中的图片元数据")
+    parser.add_argument("directory", help="需要扫描的目录")
+    parser.add_argument("-o", "--output", default="-",
+                        help="输出文件：.jsonl 或 .sqlite/.db，默认以 JSONL 输出到标准输出")
+    parser.add_argument("--cache", default=Config.SCAN_CACHE_PATH,
+                        help="结果缓存文件（SQLite），为空字符串时不使用缓存")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="线程数")
+    parser.add_argument("--no-recursive", action="store_true", help="不扫描子目录")
+    args = parser.parse_args(argv)
+
+    output_sqlite = os.path.splitext(args.output)[1].lower() in ('.sqlite', '.db')
+    cache_path = args.output if output_sqlite else args.cache
+    cache = ScanCache(cache_path) if cache_path else None
+    scanner = MetadataScanner(workers=args.workers, cache=cache, recursive=not args.no_recursive)
+
+    dst = None
+    if not output_sqlite:
+        dst = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        for path, size, mtime_ns, result in scanner.scan(args.directory):
+            if dst is not None:
+                record = {"path": path, "size": size, "mtime_ns": mtime_ns, "metadata": result}
+                dst.write(json.dumps(record, ensure_ascii=False))
+                dst.write('\n')
+    finally:
+        if dst is not None and dst is not sys.stdout:
+            dst.close()
+        if cache:
+            cache.close()
+
+    elapsed = time.perf_counter() - start
+    stats = scanner.stats
+    logger.info("扫描完成：共 %d 个文件，缓存命中 %d，新提取 %d，用时 %.2f 秒，%.0f 个/秒",
+                stats["files"], stats["cached"], stats["extracted"], elapsed,
+                stats["files"] / elapsed if elapsed > 0 else 0.0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
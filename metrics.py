@@ -0,0 +1,163 @@
+"""
+热点路径的耗时统计与按请求的性能分析。
+
+设置环境变量 SD_PROMPT_METRICS=1 后，用 span() 装饰的函数会把每次调用的耗时记录到进程内的直方图中，
+可通过 render_prometheus() 以 Prometheus 文本格式导出（GradioInterface.launch 会挂载到 /metrics）。
+未启用时 span() 在导入阶段直接返回原函数，没有任何额外开销。
+
+性能分析：SD_PROMPT_PROFILE=1 时从启动起对每个界面请求运行 cProfile，
+也可以在启用统计后通过 POST /metrics/profile?enable=true 在运行时开关；结果保存为 Config.PROFILE_DIR 下的 .prof 文件，
+可用 python -m pstats 或 snakeviz 查看。
+"""
+import cProfile
+import functools
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+from config import Config
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+# 直方图的桶上限（秒），覆盖从几十微秒的标签解析到数秒的 CSV 加载
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_profiling = Config.PROFILE_ENABLED
+_profile_lock = threading.Lock()
+_profile_counter = itertools.count(1)
+
+
+class Histogram:
+    """
+    累积耗时直方图（与 Prometheus histogram 的语义一致）
+    """
+    __slots__ = ('name', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self) -> tuple:
+        """
+        返回 (各桶的累积计数, 总耗时, 调用次数)
+        """
+        with self._lock:
+            return list(itertools.accumulate(self.counts)), self.sum, self.count
+
+
+def histogram(name: str) -> Histogram:
+    """
+    获取（不存在时创建）指定名称的直方图
+    """
+    hist = _registry.get(name)
+    if hist is None:
+        with _registry_lock:
+            hist = _registry.setdefault(name, Histogram(name))
+    return hist
+
+
+def span(name: str) -> Callable:
+    """
+    装饰器：记录函数每次调用的耗时。统计未启用时返回原函数。
+    用于 staticmethod 时应放在 @staticmethod 之下。
+    """
+    def decorator(fn: Callable) -> Callable:
+        if not Config.METRICS_ENABLED:
+            return fn
+        hist = histogram(name)
+        perf_counter = time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def set_profiling(enabled: bool):
+    """
+    在运行时开启或关闭按请求的性能分析
+    """
+    global _profiling
+    _profiling = bool(enabled)
+
+
+def profiling_enabled() -> bool:
+    return _profiling
+
+
+def request_handler(name: str) -> Callable:
+    """
+    装饰界面事件的处理函数：记录请求耗时（span "request:<name>"），性能分析开启时用 cProfile 运行并保存结果。
+    统计与性能分析都未启用时返回原函数。
+    """
+    def decorator(fn: Callable) -> Callable:
+        if not (Config.METRICS_ENABLED or Config.PROFILE_ENABLED):
+            return fn
+        timed = span("request:" + name)(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            # cProfile 同一时刻只能有一个在运行，并发请求中只分析拿到锁的那一个
+            if not _profiling or not _profile_lock.acquire(blocking=False):
+                return timed(*args, **kwargs)
+            try:
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(timed, *args, **kwargs)
+                finally:
+                    _dump_profile(profiler, name)
+            finally:
+                _profile_lock.release()
+        return wrapper
+    return decorator
+
+
+def _dump_profile(profiler: cProfile.Profile, name: str):
+    filename = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{next(_profile_counter)}.prof"
+    try:
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(Config.PROFILE_DIR, filename))
+    except OSError as e:
+        logger.warning("保存性能分析结果失败: %s", e)
+
+
+def render_prometheus() -> str:
+    """
+    以 Prometheus 文本格式导出所有直方图
+    """
+    lines = [
+        "# HELP sd_prompt_span_seconds Time spent in instrumented functions.",
+        "# TYPE sd_prompt_span_seconds histogram",
+    ]
+    with _registry_lock:
+        histograms = sorted(_registry.items())
+    for name, hist in histograms:
+        cumulative, total, count = hist.snapshot()
+        label = name.replace('\\', '\\\\').replace('"', '\\"')
+        for bound, value in zip(BUCKETS, cumulative):
+            lines.append(f'sd_prompt_span_seconds_bucket{{span="{label}",le="{bound}"}} {value}')
+        lines.append(f'sd_prompt_span_seconds_bucket{{span="{label}",le="+Inf"}} {cumulative[-1]}')
+        lines.append(f'sd_prompt_span_seconds_sum{{span="{label}"}} {total}')
+        lines.append(f'sd_prompt_span_seconds_count{{span="{label}"}} {count}')
+    return "\n".join(lines) + "\n"
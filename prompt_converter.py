@@ -1,30 +1,115 @@
 import re
+import os
+import threading
+from collections import deque
+from itertools import islice
+from typing import Iterable, Iterator
 from config import Config
-from functools import wraps
+from artist_index import ArtistIndex, load_artist_index
+from cache import LRUCache
+from metrics import span
 from decimal import Decimal, ROUND_HALF_UP
 
+# NAI 词法单元：一段不含括号和逗号的文本，或单个 "{" "}" "[" "]" ","
+_NAI_TOKEN = re.compile(r'[^{}\[\],]+|[{}\[\],]')
+# SD 加权标签：(tag:weight)
+_SD_WEIGHTED = re.compile(r'\((.*?):([\d.]+)\)')
+_SD_REPEATED_COMMA = re.compile(r',\s*,')
+_SD_BARE_PAREN = re.compile(r'(?<!_)[(]')
+# 转义字符占位符，与 Config.ESCAPE_PATTERN 对应
+_ESC_PLACEHOLDER = r"__ESC_\1__"
+_ESC_RESTORE = re.compile(r"__ESC_([{}()[\]]])__")
+# 含有至少一个逗号（或句号、顿号）的连续空白/标点
+_COMMA_RUN = re.compile(r'[\s,。、]*[,。、][\s,。、]*')
+
 def round_half_up(n: float, decimals: int = 3) -> float:
     """
     对浮点数 n 按四舍五入（half-up）方式保留指定小数位数。
     """
-    multiplier = 10 ** decimals
     # 构造格式串 "1.000"（例如3位小数）
     quant = Decimal(f'1.{"0"*decimals}')
     return float(Decimal(n).quantize(quant, rounding=ROUND_HALF_UP))
 
-def handle_escape(func):
+def _compute_weight(curly: int, square: int, positive_factor: float, precision: int) -> float:
+    """
+    按原始公式计算权重：正权重因子的 curly 次方乘以其倒数的 square 次方，再按 precision 位四舍五入
+    """
+    negative_factor = 1 / positive_factor
+    weight = (positive_factor ** curly) * (negative_factor ** square)
+    return round_half_up(weight, precision)
+
+class WeightTable:
     """
-    装饰器：处理提示词中的转义字符
-    对于 nai_to_sd，我们不再对整个返回结果做替换，而是在生成每个 tag 时自行处理转义。
+    (大括号层数, 方括号层数) → 权重 的查找表，同时缓存权重对应的 "%.3f" 文本。
+
+    嵌套深度通常很小，构建时预先计算 0..PRECOMPUTED_DEPTH 范围内的所有组合，
+    更深的组合在首次用到时计算并缓存（不超过 MAX_CACHED_DEPTH）。
+    每次取表时会比对 Config.BRACKET_RULES 与 Config.WEIGHT_PRECISION，配置变化后自动重建，
+    结果与逐个调用 round_half_up 完全一致。
     """
-    @wraps(func)
-    def wrapper(prompt: str) -> str:
-        if func.__name__ == 'nai_to_sd':
-            return func(prompt)
-        processed = Config.ESCAPE_PATTERN.sub(r"__ESC_\1__", prompt)
-        result = func(processed)
-        return re.sub(r"__ESC_([{}()[\]]])__", r"\1", result)
-    return wrapper
+    PRECOMPUTED_DEPTH = 8
+    MAX_CACHED_DEPTH = 64
+
+    def __init__(self):
+        self._signature = None
+        self._weights = {}
+        self.labels = {}
+
+    def weights(self) -> dict:
+        """
+        返回当前配置下的 {(curly, square): weight} 字典
+        """
+        signature = (Config.BRACKET_RULES.get('{', (1.05, '}'))[0], Config.WEIGHT_PRECISION)
+        if signature != self._signature:
+            self._rebuild(signature)
+        return self._weights
+
+    def _rebuild(self, signature: tuple):
+        positive_factor, precision = signature
+        weights = {}
+        labels = {}
+        for curly in range(self.PRECOMPUTED_DEPTH + 1):
+            for square in range(self.PRECOMPUTED_DEPTH + 1):
+                weight = _compute_weight(curly, square, positive_factor, precision)
+                weights[(curly, square)] = weight
+                labels[weight] = "%.3f" % weight
+        self._weights = weights
+        self.labels = labels
+        self._signature = signature
+
+    def weight(self, curly: int, square: int) -> float:
+        """
+        查询指定嵌套深度的权重，表中没有时计算并缓存
+        """
+        weights = self.weights()
+        weight = weights.get((curly, square))
+        if weight is None:
+            positive_factor, precision = self._signature
+            weight = _compute_weight(curly, square, positive_factor, precision)
+            if curly <= self.MAX_CACHED_DEPTH and square <= self.MAX_CACHED_DEPTH:
+                weights[(curly, square)] = weight
+                self.labels[weight] = "%.3f" % weight
+        return weight
+
+    def label(self, weight: float) -> str:
+        """
+        返回权重的 "%.3f" 文本
+        """
+        label = self.labels.get(weight)
+        if label is None:
+            label = "%.3f" % weight
+        return label
+
+_weight_table = WeightTable()
+
+def bracket_weight(curly: int, square: int) -> float:
+    """
+    计算嵌套在 curly 层大括号、square 层方括号中的标签权重：
+      - 正权重（大括号）：权重因子 = Config.BRACKET_RULES 中 "{" 的数值
+      - 负权重（方括号）：采用 1/正权重因子
+    结果按 round_half_up 保留 Config.WEIGHT_PRECISION 位小数，通过 WeightTable 查表得到。
+    """
+    return _weight_table.weight(curly, square)
 
 def escape_inner_parentheses(text: str) -> str:
     """
@@ -34,6 +119,9 @@ def escape_inner_parentheses(text: str) -> str:
     - 对未被转义的 ")" 添加反斜杠。
     例如："mamimi(mamamimi)" 会转换为 "mamimi_\(mamamimi\)"
     """
+    # 绝大多数 tag 不含括号，直接返回
+    if '(' not in text and ')' not in text:
+        return text
     result = []
     i = 0
     while i < len(text):
@@ -57,63 +145,213 @@ def escape_inner_parentheses(text: str) -> str:
             i += 1
     return ''.join(result)
 
+@span("clean_output")
 def clean_output(text: str) -> str:
     """
     清理转换结果中的多余标点和空格：
     1. 将句号（。）和顿号（、）转换为逗号；
     2. 删除连续多余的逗号，合并为一个；
     3. 删除逗号前后多余的空格。
+    以上三步等价于把每一段"含逗号的连续空白/标点"替换为单个逗号，只需一次正则扫描。
     """
-    # 替换中文标点为英文逗号
-    text = text.replace('。', ',').replace('、', ',')
-    # 删除逗号前后多余的空格，并用单个逗号连接
-    text = re.sub(r'\s*,\s*', ',', text)
-    # 将连续逗号替换为单个逗号
-    text = re.sub(r',+', ',', text)
+    text = _COMMA_RUN.sub(',', text)
     # 去除首尾多余的逗号
     return text.strip(',')
 
+# ---------------------------------------------------------------------------
+# 提示词语法树：解析结果是由 (tag, weight) 组成的列表，
+# NAI 与 SD 两个方向共用同一套节点表示，再由对应的 emit_* 函数输出文本。
+# ---------------------------------------------------------------------------
+
+@span("parse_nai")
+def parse_nai(text: str, pos: int = 0, outer_curly: int = 0, outer_square: int = 0,
+              restore_artist: bool = False) -> tuple[list, int]:
+    """
+    单遍解析 NAI 格式提示词，返回 (节点列表, 结束位置)。
+
+    正则一次切分出文本段与括号/逗号，遇到右括号或逗号时以当前嵌套深度结算权重；
+    没有匹配左括号的 "}" / "]" 作为普通字符保留在 tag 中。
+    restore_artist 为 True 时将 tag 中的 "artist_" 恢复为 "artist:"。
+    """
+    weights = _weight_table.weights()
+    nodes = []
+    pieces = []
+    curly_count = outer_curly
+    square_count = outer_square
+
+    for token in _NAI_TOKEN.findall(text, pos):
+        if token == '{':
+            curly_count += 1
+            continue
+        if token == '[':
+            square_count += 1
+            continue
+        if token == '}' and curly_count > outer_curly:
+            closing = '}'
+        elif token == ']' and square_count > outer_square:
+            closing = ']'
+        elif token == ',':
+            closing = None
+        else:
+            pieces.append(token)
+            continue
+        if pieces:
+            tag = ''.join(pieces).strip()
+            if restore_artist:
+                tag = tag.replace("artist_", "artist:")
+            depth = (curly_count - outer_curly, square_count - outer_square)
+            weight = weights.get(depth)
+            if weight is None:
+                weight = bracket_weight(*depth)
+            nodes.append((tag, weight))
+            pieces = []
+        if closing == '}':
+            curly_count -= 1
+        elif closing == ']':
+            square_count -= 1
+
+    if pieces:
+        tag = ''.join(pieces).strip()
+        if restore_artist:
+            tag = tag.replace("artist_", "artist:")
+        nodes.append((tag, bracket_weight(curly_count - outer_curly, square_count - outer_square)))
+    return nodes, max(pos, len(text))
+
+def parse_sd(text: str) -> list:
+    """
+    解析 SD 格式提示词，返回节点列表。
+
+    加权标签 (tag:weight) 中被反斜杠转义的括号会被还原，并在前面不是下划线的 "(" 前插入下划线；
+    加权标签之间的普通文本整体作为一个权重为 1.0 的节点。
+    Config.ESCAPE_PATTERN 匹配到的转义字符会替换为占位符，由 emit_nai 还原。
+    """
+    if '\\' in text:
+        text = Config.ESCAPE_PATTERN.sub(_ESC_PLACEHOLDER, text)
+    text = text.strip()
+    text = _SD_REPEATED_COMMA.sub(',', text)
+    text = text.strip(',')
+
+    nodes = []
+    last_end = 0
+    for match in _SD_WEIGHTED.finditer(text):
+        start = match.start()
+        if start > last_end:
+            plain_text = text[last_end:start].strip(' ,')
+            if plain_text:
+                nodes.append((plain_text, 1.0))
+        tag = match.group(1).strip()
+        # 还原 SD 转换过程中对括号的转义
+        if '\\' in tag:
+            tag = tag.replace('\\(', '(').replace('\\)', ')')
+        # 如果 tag 中的左括号前没有下划线，则插入下划线
+        if '(' in tag:
+            tag = _SD_BARE_PAREN.sub('_(', tag)
+        nodes.append((tag, float(match.group(2))))
+        last_end = match.end()
+    if last_end < len(text):
+        plain_text = text[last_end:].strip(' ,')
+        if plain_text:
+            nodes.append((plain_text, 1.0))
+    return nodes
+
+def emit_sd(nodes: list) -> str:
+    """
+    将节点列表输出为 SD 格式：权重为 1 的 tag 原样输出，其余输出为 (tag:weight)，
+    tag 内部括号经 escape_inner_parentheses 转义。
+    """
+    add_artist_prefix = PromptConverter.add_artist_prefix
+    label = _weight_table.label
+    buffer = []
+    append = buffer.append
+    for tag, weight in nodes:
+        # 判断是否为艺术家 tag，不含前缀但存在于 CSV 表中则添加前缀
+        tag = add_artist_prefix(tag)
+        if abs(weight - 1.0) < 0.001:
+            append(tag)
+        else:
+            append(f"({escape_inner_parentheses(tag)}:{label(weight)})")
+    return clean_output(','.join(buffer))
+
+def emit_nai(nodes: list) -> str:
+    """
+    将节点列表输出为 NAI 格式：按 Config.WEIGHT_STEP 把权重换算为大括号或方括号的层数，
+    并还原 parse_sd 中的转义占位符。
+    """
+    add_artist_prefix = PromptConverter.add_artist_prefix
+    step = Config.WEIGHT_STEP
+    buffer = []
+    append = buffer.append
+    for tag, weight in nodes:
+        tag = add_artist_prefix(tag)
+        if abs(weight - 1.0) < 0.001:
+            append(tag)
+        elif weight > 1.0:
+            count = round((weight - 1.0) / step)
+            append('{' * count + tag + '}' * count)
+        else:
+            count = round((1.0 - weight) / step)
+            append('[' * count + tag + ']' * count)
+    result = clean_output(','.join(buffer))
+    if '__ESC_' in result:
+        result = _ESC_RESTORE.sub(r"\1", result)
+    return result
+
+def _conversion_size(result: str) -> int:
+    """
+    估算一条缓存的转换结果占用的字节数（键中的提示词长度与结果相近，按两倍计）
+    """
+    return 2 * len(result) + 128
+
+def _init_batch_worker():
+    """
+    批量转换子进程的初始化函数：每个进程只加载一次艺术家索引
+    """
+    PromptConverter._ensure_artist_index()
+
+def _convert_chunk(direction: str, chunk: list) -> list:
+    """
+    在子进程中转换一批提示词
+    """
+    convert = getattr(PromptConverter, direction)
+    return [convert(prompt) for prompt in chunk]
+
 class PromptConverter:
-    # 新增类属性，用于存储 CSV 表中加载的艺术家 tag（来自 danbooru_art.csv）
-    artist_triggers = set()
+    # 支持的批量转换方向
+    DIRECTIONS = ('nai_to_sd', 'sd_to_nai')
+
+    # 艺术家 trigger 索引（来自 danbooru_art.csv），重新加载时整体替换
+    artist_index = ArtistIndex.UNLOADED
+    # 保留原始 trigger 集合，兼容直接读取该属性的调用方
+    artist_triggers = frozenset()
+    _artist_lock = threading.Lock()
+
+    # 转换结果缓存，键包含艺术家索引版本与权重配置，重新加载索引或修改配置后旧条目自然失效
+    conversion_cache = LRUCache(Config.CONVERSION_CACHE_SIZE, Config.CONVERSION_CACHE_BYTES, _conversion_size)
 
     @staticmethod
-    def load_artist_triggers():
+    @span("load_artist_triggers")
+    def load_artist_triggers() -> ArtistIndex:
         """
-        从同目录下的 CSV 文件 danbooru_art.csv 中加载艺术家 tag，
-        文件要求有一列 "trigger"（不区分大小写）。
-        
-        如果 CSV 文件只有一行数据（没有表头）或只有 header 一行，
-        则会尝试将这一行内容作为 trigger 进行加载。
+        从 Config.ARTIST_CSV_PATH 指定的 CSV 文件重新构建艺术家 trigger 索引，
+        Config.ARTIST_BIN_PATH 存在且与 CSV 一致时直接内存映射该二进制文件，
+        构建完成后一次性替换 PromptConverter.artist_index。
+        文件缺失或解析失败时得到一个"已加载但为空"的索引，不会在每个 tag 上重试。
         """
-        import csv
-        try:
-            with open("danbooru_art.csv", "r", encoding="utf-8", newline="") as csvfile:
-                # 读取前 1024 个字节用于判断是否有表头
-                sample = csvfile.read(1024)
-                csvfile.seek(0)
-                sniffer = csv.Sniffer()
-                has_header = sniffer.has_header(sample)
-                if has_header:
-                    reader = csv.DictReader(csvfile)
-                    # 正常情况：根据 "trigger" 列获取所有数据行的内容
-                    triggers = {
-                        row["trigger"].strip() for row in reader
-                        if row.get("trigger") and row["trigger"].strip()
-                    }
-                    # 如果没有读取到数据，但 fieldnames 存在，可能 CSV 文件仅有一行，
-                    # 如果唯一的 fieldnames 不是 "trigger"，则认为该字段名就是 trigger 数据
-                    if not triggers and reader.fieldnames:
-                        if len(reader.fieldnames) == 1 and reader.fieldnames[0].lower() != "trigger":
-                            triggers = {reader.fieldnames[0].strip()}
-                else:
-                    # CSV 没有表头，使用 csv.reader 直接读取第一列作为 trigger
-                    reader = csv.reader(csvfile)
-                    triggers = {row[0].strip() for row in reader if row and row[0].strip()}
-                PromptConverter.artist_triggers = triggers
-        except Exception as e:
-            # 出现异常则置为空集合
-            PromptConverter.artist_triggers = set()
+        index = load_artist_index(Config.ARTIST_CSV_PATH, Config.ARTIST_BIN_PATH)
+        PromptConverter.artist_triggers = index.triggers
+        PromptConverter.artist_index = index
+        return index
+
+    @staticmethod
+    def _ensure_artist_index() -> ArtistIndex:
+        """
+        首次使用时加载索引，多线程并发调用时只加载一次
+        """
+        with PromptConverter._artist_lock:
+            index = PromptConverter.artist_index
+            if not index.loaded:
+                index = PromptConverter.load_artist_triggers()
+        return index
 
     @staticmethod
     def round_to_step(number: float, step: float = Config.WEIGHT_STEP) -> float:
@@ -125,169 +363,156 @@ class PromptConverter:
     @staticmethod
     def parse_and_count_brackets(text: str, pos: int = 0, outer_curly: int = 0, outer_square: int = 0) -> tuple[list, int]:
         """
-        递归解析括号并计算标签权重。
-        修改权重计算公式：
-          - 正权重（大括号）：权重因子 = Config.BRACKET_RULES 中 "{" 的数值
-          - 负权重（方括号）：采用 1/正权重因子
-        最后采用 round_half_up 保留 3 位小数。
+        解析括号并计算标签权重，返回 ([(tag, weight), ...], 结束位置)。
+        权重计算见 bracket_weight，解析过程见 parse_nai。
         """
-        # 从配置中获取正权重因子（例如1.05）；负权重使用其倒数
-        positive_factor = Config.BRACKET_RULES.get('{', (1.05, '}'))[0]
-        negative_factor = 1 / positive_factor
-
-        result = []
-        current_tag = ""
-        curly_count = outer_curly
-        square_count = outer_square
-
-        while pos < len(text):
-            char = text[pos]
-            if char == '{':
-                curly_count += 1
-            elif char == '[':
-                square_count += 1
-            elif char == '}' and curly_count > outer_curly:
-                if current_tag:
-                    weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
-                    weight = round_half_up(weight, Config.WEIGHT_PRECISION)
-                    result.append((current_tag.strip(), weight))
-                    current_tag = ""
-                curly_count -= 1
-            elif char == ']' and square_count > outer_square:
-                if current_tag:
-                    weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
-                    weight = round_half_up(weight, Config.WEIGHT_PRECISION)
-                    result.append((current_tag.strip(), weight))
-                    current_tag = ""
-                square_count -= 1
-            elif char == ',':
-                if current_tag:
-                    if curly_count > outer_curly or square_count > outer_square:
-                        weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
-                        weight = round_half_up(weight, Config.WEIGHT_PRECISION)
-                        result.append((current_tag.strip(), weight))
-                    else:
-                        result.append((current_tag.strip(), 1.0))
-                    current_tag = ""
-            else:
-                current_tag += char
-            pos += 1
-
-        if current_tag:
-            if curly_count > outer_curly or square_count > outer_square:
-                weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
-                weight = round_half_up(weight, Config.WEIGHT_PRECISION)
-                result.append((current_tag.strip(), weight))
-            else:
-                result.append((current_tag.strip(), 1.0))
-        return result, pos
+        return parse_nai(text, pos, outer_curly, outer_square)
 
     @staticmethod
-    @handle_escape
     def nai_to_sd(prompt: str) -> str:
         """
         将 NAI 格式转换为 SD 格式。
-        修改内容：
-          1. 临时将 "artist:" 替换为 "artist_"，避免解析时冲突；
-          2. 遍历解析出的 tag 时，先调用 add_artist_prefix 判断是否需要添加前缀，
-             再调用 escape_inner_parentheses 对 tag 内部括号进行处理，并使用 round_half_up 保留 3 位小数；
-          3. 最后恢复 "artist:" 标记，并对最终结果进行清理（替换中文标点、删除多余逗号和空格）。
+          1. parse_nai 单遍解析出 (tag, weight) 节点，并将 tag 中的 "artist_" 恢复为 "artist:"；
+          2. emit_sd 为每个 tag 判断是否需要添加 artist 前缀，对带权重的 tag 转义内部括号，
+             权重保留 3 位小数；
+          3. 最后对结果进行清理（替换中文标点、删除多余逗号和空格）。
         """
         if not isinstance(prompt, str):
             return ""
+        return PromptConverter._cached('nai_to_sd', prompt, PromptConverter._nai_to_sd)
+
+    @staticmethod
+    def _nai_to_sd(prompt: str) -> str:
         try:
-            # 临时替换 "artist:" 避免在解析时冲突
-            prompt = prompt.replace("artist:", "artist_")
-            tags, _ = PromptConverter.parse_and_count_brackets(prompt)
-            result_tags = []
-            for tag, weight in tags:
-                # 恢复 artist: 标记后再处理
-                tag = tag.replace("artist_", "artist:")
-                # 判断是否为艺术家 tag，不含前缀但存在于 CSV 表中则添加前缀
-                tag = PromptConverter.add_artist_prefix(tag)
-                if abs(weight - 1.0) < 0.001:
-                    result_tags.append(tag)
-                else:
-                    # 对 tag 内部括号进行转义处理
-                    escaped_tag = escape_inner_parentheses(tag)
-                    result_tags.append(f"({escaped_tag}:{weight:.3f})")
-            result = ", ".join(result_tags)
-            result = clean_output(result)
-            return result
+            nodes, _ = parse_nai(prompt, restore_artist=True)
+            return emit_sd(nodes)
         except Exception as e:
             return f"Error: {str(e)}"
 
     @staticmethod
-    @handle_escape
     def sd_to_nai(prompt: str) -> str:
         """
         将 SD 格式转换为 NAI 格式
-        （此处保留原实现逻辑，但增加了对标签内括号前插入下划线的处理，
+        （parse_sd 解析加权标签并在标签内括号前插入下划线，emit_nai 按权重生成括号，
          同时对最终结果进行清理：将中文标点替换为逗号、删除多余的逗号和空格）
         """
         if not isinstance(prompt, str):
             return "Error: Input must be a string"
+        return PromptConverter._cached('sd_to_nai', prompt, PromptConverter._sd_to_nai)
+
+    @staticmethod
+    def _sd_to_nai(prompt: str) -> str:
         try:
-            prompt = prompt.strip()
-            prompt = re.sub(r',\s*,', ',', prompt)
-            prompt = prompt.strip(',')
-            pattern = r'\((.*?):([\d.]+)\)'
-            tags = []
-            last_end = 0
-            for match in re.finditer(pattern, prompt):
-                if match.start() > last_end:
-                    plain_text = prompt[last_end:match.start()].strip(' ,')
-                    if plain_text:
-                        tags.append((plain_text, 1.0))
-                tag = match.group(1).strip()
-                # 还原 SD 转换过程中对括号的转义
-                tag = tag.replace('\\(', '(').replace('\\)', ')')
-                # 如果 tag 中的左括号前没有下划线，则插入下划线
-                tag = re.sub(r'(?<!_)[(]', '_(', tag)
-                weight = float(match.group(2))
-                tags.append((tag, weight))
-                last_end = match.end()
-            if last_end < len(prompt):
-                plain_text = prompt[last_end:].strip(' ,')
-                if plain_text:
-                    tags.append((plain_text, 1.0))
-            result_tags = []
-            for tag, weight in tags:
-                # 对 tag 进行 artist tag 前缀判断
-                tag = PromptConverter.add_artist_prefix(tag)
-                if abs(weight - 1.0) < 0.001:
-                    result_tags.append(tag)
-                else:
-                    if weight > 1.0:
-                        count = round((weight - 1.0) / Config.WEIGHT_STEP)
-                        result_str = '{' * count + tag + '}' * count
-                    else:
-                        count = round((1.0 - weight) / Config.WEIGHT_STEP)
-                        result_str = '[' * count + tag + ']' * count
-                    result_tags.append(result_str)
-            result = ", ".join(result_tags)
-            result = clean_output(result)
-            return result
+            return emit_nai(parse_sd(prompt))
         except Exception as e:
             return f"Error: {str(e)}"
 
+    @staticmethod
+    def _cached(direction: str, prompt: str, convert) -> str:
+        """
+        通过转换结果缓存调用 convert；缓存未启用时直接转换，出错的结果不缓存
+        """
+        cache = PromptConverter.conversion_cache
+        if cache.max_entries <= 0:
+            return convert(prompt)
+        index = PromptConverter.artist_index
+        if not index.loaded:
+            index = PromptConverter._ensure_artist_index()
+        key = (direction, prompt, index.version, Config.BRACKET_RULES.get('{', (1.05, '}'))[0],
+               Config.WEIGHT_PRECISION, Config.WEIGHT_STEP,
+               Config.ARTIST_FUZZY_DISTANCE, Config.ARTIST_FUZZY_MIN_LENGTH, Config.ARTIST_CANONICAL_NAMES)
+        result = cache.get(key)
+        if result is None:
+            result = convert(prompt)
+            if not result.startswith("Error: "):
+                cache.put(key, result)
+        return result
+
+    @staticmethod
+    def configure_cache(max_entries: int, max_bytes: int = Config.CONVERSION_CACHE_BYTES):
+        """
+        重新设置转换结果缓存的容量，max_entries 为 0 时关闭缓存（已有条目与统计一并清空）
+        """
+        PromptConverter.conversion_cache = LRUCache(max_entries, max_bytes, _conversion_size)
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """
+        返回转换结果缓存的命中 / 未命中统计
+        """
+        return PromptConverter.conversion_cache.stats()
+
+    @staticmethod
+    def convert_many(prompts: Iterable[str], direction: str, workers: int = None,
+                     chunk_size: int = Config.BATCH_CHUNK_SIZE) -> Iterator[str]:
+        """
+        批量转换提示词，按输入顺序逐条返回结果。
+
+        direction 为 "nai_to_sd" 或 "sd_to_nai"。输入按 chunk_size 分块后分发到进程池，
+        workers 默认为 CPU 核数，workers <= 1 时在当前进程内转换。
+        输入以流的方式读取，同时在途的分块数量有上限，可以处理任意长度的可迭代对象。
+        """
+        if direction not in PromptConverter.DIRECTIONS:
+            raise ValueError(f"不支持的转换方向: {direction}")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        prompts = iter(prompts)
+        chunk_size = max(1, chunk_size)
+        chunks = iter(lambda: list(islice(prompts, chunk_size)), [])
+        return PromptConverter._convert_chunks(chunks, direction, workers)
+
+    @staticmethod
+    def _convert_chunks(chunks: Iterator[list], direction: str, workers: int) -> Iterator[str]:
+        """
+        convert_many 的生成器实现
+        """
+        if workers <= 1:
+            convert = getattr(PromptConverter, direction)
+            for chunk in chunks:
+                for prompt in chunk:
+                    yield convert(prompt)
+            return
+
+        # 进程池模块（multiprocessing）导入较慢，只在多进程转换时导入
+        from concurrent.futures import ProcessPoolExecutor
+        # 先在主进程加载索引，fork 启动的子进程可直接共享
+        PromptConverter._ensure_artist_index()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_convert_chunk, direction, chunk))
+                # 限制在途分块数量，按提交顺序输出结果
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
     @staticmethod
     def add_artist_prefix(tag: str) -> str:
         """
         根据 CSV 表中加载的 artist trigger 判断 tag 是否需要添加 "artist:" 前缀。
-        如果 tag（不包含前缀）正好出现在 PromptConverter.artist_triggers 集合中，
-        则返回 "artist:" + tag，否则返回原 tag。
+        如果 tag（不包含前缀）归一化后（不区分大小写，下划线视为空格，忽略括号转义，见 normalize_artist）
+        是 PromptConverter.artist_index 中的 trigger 或别名，则返回 "artist:" + tag，否则返回原 tag。
+        Config.ARTIST_FUZZY_DISTANCE 大于 0 时，没有精确匹配且足够长的 tag 再做模糊匹配，
+        只有唯一一个距离最小的 trigger 时才视为匹配。
         """
-        # 如果还没有加载，则加载 artist trigger 集合
-        if not PromptConverter.artist_triggers:
-            PromptConverter.load_artist_triggers()
+        index = PromptConverter.artist_index
+        # 如果还没有加载，则加载 artist trigger 索引
+        if not index.loaded:
+            index = PromptConverter._ensure_artist_index()
+        # 索引为空时无需比较
+        if not index:
+            return tag
         # 统一比较均转换成小写
         tag_lower = tag.lower()
         # 如果 tag 已经包含前缀，则直接返回
         if tag_lower.startswith("artist:"):
             return tag
-        # 将 artist_triggers 集合转换为小写进行比较
-        triggers_lower = {trigger.lower() for trigger in PromptConverter.artist_triggers}
-        if tag_lower in triggers_lower:
-            return "artist:" + tag
-        return tag 
\ No newline at end of file
+        trigger = index.resolve(tag)
+        if trigger is None and Config.ARTIST_FUZZY_DISTANCE > 0 and len(tag) >= Config.ARTIST_FUZZY_MIN_LENGTH:
+            matches = index.fuzzy(tag, Config.ARTIST_FUZZY_DISTANCE)
+            if matches and (len(matches) == 1 or matches[0][1] < matches[1][1]):
+                trigger = matches[0][0]
+        if trigger is None:
+            return tag
+        return "artist:" + (trigger if Config.ARTIST_CANONICAL_NAMES else tag)
@@ -0,0 +1,357 @@
+"""
+提示词倒排索引。
+
+由图片元数据中解析出的 (tag, weight) 构建 tag → 图片 的倒排表，倒排表使用紧凑数组存储，
+支持布尔查询、权重范围查询以及增量添加 / 删除图片。
+
+查询语法（逗号分隔的条件之间为"与"关系）：
+    long hair, artist:foo>1.1      同时包含 long hair 与权重大于 1.1 的 artist:foo
+    1girl, -monochrome             包含 1girl 且不包含 monochrome
+    cat | dog, smile<=0.9          包含 cat 或 dog，且 smile 的权重不超过 0.9
+"""
+import json
+import operator
+import os
+import re
+import sqlite3
+import struct
+from array import array
+from typing import Callable, Iterable, Iterator, Optional
+import numpy as np
+from prompt_converter import PromptConverter, parse_sd
+from generation_parameters import GenerationParameters
+
+_WEIGHT_FILTER = re.compile(r'^(.*?)\s*(>=|<=|>|<|=)\s*(\d+(?:\.\d*)?|\.\d+)$')
+_COMPARATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': lambda weight, value: abs(weight - value) < 0.001,
+}
+
+# 索引文件：文件头、JSON（路径、tag、已删除的图片与各倒排表长度），之后依次是小端序的
+# 图片 id（uint32）与权重（float64）。只包含数据，加载时不会执行任何代码
+_INDEX_MAGIC = b'SDPI'
+_INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct('<4sIQ')
+_ID_DTYPE = np.dtype('<u4')
+_WEIGHT_DTYPE = np.dtype('<f8')
+_EMPTY_IDS = np.empty(0, dtype=_ID_DTYPE)
+_EMPTY_WEIGHTS = np.empty(0, dtype=_WEIGHT_DTYPE)
+
+
+def normalize_tag(tag: str) -> str:
+    """
+    索引使用的 tag 形式：小写，下划线视为空格，去掉首尾的括号与多余空白
+    """
+    return ' '.join(tag.lower().replace('_', ' ').split()).strip('()[]{} ')
+
+
+def tag_weights(nodes: Iterable[tuple], key: Callable[[str], str] = normalize_tag) -> dict:
+    """
+    汇总一条提示词解析出的 (tag, weight) 列表，返回 {tag: 权重}：
+    SD 格式中的普通文本可能包含多个以逗号分隔的 tag，逐个经 key 归一化，同一 tag 取最大权重（权重可以为 0）
+    """
+    weights = {}
+    for text, weight in nodes:
+        for tag in text.split(','):
+            tag = key(tag)
+            if tag and (tag not in weights or weights[tag] < weight):
+                weights[tag] = weight
+    return weights
+
+
+def _union(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    两个有序且无重复的 id 数组求并集（np.union1d 对整数走哈希去重，大数组时明显更慢）
+    """
+    merged = np.concatenate((a, b))
+    merged.sort(kind='stable')
+    keep = np.empty(len(merged), dtype=bool)
+    keep[:1] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+def prompt_from_metadata(metadata: dict) -> tuple:
+    """
+    从 MetadataExtractor.extract_metadata 的结果中取出正向提示词，返回 (提示词, 格式)。
+    A1111 的 Parameters 与普通文本按 SD 格式解析，NovelAI 的 Description 按 NAI 格式解析。
+    """
+    if metadata.get("Parameters"):
+        parameters = metadata["Parameters"]
+        if not isinstance(parameters, GenerationParameters):
+            parameters = GenerationParameters.parse(parameters)
+        return parameters.prompt, "sd"
+    if metadata.get("Description"):
+        return metadata["Description"], "nai"
+    prompt = metadata.get("Prompt")
+    if prompt and not prompt.lstrip().startswith("{"):
+        return prompt, "sd"
+    return "", "sd"
+
+
+def iter_scan_results(path: str) -> Iterator[tuple]:
+    """
+    逐条读取 metadata_scanner 的输出（JSONL 或 SQLite），返回 (图片路径, 元数据)
+    """
+    if path.lower().endswith(('.sqlite', '.db')):
+        conn = sqlite3.connect(path)
+        try:
+            for image_path, result in conn.execute("SELECT path, result FROM metadata ORDER BY rowid"):
+                yield image_path, json.loads(result)
+        finally:
+            conn.close()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["path"], record.get("metadata") or {}
+
+
+class PromptIndex:
+    """
+    提示词倒排索引：每个 tag 对应一个按图片 id 递增的 uint32 倒排表与等长的 float64 权重表（NumPy 数组）。
+    新增的图片先追加到 array 缓冲区，查询到该 tag 时再并入数组；查询直接在数组上求交 / 并 / 差，
+    权重条件按数组批量比较。
+    图片 id 只增不减，删除的图片记录在墓碑集合中，查询时过滤，可通过 compact() 回收。
+    """
+    def __init__(self):
+        self.paths = []          # 图片 id → 路径（已删除为 None）
+        self._ids = {}           # 路径 → 图片 id
+        self.tags = []           # tag id → tag
+        self._tag_ids = {}       # tag → tag id
+        self._postings = []      # tag id → 图片 id 数组
+        self._weights = []       # tag id → 权重数组
+        self._pending = {}       # tag id → 尚未并入数组的 (array('I'), array('d'))
+        self._deleted = set()
+        self._deleted_ids = None  # 墓碑集合的有序数组缓存
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, path: str, nodes: Iterable[tuple]):
+        """
+        添加一张图片的 (tag, weight) 列表；同一路径重复添加时替换旧记录
+        """
+        if path in self._ids:
+            self.remove(path)
+        image_id = len(self.paths)
+        self.paths.append(path)
+        self._ids[path] = image_id
+
+        for key, weight in tag_weights(nodes).items():
+            tag_id = self._tag_ids.get(key)
+            if tag_id is None:
+                tag_id = len(self.tags)
+                self._tag_ids[key] = tag_id
+                self.tags.append(key)
+                self._postings.append(_EMPTY_IDS)
+                self._weights.append(_EMPTY_WEIGHTS)
+            pending = self._pending.get(tag_id)
+            if pending is None:
+                pending = self._pending[tag_id] = (array('I'), array('d'))
+            pending[0].append(image_id)
+            pending[1].append(weight)
+
+    def _posting(self, tag_id: int) -> tuple:
+        """
+        返回 tag 的 (图片 id, 权重) 数组，先并入缓冲区中新增的图片
+        """
+        pending = self._pending.pop(tag_id, None)
+        if pending is not None:
+            ids, weights = pending
+            self._postings[tag_id] = np.concatenate((self._postings[tag_id], np.asarray(ids, dtype=_ID_DTYPE)))
+            self._weights[tag_id] = np.concatenate((self._weights[tag_id], np.asarray(weights, dtype=_WEIGHT_DTYPE)))
+        return self._postings[tag_id], self._weights[tag_id]
+
+    def add_prompt(self, path: str, prompt: str, fmt: str = "sd"):
+        """
+        解析提示词并添加到索引，fmt 为 "sd" 或 "nai"
+        """
+        if fmt == "nai":
+            nodes, _ = PromptConverter.parse_and_count_brackets(prompt)
+        else:
+            nodes = parse_sd(prompt)
+        self.add(path, nodes)
+
+    def add_metadata(self, path: str, metadata: dict):
+        """
+        将 MetadataExtractor.extract_metadata 的结果添加到索引
+        """
+        prompt, fmt = prompt_from_metadata(metadata)
+        self.add_prompt(path, prompt, fmt)
+
+    def remove(self, path: str) -> bool:
+        """
+        从索引中删除图片，返回是否存在
+        """
+        image_id = self._ids.pop(path, None)
+        if image_id is None:
+            return False
+        self.paths[image_id] = None
+        self._deleted.add(image_id)
+        self._deleted_ids = None
+        return True
+
+    def compact(self):
+        """
+        重建倒排表，回收已删除图片占用的 id
+        """
+        if not self._deleted:
+            return
+        alive = np.array([path is not None for path in self.paths], dtype=bool)
+        remap = (np.cumsum(alive) - 1).astype(_ID_DTYPE)
+        for tag_id in range(len(self.tags)):
+            postings, weights = self._posting(tag_id)
+            kept = alive[postings]
+            self._postings[tag_id] = remap[postings[kept]]
+            self._weights[tag_id] = weights[kept]
+        self.paths = [path for path in self.paths if path is not None]
+        self._ids = {path: image_id for image_id, path in enumerate(self.paths)}
+        self._deleted = set()
+        self._deleted_ids = None
+
+    def _match_term(self, term: str) -> np.ndarray:
+        """
+        查询单个条件：tag 或 tag<比较符><权重>，返回有序的图片 id 数组
+        """
+        match = _WEIGHT_FILTER.match(term)
+        tag = normalize_tag(match.group(1) if match else term)
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            return _EMPTY_IDS
+        postings, weights = self._posting(tag_id)
+        if not match:
+            return postings
+        compare = _COMPARATORS[match.group(2)]
+        return postings[compare(weights, float(match.group(3)))]
+
+    def search(self, query: str, limit: Optional[int] = None) -> list:
+        """
+        执行查询，按添加顺序返回匹配的图片路径
+        """
+        required = []
+        excluded = []
+        for clause in query.split(','):
+            clause = clause.strip()
+            if not clause:
+                continue
+            negate = clause.startswith('-')
+            if negate:
+                clause = clause[1:].strip()
+            terms = [term.strip() for term in clause.split('|') if term.strip()]
+            if not terms:
+                continue
+            ids = self._match_term(terms[0])
+            for term in terms[1:]:
+                ids = _union(ids, self._match_term(term))
+            (excluded if negate else required).append(ids)
+
+        if required:
+            required.sort(key=len)
+            result = required[0]
+            for ids in required[1:]:
+                if not len(result):
+                    break
+                result = np.intersect1d(result, ids, assume_unique=True)
+        else:
+            result = np.arange(len(self.paths), dtype=_ID_DTYPE)
+        if self._deleted:
+            if self._deleted_ids is None:
+                self._deleted_ids = np.array(sorted(self._deleted), dtype=_ID_DTYPE)
+            excluded.append(self._deleted_ids)
+        for ids in excluded:
+            if not len(result):
+                break
+            result = np.setdiff1d(result, ids, assume_unique=True)
+
+        if limit is not None:
+            result = result[:limit]
+        return [self.paths[image_id] for image_id in result.tolist()]
+
+    def top_tags(self, count: int = 50) -> list:
+        """
+        返回出现次数最多的 tag 及其图片数（compact() 之前包含已删除的图片）
+        """
+        sizes = [len(postings) for postings in self._postings]
+        for tag_id, (ids, _) in self._pending.items():
+            sizes[tag_id] += len(ids)
+        ranked = sorted(((size, tag_id) for tag_id, size in enumerate(sizes)), reverse=True)
+        return [(self.tags[tag_id], size) for size, tag_id in ranked[:count]]
+
+    def save(self, path: str):
+        """
+        保存索引到文件，先写入临时文件再替换
+        """
+        tables = [self._posting(tag_id) for tag_id in range(len(self.tags))]
+        header = json.dumps({
+            "paths": self.paths, "tags": self.tags, "deleted": sorted(self._deleted),
+            "sizes": [len(ids) for ids, _ in tables],
+        }, ensure_ascii=False).encode("utf-8")
+        postings = np.concatenate([_EMPTY_IDS] + [ids for ids, _ in tables])
+        weights = np.concatenate([_EMPTY_WEIGHTS] + [w for _, w in tables])
+        tmp_path = path + '.tmp'
+        with open(tmp_path, "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, len(header)))
+            f.write(header)
+            f.write(postings.tobytes())
+            f.write(weights.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PromptIndex":
+        """
+        从 save() 保存的文件加载索引，文件格式不符或数据不一致时抛出 ValueError
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _INDEX_HEADER.size:
+            raise ValueError(f"索引文件格式无效: {path}")
+        magic, version, header_size = _INDEX_HEADER.unpack_from(data)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise ValueError(f"索引文件格式无效: {path}")
+        start = _INDEX_HEADER.size
+        try:
+            state = json.loads(data[start:start + header_size].decode("utf-8"))
+            paths, tags, deleted, sizes = state["paths"], state["tags"], state["deleted"], state["sizes"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"索引文件格式无效: {path}") from e
+        if (not all(isinstance(p, str) or p is None for p in paths) or not all(isinstance(t, str) for t in tags)
+                or len(sizes) != len(tags) or not all(isinstance(n, int) and n >= 0 for n in sizes)
+                or not all(isinstance(i, int) and 0 <= i < len(paths) for i in deleted)):
+            raise ValueError(f"索引文件格式无效: {path}")
+        total = sum(sizes)
+        start += header_size
+        if len(data) != start + 12 * total:
+            raise ValueError(f"索引文件格式无效: {path}")
+        postings = np.frombuffer(data, dtype=_ID_DTYPE, count=total, offset=start)
+        weights = np.frombuffer(data, dtype=_WEIGHT_DTYPE, count=total, offset=start + 4 * total)
+        if total and int(postings.max()) >= len(paths):
+            raise ValueError(f"索引文件格式无效: {path}")
+
+        # 各倒排表为整块只读数据的视图，之后新增图片并入时会复制为独立数组
+        index = cls()
+        index.paths = paths
+        index.tags = tags
+        index._deleted = set(deleted)
+        offset = 0
+        for size in sizes:
+            index._postings.append(postings[offset:offset + size])
+            index._weights.append(weights[offset:offset + size])
+            offset += size
+        index._ids = {p: i for i, p in enumerate(index.paths) if p is not None}
+        index._tag_ids = {tag: i for i, tag in enumerate(index.tags)}
+        return index
+
+    @classmethod
+    def from_scan_results(cls, path: str) -> "PromptIndex":
+        """
+        由 metadata_scanner 的输出（JSONL 或 SQLite）构建索引
+        """
+        index = cls()
+        for image_path, metadata in iter_scan_results(path):
+            index.add_metadata(image_path, metadata)
+        return index
@@ -0,0 +1,198 @@
+"""
+提示词转换的参考实现，供 fuzz_converter.py 做差分测试。
+
+内容冻结自最初逐字符解析的 PromptConverter（nai_to_sd / sd_to_nai / parse_and_count_brackets /
+escape_inner_parentheses / clean_output），只去掉了读取 danbooru_art.csv 的部分：
+艺术家前缀按空的 trigger 集合处理。这里的代码用来定义"正确"的输出，不要优化或修改；
+转换行为有意变更时，应同时更新这里并在提交说明中写明。
+"""
+import re
+from decimal import Decimal, ROUND_HALF_UP
+from config import Config
+
+
+def round_half_up(n: float, decimals: int = 3) -> float:
+    """
+    对浮点数 n 按四舍五入（half-up）方式保留指定小数位数。
+    """
+    quant = Decimal(f'1.{"0"*decimals}')
+    return float(Decimal(n).quantize(quant, rounding=ROUND_HALF_UP))
+
+
+def escape_inner_parentheses(text: str) -> str:
+    """
+    转义文本中的内部括号：未转义的 "(" 前面没有下划线时插入下划线，"(" 与 ")" 前加反斜杠
+    """
+    result = []
+    i = 0
+    while i < len(text):
+        if text[i] == '(':
+            if i > 0 and text[i-1] not in ['\\', '_']:
+                result.append('_\\(')
+            elif i > 0 and text[i-1] == '_':
+                result.append('\\(')
+            else:
+                result.append('\\(')
+            i += 1
+        elif text[i] == ')':
+            if i == 0 or text[i-1] != '\\':
+                result.append('\\)')
+            else:
+                result.append(')')
+            i += 1
+        else:
+            result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+
+def clean_output(text: str) -> str:
+    """
+    将句号与顿号替换为逗号，删除逗号前后的空格，合并连续逗号并去除首尾逗号
+    """
+    text = text.replace('。', ',').replace('、', ',')
+    text = re.sub(r'\s*,\s*', ',', text)
+    text = re.sub(r',+', ',', text)
+    return text.strip(',')
+
+
+def add_artist_prefix(tag: str) -> str:
+    """
+    参考实现不加载艺术家表，等价于 trigger 集合为空：原样返回 tag
+    """
+    return tag
+
+
+def parse_and_count_brackets(text: str, pos: int = 0, outer_curly: int = 0, outer_square: int = 0) -> tuple[list, int]:
+    """
+    逐字符解析大括号与方括号并计算标签权重，返回 ([(标签, 权重), ...], 结束位置)
+    """
+    positive_factor = Config.BRACKET_RULES.get('{', (1.05, '}'))[0]
+    negative_factor = 1 / positive_factor
+
+    result = []
+    current_tag = ""
+    curly_count = outer_curly
+    square_count = outer_square
+
+    while pos < len(text):
+        char = text[pos]
+        if char == '{':
+            curly_count += 1
+        elif char == '[':
+            square_count += 1
+        elif char == '}' and curly_count > outer_curly:
+            if current_tag:
+                weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
+                weight = round_half_up(weight, Config.WEIGHT_PRECISION)
+                result.append((current_tag.strip(), weight))
+                current_tag = ""
+            curly_count -= 1
+        elif char == ']' and square_count > outer_square:
+            if current_tag:
+                weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
+                weight = round_half_up(weight, Config.WEIGHT_PRECISION)
+                result.append((current_tag.strip(), weight))
+                current_tag = ""
+            square_count -= 1
+        elif char == ',':
+            if current_tag:
+                if curly_count > outer_curly or square_count > outer_square:
+                    weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
+                    weight = round_half_up(weight, Config.WEIGHT_PRECISION)
+                    result.append((current_tag.strip(), weight))
+                else:
+                    result.append((current_tag.strip(), 1.0))
+                current_tag = ""
+        else:
+            current_tag += char
+        pos += 1
+
+    if current_tag:
+        if curly_count > outer_curly or square_count > outer_square:
+            weight = (positive_factor ** (curly_count - outer_curly)) * (negative_factor ** (square_count - outer_square))
+            weight = round_half_up(weight, Config.WEIGHT_PRECISION)
+            result.append((current_tag.strip(), weight))
+        else:
+            result.append((current_tag.strip(), 1.0))
+    return result, pos
+
+
+def nai_to_sd(prompt: str) -> str:
+    """
+    将 NAI 格式转换为 SD 格式
+    """
+    if not isinstance(prompt, str):
+        return ""
+    try:
+        # 临时替换 "artist:" 避免在解析时冲突
+        prompt = prompt.replace("artist:", "artist_")
+        tags, _ = parse_and_count_brackets(prompt)
+        result_tags = []
+        for tag, weight in tags:
+            tag = tag.replace("artist_", "artist:")
+            tag = add_artist_prefix(tag)
+            if abs(weight - 1.0) < 0.001:
+                result_tags.append(tag)
+            else:
+                escaped_tag = escape_inner_parentheses(tag)
+                result_tags.append(f"({escaped_tag}:{weight:.3f})")
+        return clean_output(", ".join(result_tags))
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+def _sd_to_nai(prompt: str) -> str:
+    if not isinstance(prompt, str):
+        return "Error: Input must be a string"
+    try:
+        prompt = prompt.strip()
+        prompt = re.sub(r',\s*,', ',', prompt)
+        prompt = prompt.strip(',')
+        pattern = r'\((.*?):([\d.]+)\)'
+        tags = []
+        last_end = 0
+        for match in re.finditer(pattern, prompt):
+            if match.start() > last_end:
+                plain_text = prompt[last_end:match.start()].strip(' ,')
+                if plain_text:
+                    tags.append((plain_text, 1.0))
+            tag = match.group(1).strip()
+            # 还原 SD 转换过程中对括号的转义
+            tag = tag.replace('\\(', '(').replace('\\)', ')')
+            # 如果 tag 中的左括号前没有下划线，则插入下划线
+            tag = re.sub(r'(?<!_)[(]', '_(', tag)
+            weight = float(match.group(2))
+            tags.append((tag, weight))
+            last_end = match.end()
+        if last_end < len(prompt):
+            plain_text = prompt[last_end:].strip(' ,')
+            if plain_text:
+                tags.append((plain_text, 1.0))
+        result_tags = []
+        for tag, weight in tags:
+            tag = add_artist_prefix(tag)
+            if abs(weight - 1.0) < 0.001:
+                result_tags.append(tag)
+            else:
+                if weight > 1.0:
+                    count = round((weight - 1.0) / Config.WEIGHT_STEP)
+                    result_str = '{' * count + tag + '}' * count
+                else:
+                    count = round((1.0 - weight) / Config.WEIGHT_STEP)
+                    result_str = '[' * count + tag + ']' * count
+                result_tags.append(result_str)
+        return clean_output(", ".join(result_tags))
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+def sd_to_nai(prompt: str) -> str:
+    """
+    将 SD 格式转换为 NAI 格式；转义的括号在转换前替换为占位符，转换后还原
+    """
+    if not isinstance(prompt, str):
+        return _sd_to_nai(prompt)
+    processed = Config.ESCAPE_PATTERN.sub(r"__ESC_\1__", prompt)
+    result = _sd_to_nai(processed)
+    return re.sub(r"__ESC_([{}()[\]]])__", r"\1", result)
@@ -0,0 +1,107 @@
+"""
+启动相关的工具：后台预热艺术家索引，以及各入口模块的导入耗时统计。
+
+导入耗时在独立的子进程中用 python -X importtime 测量，避免受当前进程已导入模块的影响：
+    python main.py --startup-report                          # 统计全部入口模块
+    python main.py --startup-report api_server --startup-budget 150
+"""
+import os
+import subprocess
+import sys
+import threading
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+# 默认统计的入口模块：转换库、无界面 HTTP 接口与 Gradio 界面
+ENTRY_MODULES = ('prompt_converter', 'api_server', 'gradio_interface')
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def prewarm_artist_index() -> threading.Thread:
+    """
+    在后台线程中加载艺术家索引，与界面模块的导入同时进行；第一次转换时若仍在加载则等待其完成
+    """
+    def load():
+        from prompt_converter import PromptConverter
+        try:
+            PromptConverter._ensure_artist_index()
+        except Exception:
+            logger.exception("预加载艺术家索引失败")
+
+    thread = threading.Thread(target=load, name="prewarm-artist-index", daemon=True)
+    thread.start()
+    return thread
+
+
+def _parse_importtime(stderr: str) -> list:
+    """
+    解析 -X importtime 的输出，返回 [(模块, 自身耗时微秒, 累计耗时微秒, 嵌套深度), ...]
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        entries.append((stripped, int(fields[0]), int(fields[1]), (len(name) - len(stripped)) // 2))
+    return entries
+
+
+def import_time_report(module: str, top: int = 10) -> dict:
+    """
+    在新的解释器中导入 module，返回总导入耗时（毫秒）与累计耗时最多的 top 个依赖
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {"module": module, "error": lines[-1] if lines else f"退出码 {result.returncode}"}
+    entries = _parse_importtime(result.stderr)
+    # 输出按导入完成的顺序排列：目标模块的依赖是紧挨在它之前、嵌套深度大于 0 的连续各行，
+    # 更早的顶层条目（site 等）属于解释器启动，不计入
+    end = next((i for i, entry in enumerate(entries) if entry[0] == module and entry[3] == 0), None)
+    if end is None:
+        return {"module": module, "error": "没有找到导入记录（模块可能已在解释器启动时导入）"}
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    dependencies = entries[start:end]
+    heaviest = sorted(dependencies, key=lambda entry: entry[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": entries[end][2] / 1000,
+        "modules": len(dependencies) + 1,
+        "heaviest": [{"module": name, "self_ms": own / 1000, "cumulative_ms": cumulative / 1000}
+                     for name, own, cumulative, _ in heaviest],
+    }
+
+
+def format_report(reports: list, budget_ms: float = 0) -> str:
+    """
+    将 import_time_report 的结果格式化为文本
+    """
+    lines = []
+    for report in reports:
+        if "error" in report:
+            lines.append(f"{report['module']}: 导入失败（{report['error']}）")
+            continue
+        status = ""
+        if budget_ms and report["total_ms"] > budget_ms:
+            status = f"  超出预算 {budget_ms:.0f} ms"
+        lines.append(f"{report['module']}: {report['total_ms']:.1f} ms，共 {report['modules']} 个模块{status}")
+        for entry in report["heaviest"]:
+            lines.append(f"    {entry['cumulative_ms']:>9.1f} ms  {entry['self_ms']:>8.1f} ms  {entry['module']}")
+    return "\n".join(lines)
+
+
+def over_budget(reports: list, budget_ms: float) -> bool:
+    """
+    是否有入口模块导入失败或超出预算（budget_ms 为 0 时只检查导入失败）
+    """
+    return any("error" in report or (budget_ms and report["total_ms"] > budget_ms) for report in reports)
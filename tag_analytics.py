@@ -0,0 +1,643 @@
+"""
+提示词语料的 tag 统计：出现频率、平均权重与共现。
+
+按与 PromptIndex 相同的方式解析提示词（tag 归一化，SD 普通文本按逗号切分），艺术家统一带 "artist:" 前缀。
+tag 驻留为整数 id，每个 tag 的统计保存在紧凑数组中；共现对的数量随 tag 数平方增长，
+超过 Config.ANALYTICS_MAX_EXACT_PAIRS 后改为近似统计：Space-Saving 保留出现最多的共现对，
+Count-Min Sketch 估计任意共现对的次数，两者都只会高估，取其中较小的值。
+共现对编码为 uint64 后用 NumPy 批量去重计数，sketch 同样按数组批量更新。
+统计结果可以合并，多进程分块统计后在主进程汇总，是否改为近似统计只由主进程决定。
+
+用法示例：
+    python -m tag_analytics prompts.txt --syntax nai -o report.json
+    python -m tag_analytics metadata.sqlite --scan -o report.csv --top 200 --workers 8
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from itertools import islice
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional
+import numpy as np
+from config import Config
+from prompt_converter import PromptConverter, parse_sd, _init_batch_worker
+from prompt_index import normalize_tag, tag_weights, prompt_from_metadata, iter_scan_results
+from batch_convert import detect_format, read_records
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+SYNTAXES = ('sd', 'nai')
+# 近似统计中共现对的键：两个 tag 按字符串排序后以制表符连接
+_PAIR_SEPARATOR = '\t'
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 的混合函数，对 uint64 数组逐项计算（乘法按 2**64 取模）
+    """
+    with np.errstate(over='ignore'):
+        values = values ^ (values >> np.uint64(30))
+        values = values * np.uint64(0xBF58476D1CE4E5B9)
+        values = values ^ (values >> np.uint64(27))
+        values = values * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+def _tag_hash(tag: str) -> int:
+    """
+    tag 的 64 位哈希，与进程无关，各进程的统计可以直接合并
+    """
+    return int.from_bytes(hashlib.blake2b(tag.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _pair_hashes(a_hashes: np.ndarray, b_hashes: np.ndarray) -> np.ndarray:
+    """
+    由两个 tag 的哈希计算共现对的哈希，与两个 tag 的先后顺序无关
+    """
+    with np.errstate(over='ignore'):
+        return _mix(np.minimum(a_hashes, b_hashes) ^ _mix(np.maximum(a_hashes, b_hashes)))
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch：depth 行、每行 width 个计数器（NumPy uint64 数组），估计值不小于真实次数。
+    以共现对的 64 位哈希为键，每行的位置由哈希与行号再次混合得到；
+    add 与 estimate 按数组批量计算，宽度与深度相同的两个 sketch 可以逐项相加合并。
+    """
+    def __init__(self, width: int = Config.ANALYTICS_SKETCH_WIDTH, depth: int = Config.ANALYTICS_SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = np.zeros((depth, width), dtype=np.uint64)
+
+    def _slots(self, hashes: np.ndarray) -> list:
+        width = np.uint64(self.width)
+        with np.errstate(over='ignore'):
+            return [(_mix(hashes + np.uint64(0x9E3779B97F4A7C15) * np.uint64(i + 1)) % width).astype(np.intp)
+                    for i in range(self.depth)]
+
+    def add(self, hashes: np.ndarray, counts=1):
+        """
+        将 hashes 中每个键的计数加上 counts（标量或等长数组）
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64).ravel()
+        if not len(hashes):
+            return
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.uint64), hashes.shape)
+        for row, slots in zip(self.rows, self._slots(hashes)):
+            if len(hashes) > self.width // 8:
+                row += np.bincount(slots, weights=counts, minlength=self.width).astype(np.uint64)
+            else:
+                np.add.at(row, slots, counts)
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        返回 hashes 中每个键的估计次数
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64).ravel()
+        estimates = None
+        for row, slots in zip(self.rows, self._slots(hashes)):
+            values = row[slots]
+            estimates = values if estimates is None else np.minimum(estimates, values)
+        return estimates
+
+    def merge(self, other: "CountMinSketch"):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min Sketch 的宽度与深度不同，无法合并")
+        self.rows += other.rows
+
+    def __getstate__(self) -> dict:
+        # 子进程传回的 sketch 计数通常不超过 uint32，按 uint32 序列化可减少一半数据量
+        state = dict(self.__dict__)
+        if not len(self.rows) or int(self.rows.max()) <= 0xFFFFFFFF:
+            state["rows"] = self.rows.astype(np.uint32)
+        return state
+
+    def __setstate__(self, state: dict):
+        state["rows"] = state["rows"].astype(np.uint64)
+        self.__dict__.update(state)
+
+
+class SpaceSaving:
+    """
+    Space-Saving 高频项统计：最多保留约 2 * capacity 个计数器，超出时只保留计数最大的 capacity 个。
+    被淘汰的最大计数记为 floor，之后新出现的项以 floor 为误差起点，计数值不小于真实次数。
+    """
+    def __init__(self, capacity: int = Config.ANALYTICS_PAIR_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}    # 键 → [计数, 误差上界]
+        self.floor = 0
+
+    def add(self, key: str, count: int = 1):
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += count
+            return
+        self.counts[key] = [self.floor + count, self.floor]
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counts.items(), key=lambda item: item[1][0], reverse=True)
+        if len(ranked) > self.capacity:
+            self.floor = max(self.floor, ranked[self.capacity][1][0])
+        self.counts = dict(ranked[:self.capacity])
+
+    def merge(self, other: "SpaceSaving"):
+        """
+        合并另一份统计：只出现在一侧的键，另一侧按其 floor 计入计数与误差
+        """
+        merged = {}
+        for key in self.counts.keys() | other.counts.keys():
+            count, error = self.counts.get(key, (self.floor, self.floor))
+            other_count, other_error = other.counts.get(key, (other.floor, other.floor))
+            merged[key] = [count + other_count, error + other_error]
+        self.counts = merged
+        self.floor += other.floor
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def top(self, count: int) -> list:
+        """
+        返回计数最大的 count 项 [(键, 计数, 误差上界), ...]
+        """
+        items = heapq.nlargest(count, self.counts.items(), key=lambda item: item[1][0])
+        return [(key, entry[0], entry[1]) for key, entry in items]
+
+
+def _stats_key(tag: str) -> str:
+    """
+    统计使用的 tag 形式：与索引相同的归一化，艺术家统一带 "artist:" 前缀
+    """
+    return normalize_tag(PromptConverter.add_artist_prefix(tag.strip()))
+
+
+def _pair_key(a: str, b: str) -> str:
+    return a + _PAIR_SEPARATOR + b if a < b else b + _PAIR_SEPARATOR + a
+
+
+_triangles = {}
+
+
+def _triangle(size: int) -> tuple:
+    """
+    size 个元素两两组合的下标（上三角，不含对角线），按 size 缓存
+    """
+    indices = _triangles.get(size)
+    if indices is None:
+        indices = np.triu_indices(size, 1)
+        if size <= 256:
+            _triangles[size] = indices
+    return indices
+
+
+def _aggregate(parts: list) -> tuple:
+    """
+    合并若干 (共现对数组, 次数数组或 None) 并按键去重求和，返回按键排序的 (keys, counts)
+    """
+    keys = np.concatenate([part_keys for part_keys, _ in parts])
+    counts = np.concatenate([np.ones(len(part_keys), dtype=np.uint64) if part_counts is None else part_counts
+                             for part_keys, part_counts in parts])
+    if not len(keys):
+        return keys.astype(np.uint64), counts.astype(np.uint64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=counts, minlength=len(unique)).astype(np.uint64)
+
+
+class TagStats:
+    """
+    一批提示词的 tag 统计。每个 tag 记录出现的提示词数、权重之和、加强（> 1）与减弱（< 1）的次数，
+    同一提示词中重复出现的 tag 只计一次，取最大的权重。
+
+    共现对以 (较小 id << 32 | 较大 id) 编码为 uint64，逐条提示词生成后先放入缓冲区，
+    攒够一批再用 NumPy 排序去重后合并。精确统计保存为按键排序的 pair_keys 与 pair_counts 两个数组；
+    近似统计时每批共现对计入 Count-Min Sketch，并把本批出现最多的 pair_capacity 个并入 Space-Saving。
+    max_exact_pairs 为 None 时不会自动改为近似统计。
+    """
+    # 缓冲区中的共现对超过该数量时合并一次
+    PAIR_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, max_exact_pairs: Optional[int] = Config.ANALYTICS_MAX_EXACT_PAIRS,
+                 pair_capacity: int = Config.ANALYTICS_PAIR_CAPACITY, approximate: bool = False):
+        self.max_exact_pairs = max_exact_pairs
+        self.pair_capacity = pair_capacity
+        self.prompts = 0
+        self.tags = []               # tag id → tag
+        self._tag_ids = {}           # tag → tag id
+        self.tag_hashes = array('Q')
+        self.counts = array('Q')
+        self.weight_sums = array('d')
+        self.emphasized = array('Q')
+        self.weakened = array('Q')
+        self.pair_keys = np.zeros(0, dtype=np.uint64)      # 精确统计：排序后的共现对
+        self.pair_counts = np.zeros(0, dtype=np.uint64)    # 精确统计：对应的共现次数
+        self._pending = []           # 尚未合并的 (共现对数组, 次数数组或 None)
+        self._pending_size = 0
+        self.pair_sketch = None      # 近似统计：CountMinSketch
+        self.pair_top = None         # 近似统计：SpaceSaving
+        if approximate:
+            self._switch_to_approximate()
+
+    def __getstate__(self) -> dict:
+        # 传回主进程前先合并缓冲区
+        self._flush_pairs()
+        return self.__dict__
+
+    @property
+    def approximate(self) -> bool:
+        """
+        共现对是否已改为近似统计（先合并缓冲区，缓冲区中的共现对可能使其超过上限）
+        """
+        if self.pair_top is None and self._pending:
+            self._flush_pairs()
+        return self.pair_top is not None
+
+    def _intern(self, tag: str) -> int:
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+            self.tag_hashes.append(_tag_hash(tag))
+            self.counts.append(0)
+            self.weight_sums.append(0.0)
+            self.emphasized.append(0)
+            self.weakened.append(0)
+        return tag_id
+
+    def add_nodes(self, nodes: Iterable[tuple]):
+        """
+        统计一条提示词解析出的 (tag, weight) 列表
+        """
+        weights = tag_weights(nodes, _stats_key)
+        self.prompts += 1
+        tag_ids = []
+        for key, weight in weights.items():
+            tag_id = self._intern(key)
+            tag_ids.append(tag_id)
+            self.counts[tag_id] += 1
+            self.weight_sums[tag_id] += weight
+            if weight > 1.0005:
+                self.emphasized[tag_id] += 1
+            elif weight < 0.9995:
+                self.weakened[tag_id] += 1
+        if len(tag_ids) > 1:
+            ids = np.array(sorted(tag_ids), dtype=np.uint64)
+            first, second = _triangle(len(ids))
+            self._queue_pairs(ids[first] << np.uint64(32) | ids[second])
+
+    def _queue_pairs(self, keys: np.ndarray, counts: np.ndarray = None):
+        self._pending.append((keys, counts))
+        self._pending_size += len(keys)
+        if self._pending_size >= self.PAIR_BUFFER_SIZE:
+            self._flush_pairs()
+
+    def _flush_pairs(self):
+        """
+        合并缓冲区中的共现对：精确统计时并入 pair_keys / pair_counts，近似统计时计入 sketch 与 Space-Saving
+        """
+        if not self._pending:
+            return
+        keys, counts = _aggregate(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        if self.approximate:
+            self._add_approximate(keys, counts)
+            return
+        self.pair_keys, self.pair_counts = _aggregate([(self.pair_keys, self.pair_counts), (keys, counts)])
+        if self.max_exact_pairs is not None and len(self.pair_keys) > self.max_exact_pairs:
+            self._switch_to_approximate()
+
+    def _switch_to_approximate(self):
+        """
+        改为近似统计，已有的精确计数转入 Count-Min Sketch 与 Space-Saving
+        """
+        if self.approximate:
+            return
+        if len(self.pair_keys):
+            logger.info("共现对超过 %d 个，改为近似统计", self.max_exact_pairs or 0)
+        self.pair_sketch = CountMinSketch()
+        self.pair_top = SpaceSaving(self.pair_capacity)
+        pending = self._pending
+        self._pending = []
+        self._pending_size = 0
+        self._add_approximate(self.pair_keys, self.pair_counts)
+        self.pair_keys = np.zeros(0, dtype=np.uint64)
+        self.pair_counts = np.zeros(0, dtype=np.uint64)
+        if pending:
+            self._add_approximate(*_aggregate(pending))
+
+    def _add_approximate(self, keys: np.ndarray, counts: np.ndarray):
+        """
+        将一批去重后的共现对计入近似统计：全部计入 sketch，出现最多的 pair_capacity 个作为一份
+        Space-Saving 摘要合并（其余共现对的最大次数作为该摘要的 floor）
+        """
+        if not len(keys):
+            return
+        hashes = np.frombuffer(self.tag_hashes, dtype=np.uint64)
+        first, second = (keys >> np.uint64(32)).astype(np.intp), (keys & np.uint64(0xFFFFFFFF)).astype(np.intp)
+        self.pair_sketch.add(_pair_hashes(hashes[first], hashes[second]), counts)
+        summary = SpaceSaving(self.pair_capacity)
+        if len(keys) > self.pair_capacity:
+            order = np.argpartition(counts, len(counts) - self.pair_capacity)
+            summary.floor = int(counts[order[:len(counts) - self.pair_capacity]].max())
+            kept = order[len(counts) - self.pair_capacity:]
+        else:
+            kept = np.arange(len(keys))
+        tags = self.tags
+        summary.counts = {_pair_key(tags[a], tags[b]): [count, 0]
+                          for a, b, count in zip(first[kept].tolist(), second[kept].tolist(), counts[kept].tolist())}
+        self.pair_top.merge(summary)
+
+    def add_prompt(self, prompt: str, syntax: str = "sd"):
+        """
+        解析并统计一条提示词，syntax 为 "sd" 或 "nai"
+        """
+        if syntax == "nai":
+            nodes, _ = PromptConverter.parse_and_count_brackets(prompt)
+        else:
+            nodes = parse_sd(prompt)
+        self.add_nodes(nodes)
+
+    def add_metadata(self, metadata: dict):
+        """
+        统计 MetadataExtractor.extract_metadata 结果中的正向提示词
+        """
+        prompt, syntax = prompt_from_metadata(metadata)
+        self.add_prompt(prompt, syntax)
+
+    def merge(self, other: "TagStats"):
+        """
+        合并另一份统计（例如其他进程的分块结果），任一方为近似统计时合并结果也为近似统计
+        """
+        other._flush_pairs()
+        self.prompts += other.prompts
+        mapping = [self._intern(tag) for tag in other.tags]
+        for other_id, tag_id in enumerate(mapping):
+            self.counts[tag_id] += other.counts[other_id]
+            self.weight_sums[tag_id] += other.weight_sums[other_id]
+            self.emphasized[tag_id] += other.emphasized[other_id]
+            self.weakened[tag_id] += other.weakened[other_id]
+
+        if other.approximate:
+            self._switch_to_approximate()
+            self.pair_sketch.merge(other.pair_sketch)
+            self.pair_top.merge(other.pair_top)
+        if len(other.pair_keys):
+            # 将对方的 tag id 换算为本方的 id，并保持较小的 id 在高位
+            mapping = np.asarray(mapping, dtype=np.uint64)
+            first = mapping[(other.pair_keys >> np.uint64(32)).astype(np.intp)]
+            second = mapping[(other.pair_keys & np.uint64(0xFFFFFFFF)).astype(np.intp)]
+            keys = np.minimum(first, second) << np.uint64(32) | np.maximum(first, second)
+            self._queue_pairs(keys, other.pair_counts)
+
+    def mean_weight(self, tag: str) -> Optional[float]:
+        tag_id = self._tag_ids.get(normalize_tag(tag))
+        if tag_id is None or not self.counts[tag_id]:
+            return None
+        return self.weight_sums[tag_id] / self.counts[tag_id]
+
+    def _estimates(self, keys: list) -> list:
+        """
+        批量查询 Space-Saving 键（"a\tb"）在 sketch 中的估计次数
+        """
+        if not keys:
+            return []
+        pairs = [key.split(_PAIR_SEPARATOR) for key in keys]
+        a_hashes = np.array([_tag_hash(a) for a, _ in pairs], dtype=np.uint64)
+        b_hashes = np.array([_tag_hash(b) for _, b in pairs], dtype=np.uint64)
+        return self.pair_sketch.estimate(_pair_hashes(a_hashes, b_hashes)).tolist()
+
+    def cooccurrence(self, a: str, b: str) -> int:
+        """
+        两个 tag 共同出现的提示词数（近似统计时为不小于真实值的估计）
+        """
+        self._flush_pairs()
+        a, b = normalize_tag(a), normalize_tag(b)
+        if self.approximate:
+            estimate = self._estimates([_pair_key(a, b)])[0]
+            entry = self.pair_top.counts.get(_pair_key(a, b))
+            return min(estimate, entry[0]) if entry else estimate
+        a_id, b_id = self._tag_ids.get(a), self._tag_ids.get(b)
+        if a_id is None or b_id is None or a_id == b_id:
+            return 0
+        key = np.uint64(min(a_id, b_id)) << np.uint64(32) | np.uint64(max(a_id, b_id))
+        position = int(np.searchsorted(self.pair_keys, key))
+        if position < len(self.pair_keys) and self.pair_keys[position] == key:
+            return int(self.pair_counts[position])
+        return 0
+
+    def top_tags(self, count: int = Config.ANALYTICS_TOP_K, kind: Optional[str] = None) -> list:
+        """
+        返回出现次数最多的 tag id；kind 为 "artist" 时只包含艺术家，为 "tag" 时不包含艺术家
+        """
+        ids = range(len(self.tags))
+        if kind == "artist":
+            ids = [i for i in ids if self.tags[i].startswith("artist:")]
+        elif kind == "tag":
+            ids = [i for i in ids if not self.tags[i].startswith("artist:")]
+        return heapq.nlargest(count, ids, key=self.counts.__getitem__)
+
+    def top_pairs(self, count: int = Config.ANALYTICS_TOP_K) -> list:
+        """
+        返回共现次数最多的 tag 对 [(tag, tag, 次数, 误差上界), ...]
+        """
+        self._flush_pairs()
+        if self.approximate:
+            results = []
+            top = self.pair_top.top(count)
+            for (key, estimate, error), sketched in zip(top, self._estimates([key for key, _, _ in top])):
+                a, b = key.split(_PAIR_SEPARATOR)
+                results.append((a, b, min(estimate, sketched), error))
+            results.sort(key=itemgetter(2), reverse=True)
+            return results
+        keys, counts = self.pair_keys, self.pair_counts
+        if len(keys) > count:
+            kept = np.argpartition(counts, len(counts) - count)[len(counts) - count:]
+            keys, counts = keys[kept], counts[kept]
+        # 次数相同时按键排序，结果与输入顺序无关
+        order = np.lexsort((keys, -counts.astype(np.int64)))
+        return [(self.tags[key >> 32], self.tags[key & 0xFFFFFFFF], pair_count, 0)
+                for key, pair_count in zip(keys[order].tolist(), counts[order].tolist())]
+
+    def related(self, tag_ids: list, count: int = 5) -> dict:
+        """
+        返回每个 tag 共现次数最多的 count 个 tag：tag id → [(tag, 次数), ...]
+        近似统计时只能从 Space-Saving 保留的高频共现对中查找
+        """
+        self._flush_pairs()
+        wanted = set(tag_ids)
+        candidates = {tag_id: [] for tag_id in tag_ids}
+        if self.approximate:
+            top = self.pair_top.top(len(self.pair_top.counts))
+            for (key, estimate, _), sketched in zip(top, self._estimates([key for key, _, _ in top])):
+                a, b = key.split(_PAIR_SEPARATOR)
+                a_id, b_id = self._tag_ids.get(a), self._tag_ids.get(b)
+                estimate = min(estimate, sketched)
+                if a_id in wanted:
+                    candidates[a_id].append((estimate, b))
+                if b_id in wanted:
+                    candidates[b_id].append((estimate, a))
+        elif len(self.pair_keys):
+            first = (self.pair_keys >> np.uint64(32)).astype(np.int64)
+            second = (self.pair_keys & np.uint64(0xFFFFFFFF)).astype(np.int64)
+            ids = np.fromiter(wanted, dtype=np.int64, count=len(wanted))
+            for owner, other in ((first, second), (second, first)):
+                selected = np.flatnonzero(np.isin(owner, ids))
+                for tag_id, other_id, pair_count in zip(owner[selected].tolist(), other[selected].tolist(),
+                                                        self.pair_counts[selected].tolist()):
+                    candidates[tag_id].append((pair_count, self.tags[other_id]))
+        return {tag_id: [(tag, pair_count) for pair_count, tag in heapq.nlargest(count, items)]
+                for tag_id, items in candidates.items()}
+
+    def _tag_entry(self, tag_id: int, related: dict) -> dict:
+        count = self.counts[tag_id]
+        return {
+            "tag": self.tags[tag_id],
+            "count": count,
+            "share": round(count / self.prompts, 6) if self.prompts else 0.0,
+            "mean_weight": round(self.weight_sums[tag_id] / count, Config.WEIGHT_PRECISION) if count else None,
+            "emphasized": self.emphasized[tag_id],
+            "weakened": self.weakened[tag_id],
+            "related": [[tag, pair_count] for tag, pair_count in related.get(tag_id, [])],
+        }
+
+    def report(self, top: int = Config.ANALYTICS_TOP_K) -> dict:
+        """
+        生成统计报告：出现最多的 tag 与艺术家（含平均权重与最常共现的 tag）以及共现最多的 tag 对
+        """
+        tag_ids = self.top_tags(top, "tag")
+        artist_ids = self.top_tags(top, "artist")
+        related = self.related(tag_ids + artist_ids)
+        return {
+            "prompts": self.prompts,
+            "unique_tags": len(self.tags),
+            "approximate_pairs": self.approximate,
+            "tags": [self._tag_entry(tag_id, related) for tag_id in tag_ids],
+            "artists": [self._tag_entry(tag_id, related) for tag_id in artist_ids],
+            "pairs": [{"tags": [a, b], "count": pair_count, "error": error}
+                      for a, b, pair_count, error in self.top_pairs(top)],
+        }
+
+    def write_json(self, path: str, top: int = Config.ANALYTICS_TOP_K):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(top), f, ensure_ascii=False, indent=2)
+
+    def write_csv(self, path: str, top: int = Config.ANALYTICS_TOP_K):
+        """
+        以 CSV 输出报告：section 列为 tag / artist / pair，pair 行的 co_tag 为共现的另一个 tag
+        """
+        report = self.report(top)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["section", "tag", "co_tag", "count", "share", "mean_weight",
+                             "emphasized", "weakened", "error"])
+            for section, entries in (("tag", report["tags"]), ("artist", report["artists"])):
+                for entry in entries:
+                    writer.writerow([section, entry["tag"], "", entry["count"], entry["share"],
+                                     entry["mean_weight"], entry["emphasized"], entry["weakened"], 0])
+            for entry in report["pairs"]:
+                a, b = entry["tags"]
+                writer.writerow(["pair", a, b, entry["count"], "", "", "", "", entry["error"]])
+
+
+def iter_prompt_file(path: str, syntax: str = "sd", fmt: str = None, field: str = "prompt") -> Iterator[tuple]:
+    """
+    读取 TXT / JSONL / CSV 提示词文件（与 batch_convert 相同的格式），返回 (提示词, 语法)
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, "r", encoding="utf-8", newline='' if fmt == 'csv' else None) as f:
+        for _, prompt in read_records(f, fmt, field):
+            yield prompt, syntax
+
+
+def iter_scan_prompts(path: str) -> Iterator[tuple]:
+    """
+    读取 metadata_scanner 的输出（JSONL 或 SQLite），返回 (正向提示词, 语法)
+    """
+    for _, metadata in iter_scan_results(path):
+        yield prompt_from_metadata(metadata)
+
+def _analyze_chunk(chunk: list, approximate: bool = False) -> TagStats:
+    """
+    在子进程中统计一批 (提示词, 语法)，approximate 由主进程按汇总结果决定。
+    分块本身的共现对就超过上限时，合并后主进程必然改为近似统计，分块内也直接改为近似统计
+    """
+    stats = TagStats(approximate=approximate)
+    for prompt, syntax in chunk:
+        stats.add_prompt(prompt, syntax)
+    return stats
+
+
+def analyze(prompts: Iterable[tuple], workers: int = None, chunk_size: int = Config.BATCH_CHUNK_SIZE) -> TagStats:
+    """
+    统计 (提示词, 语法) 序列。输入按 chunk_size 分块后分发到进程池，各进程的结果在主进程合并；
+    workers 默认为 Config.ANALYTICS_WORKERS（0 表示 CPU 核数），workers <= 1 时在当前进程内统计。
+    是否改为近似统计由主进程汇总的结果决定：汇总的共现对超过上限后，之后提交的分块直接按近似统计，
+    子进程只传回 sketch 与高频共现对，不再生成并传回大量精确计数。
+    """
+    if not workers:
+        workers = Config.ANALYTICS_WORKERS or os.cpu_count() or 1
+    prompts = iter(prompts)
+    chunks = iter(lambda: list(islice(prompts, max(1, chunk_size))), [])
+    stats = TagStats()
+    if workers <= 1:
+        for chunk in chunks:
+            for prompt, syntax in chunk:
+                stats.add_prompt(prompt, syntax)
+        return stats
+
+    from concurrent.futures import ProcessPoolExecutor
+    PromptConverter._ensure_artist_index()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_analyze_chunk, chunk, stats.approximate))
+            # 限制在途分块数量
+            if len(pending) >= workers * 2:
+                stats.merge(pending.popleft().result())
+        while pending:
+            stats.merge(pending.popleft().result())
+    return stats
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="统计提示词语料中 tag 的频率、平均权重与共现")
+    parser.add_argument("input", help="提示词文件（TXT / JSONL / CSV）或 metadata_scanner 的输出")
+    parser.add_argument("-o", "--output", default="-", help="报告文件（.json 或 .csv），默认以 JSON 输出到标准输出")
+    parser.add_argument("--syntax", choices=SYNTAXES, default="sd", help="提示词文件的语法")
+    parser.add_argument("--scan", action="store_true", help="输入为 metadata_scanner 的输出（.sqlite / .db 自动识别）")
+    parser.add_argument("-f", "--format", choices=('txt', 'jsonl', 'csv'), help="提示词文件格式，默认根据扩展名判断")
+    parser.add_argument("--field", default="prompt", help="JSONL/CSV 中提示词的字段名")
+    parser.add_argument("--top", type=int, default=Config.ANALYTICS_TOP_K, help="报告中每类保留的条目数")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--chunk-size", type=int, default=Config.BATCH_CHUNK_SIZE, help="每个分块的提示词数量")
+    args = parser.parse_args(argv)
+
+    if args.scan or args.input.lower().endswith(('.sqlite', '.db')):
+        prompts = iter_scan_prompts(args.input)
+    else:
+        prompts = iter_prompt_file(args.input, args.syntax, args.format, args.field)
+    start = time.perf_counter()
+    stats = analyze(prompts, workers=args.workers, chunk_size=args.chunk_size)
+    logger.info("统计完成：共 %d 条提示词、%d 个 tag，用时 %.2f 秒",
+                stats.prompts, len(stats.tags), time.perf_counter() - start)
+
+    if args.output == '-':
+        json.dump(stats.report(args.top), sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+    elif args.output.lower().endswith('.csv'):
+        stats.write_csv(args.output, args.top)
+    else:
+        stats.write_json(args.output, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+提示词库的批量权重变换。
+
+PromptBatch 将大量提示词解析为列式数组：
+    tag_ids   每个节点的 tag id（int32），tags[tag_id] 为 tag 文本
+    weights   每个节点的权重（float64）
+    offsets   第 i 条提示词的节点位于 [offsets[i], offsets[i+1])
+权重运算（截断、缩放、归一化、按步长量化）在整个数组上向量化执行，之后按 SD 或 NAI 格式输出。
+
+NAI 输入按 PromptConverter 的规则解析。SD 输入按原文保存 tag（保留 \\( \\) 转义），普通文本按逗号拆分为
+单独的 tag，并记录每个节点在原提示词中的位置：输出 SD 格式时只替换权重有变化的节点，其余部分保持原文，
+权重都没有变化时输出与输入完全相同；输出 NAI 格式时先按上述方式得到 SD 提示词，再逐条调用
+PromptConverter.sd_to_nai 转换，两条路径的结果不会出现差异。
+
+用法示例：
+    batch = PromptBatch.from_prompts(prompts, fmt="nai")
+    batch.clip(maximum=1.3).scale(0.9, where="negative").quantize()
+    sd_prompts = batch.to_prompts("sd")
+"""
+import re
+from array import array
+from typing import Callable, Iterable, Union
+import numpy as np
+from config import Config
+from prompt_converter import PromptConverter, parse_nai, emit_sd, emit_nai, _weight_table
+
+FORMATS = ('sd', 'nai')
+# where 参数可选的节点范围
+_SELECTIONS = ('all', 'weighted', 'positive', 'negative')
+
+# SD 加权标签 (tag:weight)：左括号前不能是反斜杠，tag 中可以有转义的括号与一层成对的括号
+_SD_WEIGHTED = re.compile(r'(?<!\\)\(((?:\\.|\([^\\()]*\)|[^\\()])*?):(\d+(?:\.\d*)?|\.\d+)\)')
+_SD_ESCAPED = re.compile(r'\\([{}()\[\]])')
+_SD_UNESCAPED_PAREN = re.compile(r'(?<!\\)([()])')
+
+
+def parse_sd_spans(text: str) -> list:
+    """
+    按原文解析 SD 格式提示词，返回 [(tag, weight, weighted, start, end), ...]。
+    加权标签的 tag 保持原文（包括 \\( \\) 转义），weighted 为 True，[start, end) 为权重数字在 text 中的范围；
+    加权标签之间的普通文本按逗号拆分，每个 tag 权重为 1.0，[start, end) 为 tag 的范围
+    """
+    nodes = []
+
+    def plain(start: int, end: int):
+        for piece in text[start:end].split(','):
+            stripped = piece.strip()
+            if stripped:
+                position = text.index(stripped, start)
+                nodes.append((stripped, 1.0, False, position, position + len(stripped)))
+            start += len(piece) + 1
+
+    last_end = 0
+    for match in _SD_WEIGHTED.finditer(text):
+        plain(last_end, match.start())
+        nodes.append((match.group(1).strip(), float(match.group(2)), True, match.start(2), match.end(2)))
+        last_end = match.end()
+    plain(last_end, len(text))
+    return nodes
+
+
+class PromptBatch:
+    """
+    列式存储的一批提示词。变换方法原地修改 weights 并返回自身，可以链式调用。
+    由 SD 输入构建时，sources 为原提示词，weighted 标记原文中写成 (tag:weight) 的节点，
+    spans 为每个节点在原提示词中的 [start, end)（见 parse_sd_spans），
+    source_weights 为解析时的权重，用于判断哪些节点需要重新输出。
+    """
+    def __init__(self, tags: list, tag_ids: np.ndarray, weights: np.ndarray, offsets: np.ndarray,
+                 sources: list = None, weighted: np.ndarray = None, spans: np.ndarray = None):
+        self.tags = tags
+        self.tag_ids = tag_ids
+        self.weights = weights
+        self.offsets = offsets
+        self.sources = sources
+        self.weighted = weighted
+        self.spans = spans
+        self.source_weights = weights.copy() if sources is not None else None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_prompts(cls, prompts: Iterable[str], fmt: str = "sd") -> "PromptBatch":
+        """
+        解析提示词，fmt 为输入的格式 "sd" 或 "nai"
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的格式: {fmt}")
+        tags = []
+        tag_index = {}
+        tag_ids = array('i')
+        weights = array('d')
+        offsets = array('q', [0])
+        sources = [] if fmt == "sd" else None
+        weighted = array('b')
+        spans = array('q')
+        for prompt in prompts:
+            if fmt == "nai":
+                nodes, _ = parse_nai(prompt, restore_artist=True)
+            else:
+                sources.append(prompt)
+                nodes = []
+                for tag, weight, is_weighted, start, end in parse_sd_spans(prompt):
+                    nodes.append((tag, weight))
+                    weighted.append(is_weighted)
+                    spans.append(start)
+                    spans.append(end)
+            for tag, weight in nodes:
+                tag_id = tag_index.get(tag)
+                if tag_id is None:
+                    tag_id = tag_index[tag] = len(tags)
+                    tags.append(tag)
+                tag_ids.append(tag_id)
+                weights.append(weight)
+            offsets.append(len(weights))
+        return cls(
+            tags,
+            np.frombuffer(tag_ids, dtype=np.int32).copy(),
+            np.frombuffer(weights, dtype=np.float64).copy(),
+            np.frombuffer(offsets, dtype=np.int64).copy(),
+            sources,
+            np.frombuffer(weighted, dtype=np.int8).astype(bool) if sources is not None else None,
+            np.frombuffer(spans, dtype=np.int64).reshape(-1, 2).copy() if sources is not None else None,
+        )
+
+    def lengths(self) -> np.ndarray:
+        """
+        每条提示词的节点数
+        """
+        return np.diff(self.offsets)
+
+    def prompt_ids(self) -> np.ndarray:
+        """
+        每个节点所属提示词的序号
+        """
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    def mask(self, where: Union[str, np.ndarray] = "weighted") -> np.ndarray:
+        """
+        选择节点：
+          "all"       全部节点
+          "weighted"  权重不为 1 的节点（默认）
+          "positive"  权重大于 1 的节点
+          "negative"  权重小于 1 的节点
+        也可以直接传入与 weights 等长的布尔数组（例如 tags_mask 的结果）。
+        """
+        if not isinstance(where, str):
+            mask = np.asarray(where, dtype=bool)
+            if mask.shape != self.weights.shape:
+                raise ValueError("where 数组的长度必须与节点数相同")
+            return mask
+        deviation = self.weights - 1.0
+        if where == "all":
+            return np.ones(self.weights.shape, dtype=bool)
+        if where == "weighted":
+            return np.abs(deviation) >= 0.001
+        if where == "positive":
+            return deviation >= 0.001
+        if where == "negative":
+            return deviation <= -0.001
+        raise ValueError(f"where 必须是 {', '.join(_SELECTIONS)} 之一或布尔数组")
+
+    def tags_mask(self, tags: Iterable[str]) -> np.ndarray:
+        """
+        选择 tag 为 tags 之一的节点（精确匹配，比较时忽略括号前的反斜杠转义，
+        例如 "cat (animal)" 与 "cat \\(animal\\)" 视为同一个 tag）
+        """
+        wanted = {_SD_ESCAPED.sub(r'\1', tag) for tag in tags}
+        ids = [i for i, tag in enumerate(self.tags) if _SD_ESCAPED.sub(r'\1', tag) in wanted]
+        return np.isin(self.tag_ids, np.asarray(ids, dtype=np.int32))
+
+    def clip(self, minimum: float = None, maximum: float = None, where: Union[str, np.ndarray] = "all") -> "PromptBatch":
+        """
+        将权重限制在 [minimum, maximum] 之内
+        """
+        mask = self.mask(where)
+        self.weights[mask] = np.clip(self.weights[mask], minimum, maximum)
+        return self
+
+    def scale(self, factor: float, where: Union[str, np.ndarray] = "weighted") -> "PromptBatch":
+        """
+        权重乘以 factor
+        """
+        self.weights[self.mask(where)] *= factor
+        return self
+
+    def scale_emphasis(self, factor: float, where: Union[str, np.ndarray] = "weighted") -> "PromptBatch":
+        """
+        按 factor 放大或减弱强调程度：权重与 1 的差值乘以 factor
+        """
+        mask = self.mask(where)
+        self.weights[mask] = 1.0 + (self.weights[mask] - 1.0) * factor
+        return self
+
+    def normalize(self, max_deviation: float) -> "PromptBatch":
+        """
+        逐条提示词归一化：权重与 1 的最大差值超过 max_deviation 时，按比例缩小该提示词中所有权重与 1 的差值
+        """
+        lengths = self.lengths()
+        non_empty = lengths > 0
+        if not non_empty.any():
+            return self
+        deviation = self.weights - 1.0
+        peak = np.zeros(len(self))
+        peak[non_empty] = np.maximum.reduceat(np.abs(deviation), self.offsets[:-1][non_empty])
+        factors = np.ones(len(self))
+        over = peak > max_deviation
+        factors[over] = max_deviation / peak[over]
+        self.weights = 1.0 + deviation * np.repeat(factors, lengths)
+        return self
+
+    def quantize(self, step: float = None) -> "PromptBatch":
+        """
+        将权重与 1 的差值量化为 step 的整数倍（与输出 NAI 格式时换算括号层数的方式相同），
+        并保留 Config.WEIGHT_PRECISION 位小数。step 默认为调用时的 Config.WEIGHT_STEP
+        """
+        if step is None:
+            step = Config.WEIGHT_STEP
+        self.weights = np.round(1.0 + np.round((self.weights - 1.0) / step) * step, Config.WEIGHT_PRECISION)
+        return self
+
+    def apply(self, fn: Callable[[np.ndarray], np.ndarray], where: Union[str, np.ndarray] = "weighted") -> "PromptBatch":
+        """
+        对选中节点的权重数组执行任意向量化函数
+        """
+        mask = self.mask(where)
+        self.weights[mask] = fn(self.weights[mask])
+        return self
+
+    def nodes(self, index: int) -> list:
+        """
+        第 index 条提示词的 [(tag, weight), ...]
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return [(self.tags[tag_id], weight)
+                for tag_id, weight in zip(self.tag_ids[start:end].tolist(), self.weights[start:end].tolist())]
+
+    def to_prompts(self, fmt: str = "sd") -> list:
+        """
+        按 fmt（"sd" 或 "nai"）输出全部提示词
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的格式: {fmt}")
+        if self.sources is not None:
+            # SD 输入：输出 NAI 时直接用 sd_to_nai 转换改写后的 SD 原文
+            prompts = self._rewrite_sources()
+            return prompts if fmt == "sd" else [PromptConverter.sd_to_nai(prompt) for prompt in prompts]
+        tags = self.tags
+        tag_ids = self.tag_ids.tolist()
+        weights = self.weights.tolist()
+        offsets = self.offsets.tolist()
+        results = []
+        emit = emit_nai if fmt == "nai" else emit_sd
+        for start, end in zip(offsets, offsets[1:]):
+            results.append(emit([(tags[tag_id], weight) for tag_id, weight in zip(tag_ids[start:end], weights[start:end])]))
+        return results
+
+    def _rewrite_sources(self) -> list:
+        """
+        SD 输入输出为 SD：只替换权重有变化的节点，其余保持原文。
+        原文为 (tag:weight) 的节点只替换权重数字，普通 tag 改写为 (tag:weight) 并转义其中的括号
+        """
+        results = list(self.sources)
+        changed = np.flatnonzero(~np.isclose(self.weights, self.source_weights, rtol=0.0, atol=1e-9))
+        if not len(changed):
+            return results
+        prompt_ids = np.searchsorted(self.offsets, changed, side="right") - 1
+        label = _weight_table.label
+        tag_ids = self.tag_ids[changed].tolist()
+        weights = self.weights[changed].tolist()
+        weighted = self.weighted[changed].tolist()
+        spans = self.spans[changed].tolist()
+        # 同一提示词中的节点按位置从后向前替换，前面节点的位置不受影响
+        for i in reversed(range(len(changed))):
+            prompt_id = prompt_ids[i]
+            start, end = spans[i]
+            tag, weight = self.tags[tag_ids[i]], weights[i]
+            if weighted[i]:
+                text = label(weight)
+            elif abs(weight - 1.0) < 0.001:
+                continue
+            else:
+                escaped = _SD_UNESCAPED_PAREN.sub(r'\\\1', tag)
+                text = f"({escaped}:{label(weight)})"
+            source = results[prompt_id]
+            results[prompt_id] = source[:start] + text + source[end:]
+        return results